@@ -0,0 +1,136 @@
+"""On-disk cache of decoded and resampled audio.
+
+Decoding a compressed file (m4a...) or resampling a recording to another
+rate costs more than extracting its features.  DecodedCache keeps the
+result as a .npy file of (nframes, channels) samples that the next loads
+memory map, so a file is decoded and resampled at most once per rate.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class DecodedCache(object):
+    """Decoded audio stored as .npy files with a json description.
+
+    An entry is keyed by the path, size and modification time of the
+    audio file, the requested sampling rate (None for the native one) and
+    the dtype, so a modified file is decoded again (and the entries of its
+    previous versions are removed).  When the cache grows beyond max_size,
+    the least recently used entries are evicted.
+
+    Attributes
+    ----------
+    cache_dir : directory holding the decoded audio
+
+    max_size : maximum total size of the decoded audio (unit bytes)
+    """
+
+    def __init__(self, cache_dir='decoded_cache', **kwargs):
+        """The directory is created if needed."""
+        self.cache_dir = cache_dir
+        self.max_size = kwargs.get('max_size', 8*1024**3)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _paths(self, key):
+        """Return the paths of the samples and description of an entry."""
+        return (os.path.join(self.cache_dir, '{}.npy'.format(key)),
+                os.path.join(self.cache_dir, '{}.json'.format(key)))
+
+    def key(self, audio_file, sampling_rate, dtype):
+        """Return the name of the entry of the file at sampling_rate."""
+        audio_file = os.path.abspath(audio_file)
+        stat = os.stat(audio_file)
+        description = json.dumps([audio_file, stat.st_size, stat.st_mtime,
+                                  sampling_rate, np.dtype(dtype).name])
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def entries(self):
+        """Return dict key -> description of the complete entries."""
+        entries = {}
+        for iname in os.listdir(self.cache_dir):
+            if not iname.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, iname)) as info_file:
+                    entries[iname[:-len('.json')]] = json.load(info_file)
+            except (IOError, ValueError):
+                # removed or being written by another process
+                continue
+        return entries
+
+    def get(self, audio_file, sampling_rate, dtype):
+        """Return (audio, rate) memory mapped, None if not in the cache."""
+        audio_path, info_path = self._paths(
+            self.key(audio_file, sampling_rate, dtype))
+        if not os.path.exists(info_path):
+            return None
+        try:
+            with open(info_path) as info_file:
+                info = json.load(info_file)
+            audio = np.load(audio_path, mmap_mode='r')
+            # the modification time of the description is the last use
+            os.utime(info_path, None)
+        except (IOError, OSError, ValueError):
+            # removed behind our back
+            return None
+        return audio, info['sampling_rate']
+
+    def put(self, audio_file, sampling_rate, audio, rate):
+        """Store the (nframes, channels) audio at rate, return it mapped.
+
+        sampling_rate is the requested rate of the entry (None for the
+        native one).
+        """
+        key = self.key(audio_file, sampling_rate, audio.dtype)
+        audio_path, info_path = self._paths(key)
+        stat = os.stat(audio_file)
+        # the samples are complete once the description is written
+        np.save(audio_path, audio)
+        with open(info_path + '.tmp', 'w') as info_file:
+            json.dump({'audio_file': os.path.abspath(audio_file),
+                       'size': stat.st_size, 'mtime': stat.st_mtime,
+                       'sampling_rate': rate}, info_file)
+        os.rename(info_path + '.tmp', info_path)
+        self.evict(keep=key)
+        return np.load(audio_path, mmap_mode='r'), rate
+
+    def _remove(self, key):
+        """Remove one entry."""
+        for ipath in self._paths(key):
+            if os.path.exists(ipath):
+                os.remove(ipath)
+
+    def evict(self, keep=None):
+        """Remove the stale entries, then the least recently used ones
+        until the size is at most max_size (the keep entry stays)."""
+        entries = self.entries()
+        used = []
+        for key, info in entries.items():
+            audio_path, info_path = self._paths(key)
+            try:
+                stat = os.stat(info['audio_file'])
+                stale = (stat.st_size != info.get('size') or
+                         stat.st_mtime != info.get('mtime'))
+            except OSError:
+                stale = True
+            if stale and key != keep:
+                self._remove(key)
+            elif os.path.exists(audio_path):
+                used.append((os.path.getmtime(info_path), key,
+                             os.path.getsize(audio_path)))
+        total_size = sum(isize for _, _, isize in used)
+        for _, key, isize in sorted(used):
+            if total_size <= self.max_size:
+                break
+            if key != keep:
+                self._remove(key)
+                total_size -= isize
+
+    def clear(self):
+        """Remove every entry."""
+        for iname in os.listdir(self.cache_dir):
+            if iname.endswith(('.npy', '.json')):
+                os.remove(os.path.join(self.cache_dir, iname))
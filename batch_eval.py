@@ -0,0 +1,332 @@
+"""Resumable batch extraction of the features of many recordings.
+
+The files come from a manifest (a space separated file in the
+datainfo.csv format, with at least a path column and optionally
+goodrange, player and date) or from a directory searched for audio
+files.  They are processed by a bounded pool of worker processes (see
+corpus.iter_features) and the features are written to the output
+directory as they come, one feature store part (see
+feature_store.FeatureStore.save) every --checkpoint files.  The list of
+the files done is saved with each part, so running the same command
+again after a crash or an interruption only processes the missing files.
+
+Example:
+    python batch_eval.py datainfo.csv --output batch_features \\
+        --fake-offset 0.5 --processes 4
+    python batch_eval.py /data/alto_recordings --output alto_features
+"""
+from __future__ import division
+import argparse
+import json
+import os
+import sys
+import time
+
+# This project
+import audio_cache
+import corpus
+import feature_cache
+import feature_store
+import features
+import session_catalog
+
+AUDIO_EXTENSIONS = ('.wav', '.m4a', '.mp3', '.flac', '.ogg')
+PROGRESS_NAME = 'progress.json'
+METADATA_NAMES = ('file', 'player', 'date')
+
+
+def manifest_sessions(manifest, default_goodrange=None):
+    """Return the list of session dicts (path, goodrange, player, date).
+
+    Parameters
+    ----------
+    manifest : catalog file (see session_catalog) or directory searched
+        recursively for audio files
+
+    default_goodrange : good range of the files without one
+
+    Raises IOError if manifest is neither a directory nor a file.
+    """
+    if not os.path.exists(manifest):
+        raise IOError('No manifest file or directory {}'.format(manifest))
+    if os.path.isdir(manifest):
+        sessions = []
+        for root, dirs, files in os.walk(manifest):
+            dirs.sort()
+            for iname in sorted(files):
+                if iname.lower().endswith(AUDIO_EXTENSIONS):
+                    sessions.append({'path': os.path.join(root, iname)})
+    else:
+        sessions = session_catalog.SessionCatalog(manifest).sessions
+    for isession in sessions:
+        if isession.get('goodrange') is None:
+            isession['goodrange'] = default_goodrange
+    return sessions
+
+
+def batch_settings(**kwargs):
+    """Return the extraction settings identifying a batch output."""
+    settings = corpus.feature_params(None, **kwargs)
+    del settings['good_range']
+    return settings
+
+
+class BatchProgress(object):
+    """Checkpoint of a batch run, saved in the output directory.
+
+    Attributes
+    ----------
+    output : directory of the parts and of the progress file
+
+    settings : extraction settings of the run (a resumed run must use
+        the same)
+
+    done : dict path -> name of the part holding its features
+
+    failed : dict path -> error message
+
+    goodranges : dict path -> good range the file was processed with
+        (as a json list), a file whose good range changed is processed
+        again
+
+    parts : names of the saved parts, in order
+    """
+
+    def __init__(self, output, settings):
+        """Load the progress of a previous run with the same settings."""
+        self.output = output
+        self.settings = settings
+        self.done = {}
+        self.failed = {}
+        self.goodranges = {}
+        self.parts = []
+        self.path = os.path.join(output, PROGRESS_NAME)
+        if os.path.exists(self.path):
+            with open(self.path) as progress_file:
+                progress = json.load(progress_file)
+            if progress['settings'] != json.loads(json.dumps(settings)):
+                raise ValueError(
+                    '{} was produced with other settings {}, use another '
+                    'output directory'.format(output, progress['settings']))
+            self.done = progress['done']
+            self.failed = progress['failed']
+            self.goodranges = progress.get('goodranges', {})
+            self.parts = progress['parts']
+        elif not os.path.isdir(output):
+            os.makedirs(output)
+
+    def save(self):
+        """Write the progress file atomically."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as progress_file:
+            json.dump({'settings': self.settings, 'done': self.done,
+                       'failed': self.failed, 'parts': self.parts,
+                       'goodranges': self.goodranges,
+                       'updated': time.time()}, progress_file, indent=1)
+        os.rename(tmp_path, self.path)
+
+    def same_goodrange(self, session):
+        """True if the session was processed with its current good range.
+
+        The files of a progress file without good ranges are assumed
+        unchanged.
+        """
+        if session['path'] not in self.goodranges:
+            return True
+        goodrange = json.loads(json.dumps(session['goodrange']))
+        return self.goodranges[session['path']] == goodrange
+
+    def add_part(self, store, paths, failed, goodranges):
+        """Save the store of the files in paths as a new part.
+
+        goodranges is the dict path -> good range of the files in paths
+        and failed.
+        """
+        if len(store):
+            name = 'part_{:05d}'.format(len(self.parts))
+            store.save(os.path.join(self.output, name))
+            self.parts.append(name)
+        else:
+            name = None
+        for ipath in paths:
+            self.done[ipath] = name
+            self.failed.pop(ipath, None)
+        for ipath in failed:
+            self.done.pop(ipath, None)
+        self.failed.update(failed)
+        self.goodranges.update(json.loads(json.dumps(goodranges)))
+        self.save()
+
+
+def load_results(output):
+    """Return one FeatureStore with all the parts of a batch output.
+
+    The features of a file processed again (its good range changed) are
+    only taken from its last part.  None is returned if no features were
+    saved.
+    """
+    with open(os.path.join(output, PROGRESS_NAME)) as progress_file:
+        progress = json.load(progress_file)
+    store = None
+    for iname in progress['parts']:
+        part = feature_store.FeatureStore.load(os.path.join(output, iname))
+        if store is None:
+            store = feature_store.FeatureStore(
+                part.feature_names, metadata_names=part.metadata_names,
+                dtype=part.dtype, capacity=len(part))
+        metadata = dict((imeta, part.metadata(imeta))
+                        for imeta in part.metadata_names)
+        runs = sorted(irun for iruns in part.group_rows('file').values()
+                      for irun in iruns)
+        for istart, istop in runs:
+            if progress['done'].get(metadata['file'][istart]) != iname:
+                # superseded by a later part
+                continue
+            rows = slice(istart, istop)
+            feature_dic = part.feature_dic(rows)
+            feature_dic['onset_samples'] = part.onsets[rows]
+            store.append(feature_dic, **dict(
+                (imeta, ivalues[istart])
+                for imeta, ivalues in metadata.items()))
+    return store
+
+
+def run_batch(sessions, output, **kwargs):
+    """Process the sessions not done yet, return the BatchProgress.
+
+    Parameters
+    ----------
+    sessions : list of dict with path, goodrange and (optionally) player
+        and date
+
+    output : output directory
+
+    checkpoint : number of files per saved part
+
+    retry_failed : if True, the files that failed in a previous run are
+        processed again (they are skipped by default)
+
+    processes, cache, fake_stroke_onset, feature_names... : see
+        corpus.iter_features
+    """
+    checkpoint = kwargs.pop('checkpoint', 20)
+    retry_failed = kwargs.pop('retry_failed', False)
+    feature_names = tuple(kwargs.get('feature_names',
+                                     features.FEATURE_NAMES))
+    features.check_feature_names(feature_names)
+    progress = BatchProgress(output, batch_settings(**kwargs))
+    todo = [isession for isession in sessions
+            if not progress.same_goodrange(isession) or
+            (isession['path'] not in progress.done and
+             (retry_failed or isession['path'] not in progress.failed))]
+    sys.stderr.write('{} files already processed, {} to process\n'.format(
+        len(sessions) - len(todo), len(todo)))
+    if not todo:
+        return progress
+
+    kwargs['skip_errors'] = True
+    results = corpus.iter_features([isession['path'] for isession in todo],
+                                   [isession['goodrange']
+                                    for isession in todo], **kwargs)
+    dtype = kwargs.get('dtype', None)
+    store = feature_store.FeatureStore(feature_names,
+                                       metadata_names=METADATA_NAMES,
+                                       dtype=dtype)
+    paths, failed, goodranges = [], {}, {}
+    try:
+        for isession, (ipath, ifeature_dic) in zip(todo, results):
+            if isinstance(ifeature_dic, Exception):
+                sys.stderr.write('failed {}\n'.format(ipath))
+                failed[ipath] = str(ifeature_dic)
+            else:
+                store.append(ifeature_dic, file=ipath,
+                             player=isession.get('player'),
+                             date=isession.get('date'))
+                paths.append(ipath)
+            goodranges[ipath] = isession['goodrange']
+            if len(paths) + len(failed) >= checkpoint:
+                progress.add_part(store, paths, failed, goodranges)
+                store = feature_store.FeatureStore(
+                    feature_names, metadata_names=METADATA_NAMES,
+                    dtype=dtype)
+                paths, failed, goodranges = [], {}, {}
+    finally:
+        # the files completed before an interruption are kept
+        results.close()
+        if paths or failed:
+            progress.add_part(store, paths, failed, goodranges)
+    return progress
+
+
+def main():
+    """Run the batch described on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('manifest',
+                        help='catalog file (datainfo.csv format) or '
+                             'directory of audio files')
+    parser.add_argument('--output', required=True,
+                        help='directory of the results and checkpoints')
+    parser.add_argument('--goodrange', default=None,
+                        help='good range of the files without one '
+                             '(start-stop)')
+    parser.add_argument('--fake-offset', type=float, default=False,
+                        help='use regular windows of this width (s) '
+                             'instead of the detected strokes')
+    parser.add_argument('--fake-hop', type=float, default=None,
+                        help='distance (s) between the regular windows '
+                             '(default: their width, shorter to overlap)')
+    parser.add_argument('--stroke-length', type=float, default=None,
+                        help='stroke length (s)')
+    parser.add_argument('--features', nargs='+', default=None,
+                        help='features to compute (default: all)')
+    parser.add_argument('--sampling-rate', type=int, default=None,
+                        help='analysis rate (default: the rate of each '
+                             'file)')
+    parser.add_argument('--decoded-cache', default='',
+                        help='directory of the decoded/resampled audio '
+                             '(default: decode every time)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: all the cpus)')
+    parser.add_argument('--checkpoint', type=int, default=20,
+                        help='files per saved part')
+    parser.add_argument('--cache-dir', default='',
+                        help='feature cache directory (default: no cache)')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='process again the files that failed')
+    args = parser.parse_args()
+
+    try:
+        sessions = manifest_sessions(
+            args.manifest, session_catalog.parse_goodrange(args.goodrange))
+    except IOError as error:
+        parser.error(str(error))
+    kwargs = {'processes': args.processes,
+              'checkpoint': args.checkpoint,
+              'retry_failed': args.retry_failed,
+              'fake_stroke_onset': args.fake_offset,
+              'fake_stroke_hop': args.fake_hop}
+    if args.stroke_length is not None:
+        kwargs['stroke_length'] = args.stroke_length
+    if args.features is not None:
+        kwargs['feature_names'] = tuple(args.features)
+    if args.sampling_rate is not None:
+        kwargs['sampling_rate'] = args.sampling_rate
+    if args.cache_dir:
+        kwargs['cache'] = feature_cache.FeatureCache(args.cache_dir)
+    if args.decoded_cache:
+        kwargs['decoded_cache'] = audio_cache.DecodedCache(args.decoded_cache)
+
+    try:
+        progress = run_batch(sessions, args.output, **kwargs)
+    except ValueError as error:
+        sys.stderr.write('{}\n'.format(error))
+        return 2
+    except KeyboardInterrupt:
+        sys.stderr.write('interrupted, run again to resume\n')
+        return 1
+    sys.stderr.write('{} files done, {} failed, results in {}\n'.format(
+        len(progress.done), len(progress.failed), args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Benchmark of the load -> clip -> onset -> feature pipeline.
+
+Synthetic bowed-stroke recordings are generated (no recorded file is
+needed), each stage of stroke_cleaning.audio_sample is timed and the
+multi-file path of check_signal is run with different pool sizes.  One
+json record per stage is written, with the throughput (audio seconds per
+wall second) and the peak memory.
+
+Example:
+    python benchmark.py --durations 30 300 --densities 1 2 --files 8 \\
+        --output bench.jsonl --baseline previous_bench.jsonl
+"""
+from __future__ import division
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import wave
+import numpy as np
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def synthetic_strokes(duration, stroke_density, sampling_rate=44100, seed=0):
+    """Return a synthetic recording of bowed strokes.
+
+    Parameters
+    ----------
+    duration : length of the played part (unit seconds), a quiet margin of
+        one second is added on both sides
+
+    stroke_density : number of strokes per second
+
+    The strokes are harmonic tones (random pitch) with an attack, a
+    sustain and a release, on top of a low background noise.
+    """
+    rng = np.random.RandomState(seed)
+    margin = sampling_rate
+    audio = rng.normal(0, 0.002, int(duration*sampling_rate) + 2*margin)
+    nstrokes = max(1, int(duration*stroke_density))
+    stroke_sz = int(0.8*sampling_rate/stroke_density)
+    time_axis = np.arange(stroke_sz)/sampling_rate
+    envelope = np.minimum(1, np.minimum(time_axis/0.05,
+                                        (time_axis[-1] - time_axis)/0.1))
+    for istroke in range(nstrokes):
+        pitch = rng.uniform(200, 800)
+        tone = sum(np.sin(2*np.pi*pitch*iharmonic*time_axis)/iharmonic
+                   for iharmonic in range(1, 6))
+        start = margin + int(istroke*sampling_rate/stroke_density)
+        audio[start:start + stroke_sz] += 0.3*envelope*tone
+    return np.clip(audio, -1, 1)
+
+
+def write_wav(fname, audio, sampling_rate=44100):
+    """Save audio as a 16-bit PCM wave file."""
+    wf = wave.open(fname, 'wb')
+    wf.setnchannels(1)
+    wf.setsampwidth(2)
+    wf.setframerate(sampling_rate)
+    wf.writeframes((audio*(2**15 - 1)).astype('<i2').tobytes())
+    wf.close()
+
+
+def peak_rss():
+    """Return the peak resident memory of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak*1024
+
+
+class StageTimer(object):
+    """Time the stages of a benchmark case and collect the records."""
+
+    def __init__(self, audio_seconds, **info):
+        """info is copied in every record."""
+        self.audio_seconds = audio_seconds
+        self.info = info
+        self.records = []
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def run(self, stage, func, *args, **kwargs):
+        """Run func, record its duration and memory peak, return its value."""
+        traced_peak = None
+        if tracemalloc is not None:
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            start_traced = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        result = func(*args, **kwargs)
+        seconds = time.time() - start
+        if tracemalloc is not None:
+            traced_peak = tracemalloc.get_traced_memory()[1] - start_traced
+        record = dict(self.info)
+        record.update({'stage': stage,
+                       'seconds': seconds,
+                       'audio_seconds': self.audio_seconds,
+                       'throughput': self.audio_seconds/max(seconds, 1e-9),
+                       'peak_traced_bytes': traced_peak,
+                       'peak_rss_bytes': peak_rss()})
+        self.records.append(record)
+        return result
+
+
+def bench_single_file(case):
+    """Return the stage records of one audio_sample run (child process)."""
+    import stroke_cleaning
+    fname, duration, stroke_density, fake_stroke_onset = case
+    timer = StageTimer(duration + 2, benchmark='single_file',
+                       duration=duration, stroke_density=stroke_density,
+                       fake_stroke_onset=fake_stroke_onset)
+    audio = timer.run('load', stroke_cleaning.audio_sample, fname,
+                      clip_start=False, clip_end=False)
+    audio.clip_start = audio.clip_end = True
+    timer.run('clip', audio.clip_audio)
+    if fake_stroke_onset:
+        # the regular onsets come with their strokes (strided view)
+        timer.run('fake_onsets_and_strokes', audio.set_fake_regular_offsets,
+                  fake_stroke_onset)
+    else:
+        timer.run('find_onsets', audio.find_onsets)
+        timer.run('isolate_strokes', audio.isolate_strokes)
+    timer.run('get_features', audio.get_features)
+    return timer.records
+
+
+def bench_multi_file(case):
+    """Return the record of a check_signal multi-file run (child process)."""
+    import check_signal
+    fnames, duration, stroke_density, processes = case
+    timer = StageTimer(len(fnames)*(duration + 2), benchmark='multi_file',
+                       duration=duration, stroke_density=stroke_density,
+                       nfiles=len(fnames), processes=processes)
+    timer.run('get_features_from_path_list',
+              check_signal.get_features_from_path_list,
+              fnames, [None]*len(fnames), processes=processes)
+    return timer.records
+
+
+def _isolated_target(func, case, results):
+    """Child process target of run_isolated."""
+    try:
+        results.put((True, func(case)))
+    except Exception:
+        results.put((False, traceback.format_exc()))
+
+
+def run_isolated(func, case):
+    """Run func(case) in a fresh process so that peak memory is its own."""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_isolated_target,
+                                      args=(func, case, results))
+    process.start()
+    success, records = results.get()
+    process.join()
+    if not success:
+        raise RuntimeError('benchmark case failed:\n{}'.format(records))
+    return records
+
+
+def record_key(record):
+    """Return what identifies a record when comparing to a baseline."""
+    return tuple((key, record.get(key)) for key in (
+        'benchmark', 'stage', 'duration', 'stroke_density',
+        'fake_stroke_onset', 'nfiles', 'processes'))
+
+
+def compare(records, baseline_records, tolerance):
+    """Return the records whose throughput dropped more than tolerance."""
+    baseline = dict((record_key(record), record)
+                    for record in baseline_records)
+    regressions = []
+    for record in records:
+        old = baseline.get(record_key(record))
+        if old is None:
+            continue
+        if record['throughput'] < (1 - tolerance)*old['throughput']:
+            regressions.append((record, old))
+    return regressions
+
+
+def main():
+    """Run the benchmark cases given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--durations', type=float, nargs='+',
+                        default=[30, 120], help='recording lengths (s)')
+    parser.add_argument('--densities', type=float, nargs='+', default=[1],
+                        help='strokes per second')
+    parser.add_argument('--fake-offset', type=float, default=0,
+                        help='use regular windows of this width (s) '
+                             'instead of onset detection')
+    parser.add_argument('--files', type=int, default=4,
+                        help='number of files of the multi-file runs '
+                             '(0 to skip them)')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4],
+                        help='pool sizes of the multi-file runs')
+    parser.add_argument('--output', default=None,
+                        help='json lines output (default stdout)')
+    parser.add_argument('--baseline', default=None,
+                        help='previous output to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative throughput drop')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='soundeval_bench_')
+    records = []
+    try:
+        for duration in args.durations:
+            for density in args.densities:
+                audio = synthetic_strokes(duration, density)
+                fnames = []
+                for ifile in range(max(1, args.files)):
+                    fname = os.path.join(
+                        tmp_dir,
+                        'bench_{}_{}_{}.wav'.format(duration, density, ifile))
+                    write_wav(fname, audio)
+                    fnames.append(fname)
+                records.extend(run_isolated(
+                    bench_single_file,
+                    (fnames[0], duration, density, args.fake_offset)))
+                if args.files:
+                    for processes in args.processes:
+                        records.extend(run_isolated(
+                            bench_multi_file,
+                            (fnames, duration, density, processes)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    output = sys.stdout
+    if args.output is not None:
+        output = open(args.output, 'w')
+    for record in records:
+        output.write(json.dumps(record, sort_keys=True) + '\n')
+    if output is not sys.stdout:
+        output.close()
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline_records = [json.loads(line) for line in baseline_file
+                                if line.strip()]
+        regressions = compare(records, baseline_records, args.tolerance)
+        for record, old in regressions:
+            sys.stderr.write('regression {} {}: {:.1f} -> {:.1f} audio s/s\n'
+                             .format(record['benchmark'], record['stage'],
+                                     old['throughput'],
+                                     record['throughput']))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
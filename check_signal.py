@@ -1,22 +1,34 @@
 import os
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.style.use('ggplot')
 import itertools
-import pandas as pd
-import numpy as np
-from datetime import datetime
 
 # This project
 import stroke_cleaning
+import corpus
+import feature_cache
+import session_catalog
 
 colors = itertools.cycle(["r", "b", "g", "k", "c", "m", "y"])
 
 
+def pyplot():
+    """Return matplotlib.pyplot, imported (and styled) on first use.
+
+    matplotlib is not imported with this module, so that the feature
+    functions can be used without it.
+    """
+    import matplotlib
+    import matplotlib.pyplot as plt
+    if not getattr(pyplot, 'styled', False):
+        matplotlib.style.use('ggplot')
+        pyplot.styled = True
+    return plt
+
+
 #def plot_features_from_audio(audio, featuresXY=('zrc', 'centroid')):
 def plot_features_from_audio(audio, featuresXY=('cm0', 'sm0')):
     """Plot the features from the audio sample object"""
-    feature_dic = audio.get_features()
+    plt = pyplot()
+    feature_dic = audio.get_features(featuresXY)
     features = feature_dic['feature_table']
     xfeat, yfeat = featuresXY
     # Index of features
@@ -34,6 +46,7 @@ def plot_features_from_audio(audio, featuresXY=('cm0', 'sm0')):
 
 def plot_features_from_list(audio_list, label_list=None, good_range_list=None, **kwargs):
     """Plot features for audio signal in the given list."""
+    plt = pyplot()
     if good_range_list is None:
         good_range_list = [None]*len(audio_list)
     if label_list is None:
@@ -55,7 +68,8 @@ def plot_features_from_list(audio_list, label_list=None, good_range_list=None, *
             iaudio.isolate_strokes()
 
         # Features
-        ifeature_dic = iaudio.get_features()
+        # Only the plotted features are computed
+        ifeature_dic = iaudio.get_features(featuresXY)
         ifeatures = ifeature_dic['feature_table']
         print('features shape: {}'.format(ifeatures.shape))
         del(iaudio)
@@ -75,50 +89,51 @@ def plot_features_from_list(audio_list, label_list=None, good_range_list=None, *
 
 def show_features_from_list(audio_list, label_list=None, good_range_list=None, **kwargs):
     """Plot features for audio signal in the given list."""
+    plt = pyplot()
     fig = plt.figure()
     plot_features_from_list(audio_list, label_list, good_range_list, **kwargs)
     fig.show()
     raw_input('press enter when finished...')
 
 def get_features_from_path_list(path_list, goodrange_list, **kwargs):
-    """Return feature dict from path list"""
-    fake_stroke_onset = kwargs.get('fake_stroke_onset', False)
-    feature_dic = {}
-    for iaudiofile, igood_range in zip(path_list, goodrange_list):
-        iaudio = stroke_cleaning.audio_sample(iaudiofile, igood_range)
+    """Return feature dict from path list
 
-        # Strokes are either searched or just regular samples
-        if fake_stroke_onset is not False:
-            print('Using fake stroke')
-            iaudio.set_fake_regular_offsets(fake_stroke_onset)
-        else:
-            iaudio.isolate_strokes()
-        ifeature_dic = iaudio.get_features()
-        if not feature_dic.has_key('feature_names'):
-            feature_dic.update(ifeature_dic)
-        else:
-            feature_dic['feature_table'] =\
-                np.vstack((feature_dic['feature_table'],
-                          ifeature_dic['feature_table']))
-    return feature_dic
+    See corpus.get_feature_store for the keyword arguments.
+    """
+    store = corpus.get_feature_store(path_list, goodrange_list, **kwargs)
+    if store is None:
+        return {}
+    return store.feature_dic()
 
 
 def show_grouped_features(group_dict, **kwargs):
     """Plot the features from the group"""
+    plt = pyplot()
     featuresXY = kwargs.get('featuresXY', ('zrc', 'centroid'))
     xfeat, yfeat = featuresXY
 
-    fig = plt.figure()
+    # All the files are processed at once, one group after the other
+    path_list = []
+    goodrange_list = []
+    metadata_list = []
     for igroup in group_dict.keys():
-        ifeature_dic =\
-            get_features_from_path_list(group_dict[igroup]['paths'],
-                                        group_dict[igroup]['goodranges'])
-        ifeatures = ifeature_dic['feature_table']
-        print('features shape: {}'.format(ifeatures.shape))
+        path_list.extend(group_dict[igroup]['paths'])
+        goodrange_list.extend(group_dict[igroup]['goodranges'])
+        metadata_list.extend(
+            [{'group': igroup}]*len(group_dict[igroup]['paths']))
+    store = corpus.get_feature_store(path_list, goodrange_list,
+                                     metadata_list,
+                                     metadata_names=('file', 'group'),
+                                     processes=kwargs.get('processes', None),
+                                     cache=kwargs.get('cache', None),
+                                     feature_names=featuresXY)
 
-        # Index of features
-        xidx = ifeature_dic['feature_names'].index(xfeat)
-        yidx = ifeature_dic['feature_names'].index(yfeat)
+    fig = plt.figure()
+    # Index of features
+    xidx = store.feature_names.index(xfeat)
+    yidx = store.feature_names.index(yfeat)
+    for igroup, ifeatures in store.group_tables('group').items():
+        print('features shape: {}'.format(ifeatures.shape))
 
         # Plot
         plt.scatter(ifeatures[:, xidx], ifeatures[:, yidx],
@@ -143,21 +158,28 @@ def show_features_from_dic(audio_dic, **kwargs):
     show_features_from_list(recording_list, label_list, good_range_list, **kwargs)
 
 def show_players_features(**kwargs):
-    """Plot the features grouped by file selection"""
-    df_data = pd.read_csv('datainfo.csv', sep=' ', na_values='None')
-    print(df_data.head())
-    grouping_dict = {}
-    for iplayer in df_data.player.unique():
-        ipathlist = df_data[df_data.player==iplayer]['path'].tolist()
-        igoodrangelist = df_data[df_data.player==iplayer]['goodrange'].tolist()
-        grouping_dict[iplayer] = {'paths': ipathlist,
-                                  'goodranges': igoodrangelist}
-    show_grouped_features(grouping_dict, **kwargs)
+    """Plot the features grouped by file selection
+
+    Features are read from the feature cache (cache keyword,
+    feature_cache.FeatureCache() by default) when available.  The files
+    come from the catalog keyword (session_catalog.load_catalog() by
+    default).
+    """
+    if 'cache' not in kwargs:
+        kwargs['cache'] = feature_cache.FeatureCache()
+    catalog = kwargs.pop('catalog', None)
+    if catalog is None:
+        catalog = session_catalog.load_catalog()
+    print('{} sessions in the catalog'.format(len(catalog)))
+    show_grouped_features(catalog.group_by('player'), **kwargs)
 
 def audio_report(fname):
     """Plot summary of the given audio file."""
+    plt = pyplot()
     audio = stroke_cleaning.audio_sample(fname)
+    # also isolates the strokes
     audio.set_fake_regular_offsets(1)
+    print('Stroke quality: {}'.format(audio.quality_report()))
     fig_sig = plt.figure()
     audio.plot_signal(x_axis_type='sample')
     fig_sig.show()
@@ -170,8 +192,11 @@ def audio_report(fname):
 
 def show_multiaudio(fnames, good_ranges = None, **kwargs):
     """Show summary of all the audio files in the given list."""
+    plt = pyplot()
     featuresXY = kwargs.get('featuresXY',('zrc', 'centroid'))
     xfeat, yfeat = featuresXY
+    cache = kwargs.get('cache', None)
+    fake_stroke_onset = 0.5
 
     if good_ranges is None:
         good_ranges = [None]*len(fnames)
@@ -179,19 +204,27 @@ def show_multiaudio(fnames, good_ranges = None, **kwargs):
     fig_raw = plt.figure(2)
 
     for idx, (iaudiofile, igood_range) in enumerate(zip(fnames, good_ranges)):
-        print(igood_range)
-        try:
-            igood_range = igood_range.split('-')
-            igood_range = (int(igood_range[0]), int(igood_range[1]))
-        except AttributeError:
-            igood_range = None
+        igood_range = session_catalog.parse_goodrange(igood_range)
         print(igood_range)
         iaudio = stroke_cleaning.audio_sample(iaudiofile, igood_range)
         ilabel = os.path.basename(iaudiofile)
-        iaudio.set_fake_regular_offsets(0.5)
+        iaudio.set_fake_regular_offsets(fake_stroke_onset)
 
         # Features
-        ifeature_dic = iaudio.get_features()
+        ifeature_dic = None
+        feature_names = featuresXY
+        if cache is not None:
+            # the entry holds all the features, for any other pair
+            feature_names = corpus.cached_feature_names(featuresXY)
+            iparams = corpus.feature_params(
+                igood_range, fake_stroke_onset=fake_stroke_onset,
+                feature_names=feature_names)
+            ifeature_dic = cache.get(iaudiofile, iparams)
+        if ifeature_dic is None:
+            ifeature_dic = iaudio.get_features(feature_names)
+            if cache is not None:
+                cache.put(iaudiofile, iparams, ifeature_dic)
+        ifeature_dic = corpus.select_features(ifeature_dic, featuresXY)
         # Index of features
         xidx = ifeature_dic['feature_names'].index(xfeat)
         yidx = ifeature_dic['feature_names'].index(yfeat)
@@ -210,6 +243,8 @@ def show_multiaudio(fnames, good_ranges = None, **kwargs):
         plt.xlabel(xfeat)
         plt.ylabel(yfeat)
         plt.legend(loc='best')
+    if cache is not None:
+        cache.save_index()
 
     fig_feat.show()
     fig_raw.show()
@@ -219,13 +254,14 @@ def show_multiaudio(fnames, good_ranges = None, **kwargs):
 def show_day(daystr, **kwargs):
     """Show summary of all the audiofile from a given day."""
     featuresXY = kwargs.get('featuresXY', ('zrc', 'centroid'))
+    cache = kwargs.get('cache', feature_cache.FeatureCache())
+    catalog = kwargs.get('catalog', None)
+    if catalog is None:
+        catalog = session_catalog.load_catalog()
 
-    df_data = pd.read_csv('datainfo.csv', sep=' ', na_values='None',
-                          dtype={'date': datetime})
-    fnames = df_data[df_data.date == daystr].path.tolist()
-    good_ranges = df_data[df_data.date == daystr].goodrange.tolist()
+    fnames, good_ranges = catalog.paths_and_goodranges(date=daystr)
 
-    show_multiaudio(fnames, good_ranges, featuresXY=featuresXY)
+    show_multiaudio(fnames, good_ranges, featuresXY=featuresXY, cache=cache)
 
 if __name__ == '__main__':
     #recording_list = (
@@ -0,0 +1,229 @@
+"""Incremental clustering and classification of the stroke features.
+
+The models are updated with partial_fit, one mini-batch at a time, so
+new sessions are learned without going through the whole corpus again:
+a StandardScaler normalizes the feature_names columns and either a
+MiniBatchKMeans (clusters of strokes) or an SGDClassifier (labels, e.g.
+the player) is fitted on the scaled features.  The model state is saved
+with pickle.
+"""
+import os
+import pickle
+import numpy as np
+
+MODEL_KINDS = ('cluster', 'classifier')
+
+
+class IncrementalModel(object):
+    """Scaler and model of the strokes, fitted incrementally.
+
+    Attributes
+    ----------
+    feature_names : names of the feature columns the model uses, in order
+
+    kind : 'cluster' (MiniBatchKMeans) or 'classifier' (SGDClassifier)
+
+    batch_size : number of strokes per partial_fit and predict call
+
+    sessions : set of the sessions (e.g. audio files) already learned
+
+    n_samples_seen : number of strokes learned
+    """
+
+    def __init__(self, feature_names, **kwargs):
+        """Create an untrained model.
+
+        Parameters
+        ----------
+        feature_names : feature columns of the model
+
+        kind : 'cluster' (default) or 'classifier'
+
+        n_clusters : number of clusters of the 'cluster' kind (default 2)
+
+        classes : all the labels of the 'classifier' kind (needed from the
+            first batch by SGDClassifier.partial_fit)
+
+        batch_size : strokes per mini-batch (default 1024)
+
+        random_state : seed of the model
+        """
+        self.feature_names = tuple(feature_names)
+        self.kind = kwargs.get('kind', 'cluster')
+        if self.kind not in MODEL_KINDS:
+            raise ValueError('Unknown model kind {}, should be one of {}'
+                             .format(self.kind, MODEL_KINDS))
+        self.batch_size = kwargs.get('batch_size', 1024)
+        random_state = kwargs.get('random_state', None)
+        # sklearn is only loaded when a model is created (or unpickled)
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler()
+        if self.kind == 'cluster':
+            self.n_clusters = kwargs.get('n_clusters', 2)
+            self.model = MiniBatchKMeans(n_clusters=self.n_clusters,
+                                         random_state=random_state)
+            self.classes = None
+        else:
+            self.classes = kwargs.get('classes', None)
+            if self.classes is None:
+                raise ValueError('classes are needed by the classifier')
+            self.classes = np.asarray(self.classes)
+            self.model = SGDClassifier(random_state=random_state)
+        self.sessions = set()
+        self.n_samples_seen = 0
+        # strokes kept until there are enough to start the clustering
+        self._pending = None
+
+    @property
+    def is_fitted(self):
+        return self.n_samples_seen > 0 and self._pending is None
+
+    def _columns(self, feature_table, feature_names=None):
+        """Return the model columns of the table (reordered if needed)."""
+        feature_table = np.asarray(feature_table, dtype=np.float64)
+        if feature_names is None:
+            feature_names = self.feature_names
+        feature_names = tuple(feature_names)
+        if feature_names != self.feature_names:
+            columns = [feature_names.index(iname)
+                       for iname in self.feature_names]
+            feature_table = feature_table[:, columns]
+        return feature_table
+
+    def partial_fit(self, feature_table, labels=None, feature_names=None):
+        """Update the scaler and the model with more strokes.
+
+        Parameters
+        ----------
+        feature_table : (n_strokes, n_features) array
+
+        labels : label of each stroke (classifier kind only)
+
+        feature_names : columns of feature_table, if they are not the
+            model feature_names
+        """
+        feature_table = self._columns(feature_table, feature_names)
+        if self.kind == 'classifier':
+            if labels is None:
+                raise ValueError('labels are needed by the classifier')
+            labels = np.asarray(labels)
+        for start in range(0, len(feature_table), self.batch_size):
+            batch = feature_table[start:start + self.batch_size]
+            if self.kind == 'cluster':
+                self._partial_fit_clusters(batch)
+            else:
+                self._partial_fit_classifier(
+                    batch, labels[start:start + self.batch_size])
+        return self
+
+    def _partial_fit_clusters(self, batch):
+        """Fit a batch, waiting for n_clusters strokes before the first."""
+        self.scaler.partial_fit(batch)
+        self.n_samples_seen += len(batch)
+        if self._pending is not None:
+            batch = np.vstack((self._pending, batch))
+            self._pending = None
+        if (not hasattr(self.model, 'cluster_centers_') and
+                len(batch) < self.n_clusters):
+            self._pending = batch
+            return
+        self.model.partial_fit(self.scaler.transform(batch))
+
+    def _partial_fit_classifier(self, batch, labels):
+        """Fit a labelled batch."""
+        self.scaler.partial_fit(batch)
+        self.n_samples_seen += len(batch)
+        self.model.partial_fit(self.scaler.transform(batch), labels,
+                               classes=self.classes)
+
+    def partial_fit_store(self, store, rows=None, label_name=None):
+        """Learn the rows of a feature_store.FeatureStore.
+
+        Parameters
+        ----------
+        rows : slice of the rows to learn (all by default), e.g. the one
+            returned by FeatureStore.append for a new session
+
+        label_name : metadata column holding the labels (classifier kind)
+        """
+        if rows is None:
+            rows = slice(0, len(store))
+        labels = None
+        if label_name is not None:
+            labels = np.asarray(store.metadata(label_name))[rows]
+        return self.partial_fit(store.table(rows), labels,
+                                store.feature_names)
+
+    def update_from_sessions(self, store, label_name=None):
+        """Learn the sessions (files) of the store not learned yet.
+
+        Returns the list of the new sessions.
+        """
+        new_sessions = []
+        for ifile, iruns in store.group_rows('file').items():
+            if ifile in self.sessions:
+                continue
+            for istart, istop in iruns:
+                self.partial_fit_store(store, slice(istart, istop),
+                                       label_name)
+            self.sessions.add(ifile)
+            new_sessions.append(ifile)
+        return new_sessions
+
+    def _batches(self, method, feature_table, feature_names=None):
+        """Return the concatenated outputs of method on batches."""
+        if not self.is_fitted:
+            raise ValueError('The model is not fitted yet')
+        feature_table = self._columns(feature_table, feature_names)
+        outputs = [method(self.scaler.transform(
+            feature_table[start:start + self.batch_size]))
+            for start in range(0, len(feature_table), self.batch_size)]
+        if not outputs:
+            return np.empty(0)
+        return np.concatenate(outputs)
+
+    def predict(self, feature_table, feature_names=None):
+        """Return the cluster or the label of each stroke."""
+        return self._batches(self.model.predict, feature_table,
+                             feature_names)
+
+    def score_strokes(self, feature_table, feature_names=None):
+        """Return a per stroke score.
+
+        Distance to the closest cluster center for the 'cluster' kind,
+        decision function of the classifier otherwise.
+        """
+        if self.kind == 'cluster':
+            method = lambda batch: self.model.transform(batch).min(axis=1)
+        else:
+            method = self.model.decision_function
+        return self._batches(method, feature_table, feature_names)
+
+    def save(self, fname):
+        """Pickle the model (written atomically)."""
+        tmp_fname = fname + '.tmp'
+        with open(tmp_fname, 'wb') as model_file:
+            pickle.dump(self, model_file, protocol=2)
+        os.rename(tmp_fname, fname)
+
+    @staticmethod
+    def load(fname):
+        """Return the model saved in fname."""
+        with open(fname, 'rb') as model_file:
+            return pickle.load(model_file)
+
+
+def load_or_create(fname, feature_names, **kwargs):
+    """Return the model saved in fname, a new one if there is none.
+
+    See IncrementalModel for the keyword arguments.
+    """
+    if os.path.exists(fname):
+        model = IncrementalModel.load(fname)
+        if model.feature_names != tuple(feature_names):
+            raise ValueError('The model in {} uses the features {}'.format(
+                fname, model.feature_names))
+        return model
+    return IncrementalModel(feature_names, **kwargs)
@@ -2,6 +2,9 @@
 import sys
 import pandas as pd
 import stroke_cleaning
+import classification
+import corpus
+import feature_cache
 
 
 def get_features_from_file(audio_file):
@@ -11,13 +14,16 @@ def get_features_from_file(audio_file):
                         columns=feature_dic['feature_names'])
 
 
-def get_df_from_list(audio_files):
+def get_df_from_list(audio_files, **kwargs):
     """
     Will return a data frame
     filled with the features from audio files from the list
+
+    The files are processed in parallel, see corpus.get_feature_store for
+    the keyword arguments (processes, cache, fake_stroke_onset).
     """
-    frames = [get_features_from_file(f) for f in audio_files]
-    return pd.concat(frames, ignore_index=True)
+    store = corpus.get_feature_store(audio_files, None, **kwargs)
+    return pd.DataFrame(store.table(), columns=store.feature_names)
 
 
 def main():
@@ -36,15 +42,24 @@ def main():
     list2 = ['/Users/jean-francoisrajotte/myaudio/jfraj.m4a',
              '/Users/jean-francoisrajotte/myaudio/jfraj.m4a',
              ]
-    df1 = get_df_from_list(list1)
-    df1['player'] = 1
-    print df1
-    df2 = get_df_from_list(list2)
-    df2['player'] = 2
-    print df2
-    df = pd.concat([df1,df2], ignore_index=True)
-
+    cache = feature_cache.FeatureCache()
+    store = corpus.get_feature_store(
+        list1 + list2, None,
+        [{'player': 1}]*len(list1) + [{'player': 2}]*len(list2),
+        cache=cache)
+    df = pd.DataFrame(store.table(), columns=store.feature_names)
+    df['player'] = store.metadata('player')
     print df
 
+    # Only the sessions not seen by the saved model are learned
+    model = classification.load_or_create(
+        'player_model.pkl', store.feature_names, kind='classifier',
+        classes=[1, 2])
+    new_sessions = model.update_from_sessions(store, label_name='player')
+    print 'learned {} new sessions'.format(len(new_sessions))
+    model.save('player_model.pkl')
+    df['predicted'] = model.predict(store.table(), store.feature_names)
+    print df.groupby(['player', 'predicted']).size()
+
 if __name__ == '__main__':
     sys.exit(main())
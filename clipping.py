@@ -0,0 +1,111 @@
+"""Find where the playing starts and stops in an audio signal.
+
+The signal is scanned block by block from each end until the threshold
+is crossed, so the cost is proportional to the quiet margins and no
+boolean array the size of the signal is allocated.
+"""
+from __future__ import division
+import numpy as np
+
+CLIP_MODES = ('amplitude', 'envelope', 'rms')
+
+
+def loud_mask(block, audio_thd, mode='amplitude', window=1024):
+    """Return the boolean mask of the loud samples (or windows) of block.
+
+    Parameters
+    ----------
+    block : 1-D array, its length must be a multiple of window in 'rms'
+        mode (except for a last, shorter window)
+
+    mode : 'amplitude' (signal above audio_thd, as audio_sample always
+        did), 'envelope' (absolute value above audio_thd) or 'rms'
+        (root mean square of window-long windows above audio_thd, one
+        value per window)
+    """
+    if mode == 'amplitude':
+        return block > audio_thd
+    if mode == 'envelope':
+        return np.abs(block) > audio_thd
+    if mode == 'rms':
+        nfull = len(block)//window
+        rms = np.sqrt((block[:nfull*window]**2).reshape(nfull, window)
+                      .mean(axis=1))
+        if len(block) > nfull*window:
+            rms = np.append(rms, np.sqrt((block[nfull*window:]**2).mean()))
+        return rms > audio_thd
+    raise ValueError('Unknown clip mode {}, should be one of {}'.format(
+        mode, CLIP_MODES))
+
+
+def first_loud_sample(audio, audio_thd, mode='amplitude', block_size=2**14,
+                      window=1024):
+    """Return the index of the first loud sample, None if there is none."""
+    if mode == 'rms':
+        block_size = max(1, block_size//window)*window
+    for start in range(0, len(audio), block_size):
+        loud = loud_mask(np.asarray(audio[start:start + block_size]),
+                         audio_thd, mode, window)
+        if loud.any():
+            first = np.argmax(loud)
+            if mode == 'rms':
+                first *= window
+            return int(start + first)
+    return None
+
+
+def last_loud_sample(audio, audio_thd, mode='amplitude', block_size=2**14,
+                     window=1024):
+    """Return the index of the last loud sample, None if there is none.
+
+    In 'rms' mode the windows are aligned on the end of the signal.
+    """
+    if mode == 'rms':
+        block_size = max(1, block_size//window)*window
+    for stop in range(len(audio), 0, -block_size):
+        start = max(0, stop - block_size)
+        # reversed view so that rms windows are aligned on the end
+        loud = loud_mask(np.asarray(audio[start:stop])[::-1], audio_thd,
+                         mode, window)
+        if loud.any():
+            last = np.argmax(loud)
+            if mode == 'rms':
+                last *= window
+            return int(stop - 1 - last)
+    return None
+
+
+def clip_bounds(audio, audio_thd, buffer_sz, **kwargs):
+    """Return (start, end) of the audio to keep (as slice bounds).
+
+    The kept signal starts buffer_sz samples before the first loud sample
+    and stops buffer_sz samples after the last one (the whole signal is
+    kept when nothing is loud).
+
+    Parameters
+    ----------
+    audio : 1-D array of the audio signal (or wavfile.PCMAudio, only the
+        scanned blocks are then read)
+
+    audio_thd : threshold above which the signal is loud
+
+    buffer_sz : margin kept around the loud part (unit samples)
+
+    clip_start, clip_end : if False, that end is not clipped
+
+    mode, block_size, window : see loud_mask and first_loud_sample
+    """
+    mode = kwargs.get('mode', 'amplitude')
+    block_size = kwargs.get('block_size', 2**14)
+    window = kwargs.get('window', 1024)
+    start, end = 0, len(audio)
+    if kwargs.get('clip_start', True):
+        first = first_loud_sample(audio, audio_thd, mode, block_size, window)
+        if first is not None:
+            start = max(0, first - buffer_sz)
+    if kwargs.get('clip_end', True):
+        last = last_loud_sample(audio[start:], audio_thd, mode, block_size,
+                                window)
+        if last is not None:
+            end = min(end, start + last + buffer_sz)
+    return start, end
@@ -0,0 +1,266 @@
+"""Feature extraction over many audio files"""
+import multiprocessing
+import traceback
+
+# This project
+import stroke_cleaning
+import features
+import feature_store
+import precision
+import streaming
+from instrumentation import NULL_INSTRUMENT
+
+# audio_sample keyword arguments that change the extracted features
+AUDIO_PARAMS = ('stroke_length', 'clip_start', 'clip_end', 'clip_mode',
+                'last_stroke', 'onset_method', 'quality', 'dtype',
+                'sampling_rate', 'channels')
+
+
+def get_file_features(audio_file, good_range=None, **kwargs):
+    """Return the feature dict of one audio file.
+
+    Parameters
+    ----------
+    audio_file : path of the audio file
+
+    good_range : (start, end) samples to keep, None to keep everything
+
+    fake_stroke_onset : if not False, width (in seconds) of the regular
+        windows used instead of the detected strokes
+
+    fake_stroke_hop : distance (in seconds) between the beginnings of the
+        regular windows, fake_stroke_onset by default (a shorter hop gives
+        overlapping windows)
+
+    streaming : if True, decode and process the file block by block (see
+        streaming.stream_features), only with fake_stroke_onset
+
+    block_size : number of samples decoded at once when streaming
+
+    feature_names : features to compute (features.FEATURE_NAMES by
+        default), see features.REGISTRY
+
+    instrument : instrumentation.Instrument passed to audio_sample (with
+        a process pool, use a sink that works across processes such as
+        instrumentation.JsonLinesSink)
+
+    decoded_cache : audio_cache.DecodedCache passed to audio_sample, files
+        that need decoding or resampling are only decoded once
+
+    Other keyword arguments in AUDIO_PARAMS are passed to audio_sample.
+    """
+    fake_stroke_onset = kwargs.get('fake_stroke_onset', False)
+    fake_stroke_hop = kwargs.get('fake_stroke_hop', None)
+    audio_kwargs = dict((iparam, kwargs[iparam])
+                        for iparam in AUDIO_PARAMS if iparam in kwargs)
+    if kwargs.get('streaming', False):
+        if fake_stroke_onset is False:
+            raise ValueError('Streaming needs fake_stroke_onset '
+                             '(onset detection needs the whole signal)')
+        if 'block_size' in kwargs:
+            audio_kwargs['block_size'] = kwargs['block_size']
+        if 'feature_names' in kwargs:
+            audio_kwargs['feature_names'] = kwargs['feature_names']
+        return streaming.stream_features(audio_file, good_range,
+                                         win_wd=fake_stroke_onset,
+                                         win_hop=fake_stroke_hop,
+                                         **audio_kwargs)
+    audio = stroke_cleaning.audio_sample(
+        audio_file, good_range,
+        instrument=kwargs.get('instrument', NULL_INSTRUMENT),
+        decoded_cache=kwargs.get('decoded_cache', None), **audio_kwargs)
+
+    # Strokes are either searched or just regular samples
+    if fake_stroke_onset is not False:
+        print('Using fake stroke')
+        audio.set_fake_regular_offsets(fake_stroke_onset,
+                                       win_hop=fake_stroke_hop)
+    else:
+        audio.isolate_strokes()
+    return audio.get_features(kwargs.get('feature_names', None))
+
+
+def feature_params(good_range=None, **kwargs):
+    """Return the dict of parameters identifying a feature extraction."""
+    params = {'good_range': good_range,
+              'fake_stroke_onset': kwargs.get('fake_stroke_onset', False),
+              'fake_stroke_hop': kwargs.get('fake_stroke_hop', None),
+              # the streamed tables may differ slightly from the batch ones
+              # (block_size does not change them)
+              'streaming': bool(kwargs.get('streaming', False)),
+              'feature_names': tuple(kwargs.get('feature_names',
+                                                features.FEATURE_NAMES))}
+    for iparam in AUDIO_PARAMS:
+        params[iparam] = kwargs.get(iparam, None)
+    params['dtype'] = precision.resolve_dtype(params['dtype']).name
+    return params
+
+
+def cached_feature_names(feature_names=None):
+    """Return the features computed for a request when using a cache.
+
+    The cache entries hold all the default features (and the requested
+    ones that are not), so that another selection of features is sliced
+    from the same entries instead of processing every file again.
+    """
+    if feature_names is None:
+        return features.FEATURE_NAMES
+    return features.FEATURE_NAMES + tuple(
+        iname for iname in feature_names
+        if iname not in features.FEATURE_NAMES)
+
+
+def select_features(feature_dic, feature_names=None):
+    """Return the feature dict with only the feature_names columns."""
+    if feature_names is None:
+        feature_names = features.FEATURE_NAMES
+    feature_names = tuple(feature_names)
+    if tuple(feature_dic['feature_names']) == feature_names:
+        return feature_dic
+    all_names = list(feature_dic['feature_names'])
+    columns = [all_names.index(iname) for iname in feature_names]
+    selected = dict(feature_dic)
+    selected['feature_names'] = feature_names
+    selected['feature_table'] = feature_dic['feature_table'][:, columns]
+    return selected
+
+
+def _file_features_job(job):
+    """Pool worker: unpack the job tuple for get_file_features.
+
+    With the skip_errors keyword, the error of a failing file is returned
+    (as a RuntimeError holding the traceback) instead of raised.
+    """
+    audio_file, good_range, kwargs = job
+    if not kwargs.get('skip_errors', False):
+        return audio_file, get_file_features(audio_file, good_range,
+                                             **kwargs)
+    try:
+        return audio_file, get_file_features(audio_file, good_range,
+                                             **kwargs)
+    except Exception:
+        return audio_file, RuntimeError(traceback.format_exc())
+
+
+def iter_features(path_list, goodrange_list=None, **kwargs):
+    """Yield (path, feature dict) for each file, in the order of path_list.
+
+    Files are spread over a pool of worker processes and the results are
+    streamed back as soon as they are available (still in order).
+
+    Parameters
+    ----------
+    path_list : list of audio file paths
+
+    goodrange_list : list of good ranges (one per path), None for no range
+
+    processes : number of worker processes, None to use all the cpus,
+        1 to work in the current process
+
+    cache : feature_cache.FeatureCache, only the files missing from the
+        cache are processed (None for no cache), computing all the
+        default features (see cached_feature_names)
+
+    fake_stroke_onset, fake_stroke_hop : see get_file_features
+
+    skip_errors : if True, a file that cannot be processed yields
+        (path, RuntimeError) instead of stopping the iteration
+    """
+    processes = kwargs.pop('processes', None)
+    cache = kwargs.pop('cache', None)
+    if goodrange_list is None:
+        goodrange_list = [None]*len(path_list)
+    feature_names = kwargs.get('feature_names', None)
+    if cache is not None:
+        kwargs = dict(kwargs,
+                      feature_names=cached_feature_names(feature_names))
+
+    # Looking for the files already in the cache
+    cached = [None]*len(path_list)
+    if cache is not None:
+        cached = []
+        for ipath, igood_range in zip(path_list, goodrange_list):
+            try:
+                cached.append(cache.get(ipath,
+                                        feature_params(igood_range, **kwargs)))
+            except OSError:
+                # missing file, its job reports the error
+                if not kwargs.get('skip_errors', False):
+                    raise
+                cached.append(None)
+    jobs = [(ipath, igood_range, kwargs)
+            for ipath, igood_range, icached
+            in zip(path_list, goodrange_list, cached) if icached is None]
+
+    results = _iter_jobs(jobs, processes)
+    try:
+        for ipath, igood_range, icached in zip(path_list, goodrange_list,
+                                               cached):
+            if icached is not None:
+                yield ipath, select_features(icached, feature_names)
+                continue
+            ipath, ifeature_dic = next(results)
+            if isinstance(ifeature_dic, Exception):
+                yield ipath, ifeature_dic
+                continue
+            if cache is not None:
+                cache.put(ipath, feature_params(igood_range, **kwargs),
+                          ifeature_dic)
+            yield ipath, select_features(ifeature_dic, feature_names)
+    finally:
+        results.close()
+        if cache is not None:
+            cache.save_index()
+
+
+def _iter_jobs(jobs, processes):
+    """Yield the result of each job, in order, using a process pool."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        for ijob in jobs:
+            yield _file_features_job(ijob)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for iresult in pool.imap(_file_features_job, jobs):
+            yield iresult
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def get_feature_store(path_list, goodrange_list, metadata_list=None,
+                      **kwargs):
+    """Return a feature_store.FeatureStore filled with the files features
+
+    Parameters
+    ----------
+    metadata_list : one dict of metadata (e.g. player, date) per file,
+        the file path is always stored
+
+    metadata_names : metadata columns of the store
+
+    store : FeatureStore to append to (a new one by default)
+
+    The files are processed in parallel, see iter_features for the other
+    keyword arguments (processes, cache, fake_stroke_onset).
+    """
+    store = kwargs.pop('store', None)
+    metadata_names = kwargs.pop('metadata_names', ('file', 'player', 'date'))
+    if metadata_list is None:
+        metadata_list = [{}]*len(path_list)
+    for (iaudiofile, ifeature_dic), imetadata in zip(
+            iter_features(path_list, goodrange_list, **kwargs),
+            metadata_list):
+        if store is None:
+            store = feature_store.FeatureStore(
+                ifeature_dic['feature_names'], metadata_names=metadata_names,
+                dtype=ifeature_dic['feature_table'].dtype)
+        store.append(ifeature_dic, file=iaudiofile, **imetadata)
+    return store
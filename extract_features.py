@@ -0,0 +1,90 @@
+"""Headless feature extraction of audio files into a feature store.
+
+Nothing here imports matplotlib (or sklearn), so the script starts fast
+in batch workers and on machines without a display.  The files are given
+on the command line or selected from the session catalog.
+
+Example:
+    python extract_features.py --player marina --fake-offset 0.5 \\
+        --output features/marina
+"""
+import argparse
+import sys
+
+# This project
+import audio_cache
+import corpus
+import feature_cache
+import session_catalog
+
+
+def main():
+    """Extract the features of the selected files and save the store."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('paths', nargs='*', help='audio files')
+    parser.add_argument('--catalog', default='datainfo.csv',
+                        help='session catalog used by --player/--date')
+    parser.add_argument('--player', default=None,
+                        help='add the sessions of this player')
+    parser.add_argument('--date', default=None,
+                        help='add the sessions of this date (YYYYmmdd)')
+    parser.add_argument('--goodrange', default=None,
+                        help='good range of the given paths (start-stop)')
+    parser.add_argument('--fake-offset', type=float, default=False,
+                        help='use regular windows of this width (s) '
+                             'instead of the detected strokes')
+    parser.add_argument('--fake-hop', type=float, default=None,
+                        help='distance (s) between the regular windows '
+                             '(default: their width, shorter to overlap)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='decode block by block (needs --fake-offset)')
+    parser.add_argument('--sampling-rate', type=int, default=None,
+                        help='analysis rate (default: the rate of each '
+                             'file)')
+    parser.add_argument('--decoded-cache', default='',
+                        help='directory of the decoded/resampled audio '
+                             '(default: decode every time)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: all the cpus)')
+    parser.add_argument('--cache-dir', default='feature_cache',
+                        help='feature cache directory ("" for no cache)')
+    parser.add_argument('--output', required=True,
+                        help='directory of the saved feature store')
+    args = parser.parse_args()
+
+    good_range = session_catalog.parse_goodrange(args.goodrange)
+    path_list = list(args.paths)
+    goodrange_list = [good_range]*len(path_list)
+    metadata_list = [{} for ipath in path_list]
+    if args.player is not None or args.date is not None:
+        criteria = dict((iname, ivalue) for iname, ivalue in
+                        (('player', args.player), ('date', args.date))
+                        if ivalue is not None)
+        catalog = session_catalog.load_catalog(args.catalog)
+        for isession in catalog.select(**criteria):
+            path_list.append(isession['path'])
+            goodrange_list.append(isession['goodrange'])
+            metadata_list.append({'player': isession.get('player'),
+                                  'date': isession.get('date')})
+    if not path_list:
+        parser.error('no audio file selected')
+
+    cache = None
+    if args.cache_dir:
+        cache = feature_cache.FeatureCache(args.cache_dir)
+    decoded_cache = None
+    if args.decoded_cache:
+        decoded_cache = audio_cache.DecodedCache(args.decoded_cache)
+    store = corpus.get_feature_store(
+        path_list, goodrange_list, metadata_list,
+        processes=args.processes, cache=cache, decoded_cache=decoded_cache,
+        sampling_rate=args.sampling_rate,
+        fake_stroke_onset=args.fake_offset, fake_stroke_hop=args.fake_hop,
+        streaming=args.streaming)
+    store.save(args.output)
+    sys.stderr.write('{} strokes of {} files saved in {}\n'.format(
+        len(store), len(path_list), args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
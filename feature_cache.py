@@ -0,0 +1,160 @@
+"""On-disk cache of the features extracted from audio files"""
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+# per stroke arrays of a feature dict saved besides the table:
+# feature dict key -> index entry (and file suffix)
+STROKE_ARRAYS = (('onset_samples', 'onsets'), ('channels', 'channels'))
+
+
+class FeatureCache(object):
+    """Feature tables stored as .npy files with a json index.
+
+    An entry is keyed by the content hash of the audio file and the
+    extraction parameters (good_range, stroke_length, clipping flags,
+    offset mode...), so a modified file or a different setting is a miss.
+    When the cache grows beyond max_size, the least recently used entries
+    are evicted.
+
+    Attributes
+    ----------
+    cache_dir : directory holding the index and the feature tables
+
+    max_size : maximum total size of the feature tables (unit bytes)
+    """
+
+    index_name = 'index.json'
+
+    def __init__(self, cache_dir='feature_cache', **kwargs):
+        """Load the index of the cache (created if needed)."""
+        self.cache_dir = cache_dir
+        self.max_size = kwargs.get('max_size', 1024**3)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.index_path = os.path.join(cache_dir, self.index_name)
+        self.entries = {}
+        # content hash of audio files, valid while size and mtime match
+        self.files = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            self.entries = index.get('entries', {})
+            self.files = index.get('files', {})
+
+    def save_index(self):
+        """Write the index atomically."""
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            json.dump({'entries': self.entries, 'files': self.files},
+                      index_file)
+        os.rename(tmp_path, self.index_path)
+
+    def file_hash(self, audio_file):
+        """Return the content hash of the file (memoized on size/mtime)."""
+        audio_file = os.path.abspath(audio_file)
+        stat = os.stat(audio_file)
+        known = self.files.get(audio_file)
+        if (known is not None and known['size'] == stat.st_size and
+                known['mtime'] == stat.st_mtime):
+            return known['hash']
+        content_hash = hashlib.sha1()
+        with open(audio_file, 'rb') as audio:
+            for block in iter(lambda: audio.read(1024**2), b''):
+                content_hash.update(block)
+        self.files[audio_file] = {'size': stat.st_size,
+                                  'mtime': stat.st_mtime,
+                                  'hash': content_hash.hexdigest()}
+        return content_hash.hexdigest()
+
+    def key(self, audio_file, params):
+        """Return the cache key of the file extracted with params."""
+        params_str = json.dumps(params, sort_keys=True, default=str)
+        params_hash = hashlib.sha1(params_str.encode('utf-8')).hexdigest()
+        return '{}_{}'.format(self.file_hash(audio_file), params_hash[:16])
+
+    def get(self, audio_file, params):
+        """Return the cached feature dict, None if not in the cache."""
+        key = self.key(audio_file, params)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        feature_dic = {'feature_names': tuple(entry['feature_names'])}
+        try:
+            feature_dic['feature_table'] = np.load(
+                os.path.join(self.cache_dir, entry['table']))
+            for iname, ientry in STROKE_ARRAYS:
+                if entry.get(ientry) is not None:
+                    feature_dic[iname] = np.load(
+                        os.path.join(self.cache_dir, entry[ientry]))
+        except IOError:
+            # file removed behind our back
+            self._remove(key)
+            return None
+        entry['last_used'] = time.time()
+        return feature_dic
+
+    def put(self, audio_file, params, feature_dic):
+        """Store the feature dict and evict old entries if needed.
+
+        The index is only written by save_index (once per batch of puts).
+        """
+        key = self.key(audio_file, params)
+        table_name = '{}.npy'.format(key)
+        np.save(os.path.join(self.cache_dir, table_name),
+                feature_dic['feature_table'])
+        size = os.path.getsize(os.path.join(self.cache_dir, table_name))
+        self.entries[key] = {
+            'audio_file': os.path.abspath(audio_file),
+            'feature_names': list(feature_dic['feature_names']),
+            'table': table_name,
+            'last_used': time.time()}
+        for iname, ientry in STROKE_ARRAYS:
+            array_name = None
+            if feature_dic.get(iname) is not None:
+                array_name = '{}_{}.npy'.format(key, ientry)
+                np.save(os.path.join(self.cache_dir, array_name),
+                        feature_dic[iname])
+                size += os.path.getsize(os.path.join(self.cache_dir,
+                                                     array_name))
+            self.entries[key][ientry] = array_name
+        self.entries[key]['size'] = size
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until size <= max_size."""
+        total_size = sum(entry['size'] for entry in self.entries.values())
+        by_age = sorted(self.entries.items(),
+                        key=lambda item: item[1]['last_used'])
+        for key, entry in by_age:
+            if total_size <= self.max_size:
+                break
+            self._remove(key)
+            total_size -= entry['size']
+
+    def _remove(self, key):
+        """Remove one entry and its table."""
+        entry = self.entries.pop(key)
+        names = [entry['table']] + [entry.get(ientry)
+                                    for iname, ientry in STROKE_ARRAYS]
+        for iname in names:
+            if iname is None:
+                continue
+            path = os.path.join(self.cache_dir, iname)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def invalidate(self, audio_file=None):
+        """Remove the entries of the given file, or all of them if None."""
+        if audio_file is not None:
+            audio_file = os.path.abspath(audio_file)
+        for key, entry in list(self.entries.items()):
+            if audio_file is None or entry['audio_file'] == audio_file:
+                self._remove(key)
+        if audio_file is None:
+            self.files = {}
+        else:
+            self.files.pop(audio_file, None)
+        self.save_index()
@@ -0,0 +1,212 @@
+"""Columnar store of the stroke features of many audio files"""
+import json
+import os
+import numpy as np
+
+# This project
+import precision
+
+
+class FeatureStore(object):
+    """Growable float32 (see precision) columnar table of stroke features
+    with metadata.
+
+    Each feature is a contiguous column of a preallocated buffer whose
+    capacity doubles when full, so appending the features of a file costs
+    the size of its table (no repeated np.vstack).  Every row also has
+    metadata columns (audio file, player, date as category codes) and the
+    onset sample of the stroke.
+
+    Attributes
+    ----------
+    feature_names : names of the feature columns
+
+    metadata_names : names of the categorical metadata columns
+
+    categories : dict metadata name -> list of the values seen
+    """
+
+    def __init__(self, feature_names, **kwargs):
+        """Create an empty store."""
+        self.feature_names = tuple(feature_names)
+        self.metadata_names = tuple(kwargs.get('metadata_names',
+                                               ('file', 'player', 'date')))
+        # float32 by default, see precision
+        self.dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+        capacity = kwargs.get('capacity', 1024)
+        self.nrows = 0
+        self.columns = np.empty((len(self.feature_names), capacity),
+                                dtype=self.dtype)
+        self.onsets = np.empty(capacity, dtype=np.int64)
+        self.codes = dict((iname, np.empty(capacity, dtype=np.int32))
+                          for iname in self.metadata_names)
+        self.categories = dict((iname, []) for iname in self.metadata_names)
+        self._category_index = dict((iname, {})
+                                    for iname in self.metadata_names)
+
+    def __len__(self):
+        return self.nrows
+
+    @property
+    def capacity(self):
+        return self.columns.shape[1]
+
+    def _grow(self, needed):
+        """Make room for needed rows (capacity doubles).
+
+        Read-only (memory mapped) buffers are copied in memory even when
+        they are large enough.
+        """
+        capacity = self.capacity
+        if (self.nrows + needed <= capacity and
+                self.columns.flags.writeable):
+            return
+        capacity = max(1, capacity)
+        while capacity < self.nrows + needed:
+            capacity *= 2
+        columns = np.empty((len(self.feature_names), capacity),
+                           dtype=self.dtype)
+        columns[:, :self.nrows] = self.columns[:, :self.nrows]
+        self.columns = columns
+        onsets = np.empty(capacity, dtype=np.int64)
+        onsets[:self.nrows] = self.onsets[:self.nrows]
+        self.onsets = onsets
+        for iname in self.metadata_names:
+            codes = np.empty(capacity, dtype=np.int32)
+            codes[:self.nrows] = self.codes[iname][:self.nrows]
+            self.codes[iname] = codes
+
+    def category_code(self, name, value):
+        """Return the code of value in the metadata column name."""
+        index = self._category_index[name]
+        if value not in index:
+            index[value] = len(self.categories[name])
+            self.categories[name].append(value)
+        return index[value]
+
+    def append(self, feature_dic, **metadata):
+        """Append the feature table of one file.
+
+        Parameters
+        ----------
+        feature_dic : dict with feature_names, feature_table and
+            (optionally) onset_samples, as returned by
+            audio_sample.get_features
+
+        metadata : values of the metadata columns for all these rows
+            (e.g. file=path, player='marina'), None when not given
+        """
+        unknown = set(metadata) - set(self.metadata_names)
+        if unknown:
+            raise ValueError('Unknown metadata {}'.format(sorted(unknown)))
+        table = feature_dic['feature_table']
+        if tuple(feature_dic['feature_names']) != self.feature_names:
+            raise ValueError('Feature names {} differ from the store {}'
+                             .format(feature_dic['feature_names'],
+                                     self.feature_names))
+        nrows = len(table)
+        self._grow(nrows)
+        rows = slice(self.nrows, self.nrows + nrows)
+        if nrows:
+            self.columns[:, rows] = np.asarray(table).T
+        onset_samples = feature_dic.get('onset_samples')
+        self.onsets[rows] = -1 if onset_samples is None else onset_samples
+        for iname in self.metadata_names:
+            self.codes[iname][rows] = self.category_code(
+                iname, metadata.get(iname))
+        self.nrows += nrows
+        return rows
+
+    def column(self, name):
+        """Return a view of the values of one feature."""
+        return self.columns[self.feature_names.index(name), :self.nrows]
+
+    def table(self, rows=None):
+        """Return a (n_rows, n_features) view of the given rows (a slice)."""
+        if rows is None:
+            rows = slice(0, self.nrows)
+        return self.columns[:, :self.nrows][:, rows].T
+
+    def metadata(self, name):
+        """Return the list of the metadata values of each row."""
+        values = self.categories[name]
+        return [values[icode] for icode in self.codes[name][:self.nrows]]
+
+    def group_rows(self, name):
+        """Return dict metadata value -> list of (start, stop) row runs."""
+        codes = self.codes[name][:self.nrows]
+        if self.nrows == 0:
+            return {}
+        boundaries = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [self.nrows]))
+        groups = {}
+        for istart, istop in zip(starts, stops):
+            value = self.categories[name][codes[istart]]
+            groups.setdefault(value, []).append((int(istart), int(istop)))
+        return groups
+
+    def group_tables(self, name):
+        """Return dict metadata value -> (n_rows, n_features) table.
+
+        The table of a group whose rows are contiguous (e.g. appended one
+        group after the other) is a view, otherwise the rows are copied.
+        """
+        tables = {}
+        for value, runs in self.group_rows(name).items():
+            if len(runs) == 1:
+                tables[value] = self.table(slice(*runs[0]))
+            else:
+                tables[value] = np.vstack([self.table(slice(*irun))
+                                           for irun in runs])
+        return tables
+
+    def feature_dic(self, rows=None):
+        """Return the rows as an audio_sample.get_features like dict."""
+        return {'feature_names': self.feature_names,
+                'feature_table': self.table(rows)}
+
+    def save(self, directory):
+        """Save the store as .npy files (to be memory mapped by load)."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        np.save(os.path.join(directory, 'columns.npy'),
+                self.columns[:, :self.nrows])
+        np.save(os.path.join(directory, 'onsets.npy'),
+                self.onsets[:self.nrows])
+        for iname in self.metadata_names:
+            np.save(os.path.join(directory, 'codes_{}.npy'.format(iname)),
+                    self.codes[iname][:self.nrows])
+        with open(os.path.join(directory, 'store.json'), 'w') as info_file:
+            json.dump({'feature_names': self.feature_names,
+                       'metadata_names': self.metadata_names,
+                       'categories': self.categories,
+                       'dtype': np.dtype(self.dtype).name}, info_file)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Return the store saved in directory, memory mapped by default.
+
+        Appending to a memory mapped store first copies it in memory.
+        """
+        with open(os.path.join(directory, 'store.json')) as info_file:
+            info = json.load(info_file)
+        store = cls(info['feature_names'],
+                    metadata_names=info['metadata_names'],
+                    dtype=np.dtype(info['dtype']), capacity=0)
+        store.columns = np.load(os.path.join(directory, 'columns.npy'),
+                                mmap_mode=mmap_mode)
+        store.nrows = store.columns.shape[1]
+        store.onsets = np.load(os.path.join(directory, 'onsets.npy'),
+                               mmap_mode=mmap_mode)
+        for iname in store.metadata_names:
+            store.codes[iname] = np.load(
+                os.path.join(directory, 'codes_{}.npy'.format(iname)),
+                mmap_mode=mmap_mode)
+            # json turns tuples into lists
+            values = [tuple(ivalue) if isinstance(ivalue, list) else ivalue
+                      for ivalue in info['categories'][iname]]
+            store.categories[iname] = values
+            store._category_index[iname] = dict(
+                (ivalue, icode) for icode, ivalue in enumerate(values))
+        return store
@@ -0,0 +1,298 @@
+"""Batch feature extraction over a matrix of strokes.
+
+The functions below reproduce the essentia algorithms used in
+stroke_cleaning.audio_sample.extract_features_from_frame
+(Windowing, Spectrum, ZeroCrossingRate, Centroid, CentralMoments and
+DistributionShape) as numpy operations over the stroke axis, so that a
+whole recording is processed in a few array operations instead of one
+python call (and six essentia objects) per stroke.
+
+Every computation keeps the precision of the frames (float32 by default,
+see precision): indices, windows and results are created in that dtype.
+"""
+from __future__ import division
+import numpy as np
+
+# This project
+import precision
+from instrumentation import NULL_INSTRUMENT
+
+# List of features to use (sm1 omitted because always nan)
+FEATURE_NAMES = ('zrc', 'centroid',
+                 'cm0', 'cm1', 'cm2', 'cm3', 'cm4',
+                 'sm0', 'sm2')
+
+
+def hamming_window(size, dtype=np.float64):
+    """Return essentia's normalized hamming window of the given size."""
+    window = 0.53836 - 0.46164*np.cos(2*np.pi*np.arange(size)/(size - 1))
+    # essentia normalizes the window so that it sums to 2
+    return (window*(2/np.abs(window).sum())).astype(dtype)
+
+
+def windowing(frames, window):
+    """Return the zero-phase windowed frames (essentia's Windowing).
+
+    Parameters
+    ----------
+    frames : 2-D array (n_frames, frame_size) with an even frame_size
+
+    window : 1-D array of size frame_size
+    """
+    size = frames.shape[1]
+    half = size//2
+    windowed = np.empty(frames.shape, dtype=frames.dtype)
+    # first half of the windowed signal is the second half of the frame
+    np.multiply(frames[:, half:], window[half:], out=windowed[:, :size - half])
+    np.multiply(frames[:, :half], window[:half], out=windowed[:, size - half:])
+    return windowed
+
+
+def spectrum(windowed):
+    """Return the magnitude spectrum of each frame (essentia's Spectrum)."""
+    # numpy < 2 computes the fft of float32 frames in float64
+    return np.abs(np.fft.rfft(windowed, axis=1)).astype(windowed.dtype,
+                                                        copy=False)
+
+
+def zero_crossing_rate(frames, threshold=0):
+    """Return the zero crossing rate of each frame."""
+    positive = frames > abs(threshold)
+    crossings = np.count_nonzero(positive[:, 1:] != positive[:, :-1], axis=1)
+    return (crossings/frames.shape[1]).astype(frames.dtype)
+
+
+def centroid(arrays, value_range=1):
+    """Return the centroid of each row (essentia's Centroid)."""
+    index = np.arange(arrays.shape[1], dtype=arrays.dtype)
+    weights = arrays.sum(axis=1)
+    moment = arrays.dot(index)
+    nonzero = weights != 0
+    result = np.zeros(len(arrays), dtype=arrays.dtype)
+    result[nonzero] = moment[nonzero]/weights[nonzero]
+    return result*value_range/(arrays.shape[1] - 1)
+
+
+def central_moments(arrays, value_range=1):
+    """Return the 5 central moments of each row (essentia's CentralMoments).
+
+    Rows are treated as probability density functions, as in essentia's
+    default 'pdf' mode.  Return a (n_rows, 5) array of the dtype of arrays.
+
+    The sums are accumulated in float64 whatever that dtype: the windowed
+    frames are not positive, their moments are ill-conditioned and float32
+    sums would change them by up to 1% (depending on the batch shape).
+    """
+    dtype = arrays.dtype
+    arrays = arrays.astype(np.float64, copy=False)
+    size = arrays.shape[1]
+    index = np.arange(size)
+    weights = arrays.sum(axis=1)
+    nonzero = weights != 0
+    safe_weights = np.where(nonzero, weights, 1)
+    mean = arrays.dot(index)/safe_weights
+    diff = index[np.newaxis, :] - mean[:, np.newaxis]
+    bin_width = value_range/(size - 1)
+    moments = np.zeros((len(arrays), 5))
+    moments[:, 0] = 1
+    power = diff*diff
+    for order in (2, 3, 4):
+        moments[:, order] = (
+            (power*arrays).sum(axis=1)/safe_weights*bin_width**order)
+        if order < 4:
+            power *= diff
+    moments[~nonzero] = 0
+    return moments.astype(dtype, copy=False)
+
+
+def distribution_shape(moments):
+    """Return spread, skewness and kurtosis (essentia's DistributionShape).
+
+    Return a (n_rows, 3) array.
+    """
+    spread = moments[:, 2]
+    flat = spread == 0
+    safe_spread = np.where(flat, moments.dtype.type(1), spread)
+    shape = np.empty((len(moments), 3), dtype=moments.dtype)
+    shape[:, 0] = spread
+    # a negative spread gives a nan skewness, as in essentia
+    with np.errstate(invalid='ignore'):
+        shape[:, 1] = np.where(flat, 0, moments[:, 3]/safe_spread**1.5)
+    shape[:, 2] = np.where(flat, -3, moments[:, 4]/safe_spread**2 - 3)
+    return shape
+
+
+# Registry of the features and of the intermediate results they need:
+# name -> (dependencies, function of the dependencies values, timed,
+# is_feature).
+# 'frames' (the strokes, of even length) is given, everything else is
+# computed at most once per batch and only if a requested feature needs it.
+REGISTRY = {}
+
+
+def register(name, dependencies, func, timed=True, is_feature=True):
+    """Add a feature (or an intermediate result) to the registry.
+
+    Parameters
+    ----------
+    name : name of the feature, e.g. 'centroid'
+
+    dependencies : names of the registered values func needs, e.g.
+        ('spectrum',)
+
+    func : func(extractor, *dependency_values) returns a 1-D array (one
+        value per frame) for a feature, anything for an intermediate
+
+    timed : if True, the computation is an instrumentation stage
+        ('feature:<name>')
+
+    is_feature : False for an intermediate result (e.g. the spectrum),
+        which cannot be a column of the feature table
+    """
+    REGISTRY[name] = (tuple(dependencies), func, timed, is_feature)
+
+
+def _column(index):
+    """Return a function picking a column of its argument."""
+    return lambda extractor, values: values[:, index]
+
+
+register('windowing', ('frames',),
+         lambda extractor, frames: windowing(
+             frames, extractor.window(frames.shape[1])), is_feature=False)
+register('spectrum', ('windowing',), lambda extractor, windowed:
+         spectrum(windowed), is_feature=False)
+register('central_moments', ('windowing',), lambda extractor, windowed:
+         central_moments(windowed), is_feature=False)
+register('distribution_shape', ('central_moments',),
+         lambda extractor, moments: distribution_shape(moments),
+         is_feature=False)
+register('zrc', ('frames',), lambda extractor, frames:
+         zero_crossing_rate(frames))
+register('centroid', ('spectrum',), lambda extractor, magnitude:
+         centroid(magnitude, extractor.sampling_rate/2))
+for _index in range(5):
+    register('cm{}'.format(_index), ('central_moments',), _column(_index),
+             timed=False)
+for _index in range(3):
+    # sm1 is available but not in FEATURE_NAMES (always nan)
+    register('sm{}'.format(_index), ('distribution_shape',),
+             _column(_index), timed=False)
+
+
+def available_features():
+    """Return the sorted names of the registered features."""
+    return sorted(iname for iname, ientry in REGISTRY.items()
+                  if ientry[3])
+
+
+def check_feature_names(feature_names):
+    """Raise ValueError if a feature is not registered."""
+    unknown = [iname for iname in feature_names
+               if iname not in REGISTRY or not REGISTRY[iname][3]]
+    if unknown:
+        raise ValueError('Unknown features {}, registered: {}'.format(
+            unknown, available_features()))
+
+
+class FeatureExtractor(object):
+    """Compute the stroke features of many strokes at once.
+
+    Attributes
+    ----------
+    sampling_rate : frequency of the strokes
+
+    feature_names : names (and order) of the feature table columns
+
+    batch_size : number of strokes processed at once
+
+    dtype : precision of the computations and of the feature tables
+        (float32 by default, see precision)
+
+    instrument : instrumentation.Instrument timing each feature step
+    """
+
+    def __init__(self, **kwargs):
+        """Windows are cached by frame size and reused between calls."""
+        self.sampling_rate = kwargs.get('sampling_rate', 44100)
+        self.feature_names = kwargs.get('feature_names', FEATURE_NAMES)
+        self.batch_size = kwargs.get('batch_size', 256)
+        self.dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+        self.instrument = kwargs.get('instrument', NULL_INSTRUMENT)
+        self._windows = {}
+
+    def window(self, size):
+        """Return the (cached) hamming window of the given size."""
+        if size not in self._windows:
+            self._windows[size] = hamming_window(size, self.dtype)
+        return self._windows[size]
+
+    def _compute(self, name, computed):
+        """Return the registered value name, computing its dependencies."""
+        if name not in computed:
+            dependencies, func, timed = REGISTRY[name][:3]
+            values = [self._compute(idependency, computed)
+                      for idependency in dependencies]
+            if timed:
+                with self.instrument.stage('feature:{}'.format(name)):
+                    computed[name] = func(self, *values)
+            else:
+                computed[name] = func(self, *values)
+        return computed[name]
+
+    def features_from_frames(self, frames, feature_names=None):
+        """Return dictionary of feature arrays for a 2-D array of frames.
+
+        Only the requested features (feature_names by default) and the
+        intermediate results they need are computed.  Frames of another
+        dtype are converted (copied) first; TypeError is raised if a
+        feature comes out in another precision.
+        """
+        if feature_names is None:
+            feature_names = self.feature_names
+        check_feature_names(feature_names)
+        frames = np.asarray(frames, dtype=self.dtype)
+        # Spectrum can only compute FFT of array of even size
+        if frames.shape[1] % 2 == 1:
+            frames = frames[:, :-1]
+        computed = {'frames': frames}
+        return dict((iname, precision.check_dtype(
+            self._compute(iname, computed), self.dtype, iname))
+                    for iname in feature_names)
+
+    def feature_table(self, strokes, mask=None, feature_names=None):
+        """Return the (n_strokes, n_features) table of the given strokes.
+
+        Parameters
+        ----------
+        strokes : 2-D array (n_strokes, stroke_length), usually a strided
+            view of the audio signal (see framing.stroke_frames)
+
+        mask : boolean array selecting the strokes to use, None for all
+
+        feature_names : columns of the table, feature_names by default
+
+        The strokes are processed batch_size at a time so that the
+        temporaries (windowed frames, spectra) stay small whatever the
+        number of strokes.
+        """
+        if feature_names is None:
+            feature_names = self.feature_names
+        check_feature_names(feature_names)
+        if mask is None:
+            mask = np.ones(len(strokes), dtype=bool)
+        table = np.empty((np.count_nonzero(mask), len(feature_names)),
+                         dtype=self.dtype)
+        row = 0
+        for start in range(0, len(strokes), self.batch_size):
+            imask = mask[start:start + self.batch_size]
+            if not imask.any():
+                continue
+            frames = strokes[start:start + self.batch_size]
+            if not imask.all():
+                frames = frames[imask]
+            feat_dic = self.features_from_frames(frames, feature_names)
+            for col, ifeature in enumerate(feature_names):
+                table[row:row + len(frames), col] = feat_dic[ifeature]
+            row += len(frames)
+        return table
@@ -0,0 +1,61 @@
+"""Cut an audio signal into stroke frames without copying samples"""
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def regular_step(onsets):
+    """Return the step between onsets if they are evenly spaced, else None."""
+    if len(onsets) < 2:
+        return 1
+    steps = np.diff(onsets)
+    if steps[0] > 0 and np.all(steps == steps[0]):
+        return int(steps[0])
+    return None
+
+
+def stroke_frames(audio, onset_samples, frame_sz, last_stroke='drop'):
+    """Return the strokes starting at onset_samples as a read-only 2-D array.
+
+    When the onsets are evenly spaced (e.g. set_fake_regular_offsets) the
+    result is a strided view of audio, no sample is copied.  Otherwise the
+    rows are gathered from a sliding window view of audio, which copies the
+    stroke samples once (and nothing else).
+
+    Parameters
+    ----------
+    audio : 1-D array of the audio signal
+
+    onset_samples : sorted stroke beginnings (unit samples)
+
+    frame_sz : length of a stroke (unit samples)
+
+    last_stroke : what to do with strokes running past the end of audio,
+        'drop' them or 'pad' them with zeros (padding implies a copy)
+    """
+    if last_stroke not in ('drop', 'pad'):
+        raise ValueError('last_stroke should be drop or pad, not {}'.format(
+            last_stroke))
+    onsets = np.asarray(onset_samples, dtype=int)
+    onsets = onsets[(onsets >= 0) & (onsets < len(audio))]
+    complete = onsets[onsets + frame_sz <= len(audio)]
+    if last_stroke == 'pad' and len(complete) < len(onsets):
+        frames = np.zeros((len(onsets), frame_sz), dtype=audio.dtype)
+        for irow, ionset in enumerate(onsets):
+            istroke = audio[ionset:ionset + frame_sz]
+            frames[irow, :len(istroke)] = istroke
+    elif len(complete) == 0:
+        frames = np.empty((0, frame_sz), dtype=audio.dtype)
+    else:
+        step = regular_step(complete)
+        sample_stride = audio.strides[0]
+        if step is not None:
+            frames = as_strided(audio[complete[0]:],
+                                shape=(len(complete), frame_sz),
+                                strides=(step*sample_stride, sample_stride))
+        else:
+            sliding = as_strided(audio,
+                                 shape=(len(audio) - frame_sz + 1, frame_sz),
+                                 strides=(sample_stride, sample_stride))
+            frames = sliding[complete]
+    frames.flags.writeable = False
+    return frames
@@ -0,0 +1,145 @@
+"""Stage timers and counters for the analysis pipeline.
+
+Code under measurement calls instrument.stage(name) (a context manager)
+and instrument.count(name, value).  The default NULL_INSTRUMENT does
+nothing, so instrumentation costs a method call when disabled.  An
+Instrument sends its records to a sink (MemorySink, LogSink or
+JsonLinesSink), each record being a dict with a 'type' ('stage' or
+'counter'), a 'name', the measured value and the context (e.g. the
+audio file name).
+"""
+import json
+import logging
+import time
+
+
+class _NullStage(object):
+    """Context manager doing nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullInstrument(object):
+    """Disabled instrumentation."""
+
+    enabled = False
+    _null_stage = _NullStage()
+
+    def stage(self, name, **info):
+        return self._null_stage
+
+    def count(self, name, value=1, **info):
+        pass
+
+    def child(self, **context):
+        return self
+
+
+NULL_INSTRUMENT = NullInstrument()
+
+
+class _Stage(object):
+    """Context manager timing a stage of an Instrument."""
+
+    def __init__(self, instrument, name, info):
+        self.instrument = instrument
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrument.emit('stage', self.name,
+                             seconds=time.time() - self.start,
+                             failed=exc_info[0] is not None, **self.info)
+        return False
+
+
+class Instrument(object):
+    """Enabled instrumentation sending its records to a sink.
+
+    Attributes
+    ----------
+    sink : object with an emit(record) method
+
+    context : dict added to every record
+    """
+
+    enabled = True
+
+    def __init__(self, sink, **context):
+        """Records go to sink."""
+        self.sink = sink
+        self.context = context
+
+    def stage(self, name, **info):
+        """Return a context manager timing the stage."""
+        return _Stage(self, name, info)
+
+    def count(self, name, value=1, **info):
+        """Record a counter value."""
+        self.emit('counter', name, value=value, **info)
+
+    def child(self, **context):
+        """Return an instrument with the same sink and more context."""
+        child_context = dict(self.context)
+        child_context.update(context)
+        return Instrument(self.sink, **child_context)
+
+    def emit(self, record_type, name, **values):
+        """Send a record to the sink."""
+        record = dict(self.context)
+        record.update(values)
+        record['type'] = record_type
+        record['name'] = name
+        self.sink.emit(record)
+
+
+class MemorySink(object):
+    """Keep the records in a list, with totals per stage and counter."""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def totals(self):
+        """Return dict name -> total seconds (stages) or value (counters)."""
+        totals = {}
+        for record in self.records:
+            value = record.get('seconds', record.get('value', 0))
+            totals[record['name']] = totals.get(record['name'], 0) + value
+        return totals
+
+
+class LogSink(object):
+    """Send the records to a logger."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger('soundeval')
+        self.logger = logger
+        self.level = level
+
+    def emit(self, record):
+        self.logger.log(self.level, '%s %s %s', record['type'],
+                        record['name'], record)
+
+
+class JsonLinesSink(object):
+    """Append the records as json lines to a file."""
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def emit(self, record):
+        with open(self.fname, 'a') as output:
+            output.write(json.dumps(record, sort_keys=True,
+                                    default=str) + '\n')
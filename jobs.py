@@ -0,0 +1,125 @@
+"""Background jobs (recording, feature evaluation) for the web recorder"""
+import threading
+import time
+import traceback
+import uuid
+
+
+class Job(object):
+    """State of a background job.
+
+    Attributes
+    ----------
+    job_id : unique identifier of the job
+
+    state : 'queued', 'running', 'done' or 'failed'
+
+    stage : free text describing what the job is doing
+
+    progress : fraction of the job done (between 0 and 1)
+
+    result : return value of the job function once done
+
+    error : error message if the job failed
+    """
+
+    def __init__(self, name):
+        """A new job is queued."""
+        self.job_id = uuid.uuid4().hex
+        self.name = name
+        self.state = 'queued'
+        self.stage = ''
+        self.progress = 0.
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        # progress is interpolated over time during a timed stage
+        self._timed_stage = None
+
+    def set_stage(self, stage, progress=None, duration=None):
+        """Set the current stage, progress and (optional) expected duration."""
+        self.stage = stage
+        if progress is not None:
+            self.progress = progress
+        self._timed_stage = None
+        if duration:
+            self._timed_stage = (time.time(), duration, self.progress)
+
+    def current_progress(self, timed_share=0.8):
+        """Return the progress, interpolated during a timed stage."""
+        if self._timed_stage is None or self.state != 'running':
+            return self.progress
+        start, duration, progress = self._timed_stage
+        elapsed = min(1., (time.time() - start)/duration)
+        return progress + (1 - progress)*timed_share*elapsed
+
+    def status(self):
+        """Return a json serializable dict describing the job."""
+        return {'job_id': self.job_id,
+                'name': self.name,
+                'state': self.state,
+                'stage': self.stage,
+                'progress': round(self.current_progress(), 3),
+                'error': self.error}
+
+
+class JobManager(object):
+    """Run jobs on background threads and keep track of their state.
+
+    Attributes
+    ----------
+    max_workers : number of jobs running at the same time
+
+    max_jobs : number of finished jobs kept (the oldest are forgotten)
+    """
+
+    def __init__(self, **kwargs):
+        """Nothing runs until a job is submitted."""
+        self.max_workers = kwargs.get('max_workers', 4)
+        self.max_jobs = kwargs.get('max_jobs', 100)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.workers = threading.Semaphore(self.max_workers)
+        # A single audio input: only one recording at a time
+        self.recording_lock = threading.Lock()
+
+    def submit(self, name, func, *args, **kwargs):
+        """Run func(job, *args, **kwargs) in the background, return the job.
+
+        func can report its progress with job.set_stage.
+        """
+        job = Job(name)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._forget_old_jobs()
+        thread = threading.Thread(target=self._run,
+                                  args=(job, func, args, kwargs))
+        thread.daemon = True
+        thread.start()
+        return job
+
+    def get(self, job_id):
+        """Return the job, None if unknown."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        """Thread target: run the job when a worker is free."""
+        with self.workers:
+            job.state = 'running'
+            try:
+                job.result = func(job, *args, **kwargs)
+                job.progress = 1.
+                job.state = 'done'
+            except Exception as error:
+                traceback.print_exc()
+                job.error = str(error)
+                job.state = 'failed'
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs above max_jobs."""
+        finished = sorted((job for job in self.jobs.values()
+                           if job.state in ('done', 'failed')),
+                          key=lambda job: job.created)
+        for job in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.job_id]
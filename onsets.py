@@ -0,0 +1,157 @@
+"""Stroke onset detection.
+
+The signal is cut into overlapping analysis frames (a strided view, no
+copy), the spectra are computed chunk by chunk and every requested
+onset detection function is evaluated in that single pass.  Onsets are
+the peaks of the detection function, closer onsets being suppressed
+without a python loop over all the candidates.
+"""
+from __future__ import division
+import numpy as np
+
+# This project
+import framing
+
+DETECTION_METHODS = ('hfc', 'flux', 'energy', 'complex')
+
+
+def suppress_close_onsets(onsets, min_gap):
+    """Return the onsets farther than min_gap from the previous kept one.
+
+    Same rule as the former audio_sample.find_onsets loop: an onset is
+    kept if it is at least min_gap after the last kept onset.  onsets must
+    be sorted, the loop only runs once per kept onset.  With min_gap <= 0
+    every onset is kept.
+    """
+    onsets = np.asarray(onsets)
+    if min_gap <= 0:
+        return onsets
+    keep = []
+    index = 0
+    while index < len(onsets):
+        keep.append(index)
+        # always moving on, even if rounding made the gap 0
+        index = max(index + 1,
+                    np.searchsorted(onsets, onsets[index] + min_gap, 'left'))
+    return onsets[np.array(keep, dtype=int)]
+
+
+def pick_peaks(odf, threshold=0.1, median_width=7):
+    """Return the frame indices of the peaks of the detection function.
+
+    A peak is a local maximum higher than threshold (relative to the
+    maximum of odf) above the moving median of odf.
+    """
+    if len(odf) < 3 or odf.max() <= 0:
+        return np.empty(0, dtype=int)
+    odf = odf/odf.max()
+    half = median_width//2
+    padded = np.concatenate((np.repeat(odf[0], half), odf,
+                             np.repeat(odf[-1], half)))
+    windows = framing.stroke_frames(padded, np.arange(len(odf)),
+                                    median_width)
+    moving_median = np.median(windows, axis=1)
+    local_max = np.zeros(len(odf), dtype=bool)
+    local_max[1:-1] = (odf[1:-1] >= odf[:-2]) & (odf[1:-1] > odf[2:])
+    return np.flatnonzero(local_max & (odf > moving_median + threshold))
+
+
+class OnsetDetector(object):
+    """Compute detection functions and onsets of an audio signal.
+
+    Attributes
+    ----------
+    sampling_rate : frequency of the signal
+
+    frame_size : analysis frame length (unit samples)
+
+    hop_size : distance between analysis frames (unit samples)
+
+    methods : detection functions computed in the single pass
+
+    frames : last analysed frames, a strided view of the signal that can
+        be reused (e.g. for frame-wise features)
+
+    detection_functions : dict of the last computed detection functions
+    """
+
+    def __init__(self, **kwargs):
+        """Parameters are given as keyword arguments."""
+        self.sampling_rate = kwargs.get('sampling_rate', 44100)
+        self.frame_size = kwargs.get('frame_size', 1024)
+        self.hop_size = kwargs.get('hop_size', 512)
+        self.methods = kwargs.get('methods', ('flux',))
+        self.threshold = kwargs.get('threshold', 0.1)
+        # number of frames whose spectra are held at once
+        self.chunk_frames = kwargs.get('chunk_frames', 1024)
+        for imethod in self.methods:
+            if imethod not in DETECTION_METHODS:
+                raise ValueError('Unknown detection function {}'.format(
+                    imethod))
+        self.window = np.hanning(self.frame_size)
+        self.frames = None
+        self.detection_functions = {}
+
+    def frame_onsets(self, nsamples):
+        """Return the first sample of each analysis frame."""
+        return np.arange(0, nsamples - self.frame_size + 1, self.hop_size)
+
+    def compute(self, audio):
+        """Return dict of the detection functions (one value per frame)."""
+        self.frames = framing.stroke_frames(
+            audio, self.frame_onsets(len(audio)), self.frame_size)
+        nframes = len(self.frames)
+        odfs = dict((imethod, np.zeros(nframes)) for imethod in self.methods)
+        index = np.arange(self.frame_size//2 + 1)
+        previous_mag = None
+        previous_phases = None
+        for start in range(0, nframes, self.chunk_frames):
+            chunk = self.frames[start:start + self.chunk_frames]
+            stop = start + len(chunk)
+            spectrum = np.fft.rfft(chunk*self.window, axis=1)
+            mag = np.abs(spectrum)
+            # the frame before the chunk (the first frame is its own)
+            if previous_mag is None:
+                previous_mag = mag[:1]
+            mags = np.vstack((previous_mag, mag))
+            if 'hfc' in odfs:
+                odfs['hfc'][start:stop] = (mag*mag).dot(index)
+            if 'energy' in odfs:
+                odfs['energy'][start:stop] = (chunk*chunk).sum(axis=1)
+            if 'flux' in odfs:
+                odfs['flux'][start:stop] = np.maximum(
+                    mags[1:] - mags[:-1], 0).sum(axis=1)
+            if 'complex' in odfs:
+                phase = np.angle(spectrum)
+                if previous_phases is None:
+                    previous_phases = np.vstack((phase[:1], phase[:1]))
+                phases = np.vstack((previous_phases, phase))
+                # spectrum predicted from the two previous frames
+                target = mags[:-1]*np.exp(1j*(2*phases[1:-1] - phases[:-2]))
+                odfs['complex'][start:stop] = np.abs(
+                    spectrum - target).sum(axis=1)
+                previous_phases = phases[-2:]
+            previous_mag = mag[-1:]
+        if 'energy' in odfs and nframes:
+            # onsets are energy increases
+            energy = odfs['energy']
+            odfs['energy'] = np.maximum(
+                energy - np.concatenate((energy[:1], energy[:-1])), 0)
+        self.detection_functions = odfs
+        return odfs
+
+    def onsets(self, audio, min_gap=0):
+        """Return the onsets of audio as an int array of sample indices.
+
+        The detection functions are normalized and summed, onsets closer
+        than min_gap (unit seconds) to the previous one are dropped.
+        """
+        odfs = self.compute(audio)
+        combined = np.zeros(len(self.frames))
+        for odf in odfs.values():
+            if len(odf) and odf.max() > 0:
+                combined += odf/odf.max()
+        peaks = pick_peaks(combined, self.threshold)
+        onset_samples = peaks*self.hop_size
+        return suppress_close_onsets(
+            onset_samples, int(min_gap*self.sampling_rate)).astype(int)
@@ -0,0 +1,86 @@
+"""Min/max decimation pyramid of an audio signal for plotting.
+
+Drawing millions of samples is slow and pointless: at screen resolution
+a waveform is its min/max envelope.  WaveformOverview computes the
+envelope of bins of base_factor samples, then of ratio times larger bins
+and so on, once per signal.  envelope() picks the level matching the
+requested range and number of points, so zoomed views stay sharp.
+"""
+from __future__ import division
+import numpy as np
+
+
+def _bin_min_max(mins, maxs, factor):
+    """Return the min/max of bins of factor consecutive values."""
+    nfull = len(mins)//factor
+    new_mins = mins[:nfull*factor].reshape(nfull, factor).min(axis=1)
+    new_maxs = maxs[:nfull*factor].reshape(nfull, factor).max(axis=1)
+    if len(mins) > nfull*factor:
+        new_mins = np.append(new_mins, mins[nfull*factor:].min())
+        new_maxs = np.append(new_maxs, maxs[nfull*factor:].max())
+    return new_mins, new_maxs
+
+
+class WaveformOverview(object):
+    """Min/max envelopes of a signal at several resolutions.
+
+    Attributes
+    ----------
+    audio : the signal
+
+    levels : list of (factor, mins, maxs), bins of factor samples from
+        the finest to the coarsest level
+    """
+
+    def __init__(self, audio, base_factor=64, ratio=4, min_bins=512):
+        """Compute the pyramid down to about min_bins bins."""
+        self.audio = audio
+        self.levels = []
+        if len(audio) < base_factor:
+            return
+        samples = np.asarray(audio)
+        mins, maxs = _bin_min_max(samples, samples, base_factor)
+        factor = base_factor
+        self.levels.append((factor, mins, maxs))
+        while len(mins) > min_bins*ratio:
+            mins, maxs = _bin_min_max(mins, maxs, ratio)
+            factor *= ratio
+            self.levels.append((factor, mins, maxs))
+
+    def envelope(self, start=0, stop=None, max_points=4000):
+        """Return (sample positions, values) to draw audio[start:stop].
+
+        The raw samples are returned when there are at most max_points of
+        them, otherwise the min and max of each bin alternate (a line
+        through them covers the envelope) with at most about max_points
+        points.
+        """
+        if stop is None:
+            stop = len(self.audio)
+        start = max(0, int(start))
+        stop = min(len(self.audio), int(np.ceil(stop)))
+        if stop <= start:
+            return np.empty(0), np.empty(0)
+        # each bin gives two points
+        min_factor = int(np.ceil(2*(stop - start)/max_points))
+        level = None
+        if self.levels and min_factor >= self.levels[0][0]:
+            # finest level with few enough points (or the coarsest one)
+            for level in self.levels:
+                if level[0] >= min_factor:
+                    break
+        if level is None:
+            samples = np.asarray(self.audio[start:stop])
+            factor = min_factor
+            if factor < 2:
+                return np.arange(start, stop), samples
+            # range too short for the pyramid, binned on the fly
+            mins, maxs = _bin_min_max(samples, samples, factor)
+            positions = start + np.arange(len(mins))*factor + factor/2
+        else:
+            factor, mins, maxs = level
+            first, last = start//factor, -(-stop//factor)
+            mins, maxs = mins[first:last], maxs[first:last]
+            positions = np.arange(first, last)*factor + factor/2
+        return (np.repeat(positions, 2),
+                np.column_stack((mins, maxs)).ravel())
@@ -4,10 +4,19 @@ import time
 #  This project
 import recorder
 import check_signal
+import session_catalog
 
 
 def record_playing(**kwargs):
-    """Record audio signal and save it."""
+    """Record audio signal and save it.
+
+    If a catalog is given (session_catalog.SessionCatalog), the recording
+    is appended to it with the player (basename by default), the date and
+    the playtype keyword.
+
+    channels and sampling_rate set the recording format (mono 44100Hz by
+    default, the analysis reads the files at their own rate).
+    """
     save_dir = kwargs.get('save_dir', 'test/')
     show_audio = kwargs.get('show_audio', False)
     countdown = kwargs.get('countdown', 3)
@@ -15,27 +24,38 @@ def record_playing(**kwargs):
     basename = kwargs.get('basename', None)
     if basename is None:
         basename = raw_input('Type a name for the file? ')
-    save_name = '{}_{}.wav'.format(basename, time.strftime("%Y%m%d"))
+    date = time.strftime("%Y%m%d")
+    save_name = '{}_{}.wav'.format(basename, date)
     save_name = os.path.join(save_dir, save_name)
     wait4enter = kwargs.get('wait4enter', True)
     if wait4enter:
         raw_input('Press enter when ready to start...')
-    rec = recorder.AudioRecorder(max_length=max_length, countdown=countdown)
+    rec = recorder.AudioRecorder(
+        max_length=max_length, countdown=countdown,
+        channels=kwargs.get('channels', 1),
+        sampling_rate=kwargs.get('sampling_rate', 44100))
     rec.start_record(savename=save_name)
+    catalog = kwargs.get('catalog', None)
+    if catalog is not None:
+        catalog.append(save_name, kwargs.get('player', basename), date,
+                       playtype=kwargs.get('playtype', None))
     if show_audio:
         check_signal.audio_report(save_name)
     return save_name
 
 
 def multi_recording(**kwargs):
-    """Record multiple audio signal and save them."""
+    """Record multiple audio signal and save them.
+
+    The keyword arguments are passed to record_playing (e.g. catalog).
+    """
     file_list = []
     while True:
         if raw_input('Another one?') not in ('y', 'Y', 'yes', 'Yes', 'YES'):
             break
-        file_list.append(record_playing())
+        file_list.append(record_playing(**kwargs))
     check_signal.show_multiaudio(file_list)
 
 if __name__ == "__main__":
     #record_playing(show_audio=True)
-    multi_recording()
+    multi_recording(catalog=session_catalog.load_catalog())
@@ -0,0 +1,32 @@
+"""Floating point precision of the signal path.
+
+The audio signal, its strokes, the feature computations and the stored
+feature tables all use one floating dtype, float32 by default: essentia
+itself works in float32 and it halves the memory of numpy's float64
+default.  resolve_dtype turns a dtype option into that dtype and
+check_dtype catches the arrays of the hot path that were silently
+converted to another precision (which also means they were copied).
+"""
+import numpy as np
+
+DEFAULT_DTYPE = np.dtype(np.float32)
+DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+def resolve_dtype(dtype=None):
+    """Return the numpy dtype of a dtype option (None for the default)."""
+    if dtype is None:
+        return DEFAULT_DTYPE
+    dtype = np.dtype(dtype)
+    if dtype not in DTYPES:
+        raise ValueError('The signal dtype should be float32 or float64, '
+                         'not {}'.format(dtype))
+    return dtype
+
+
+def check_dtype(array, dtype, name):
+    """Return array, raise TypeError if its dtype is not dtype."""
+    if array.dtype != dtype:
+        raise TypeError('{} is {} instead of {} (hidden conversion)'.format(
+            name, array.dtype, dtype))
+    return array
@@ -0,0 +1,95 @@
+"""Quality gate of the strokes.
+
+A stroke is kept if it passes all the enabled criteria, each computed
+for all the strokes at once:
+
+    min_peak : the maximum of the stroke is at least min_peak (the
+        original isGoodFrame test)
+    min_rms : the root mean square of the stroke is at least min_rms
+    max_clipping : at most this fraction of the samples are saturated
+        (absolute value >= clip_level)
+    max_silence : at most this fraction of the samples are silent
+        (absolute value < silence_level)
+
+A criterion set to None is not computed.
+"""
+from __future__ import division
+import numpy as np
+
+CRITERIA = ('min_peak', 'min_rms', 'max_clipping', 'max_silence')
+
+
+class QualityGate(object):
+    """Vectorized stroke quality test.
+
+    Attributes
+    ----------
+    min_peak, min_rms, max_clipping, max_silence : thresholds of the
+        criteria (None to disable), see the module documentation
+
+    clip_level : absolute value of a saturated sample
+
+    silence_level : absolute value below which a sample is silent
+
+    batch_size : number of strokes whose statistics are computed at once
+    """
+
+    def __init__(self, **kwargs):
+        """Only the peak criterion is enabled by default."""
+        self.min_peak = kwargs.get('min_peak', 0.1)
+        self.min_rms = kwargs.get('min_rms', None)
+        self.max_clipping = kwargs.get('max_clipping', None)
+        self.max_silence = kwargs.get('max_silence', None)
+        self.clip_level = kwargs.get('clip_level', 0.999)
+        self.silence_level = kwargs.get('silence_level', 0.01)
+        self.batch_size = kwargs.get('batch_size', 256)
+
+    def _failures(self, frames):
+        """Return dict criterion -> boolean array of the failing frames."""
+        failures = {}
+        if self.min_peak is not None:
+            failures['min_peak'] = frames.max(axis=1) < self.min_peak
+        if self.min_rms is not None:
+            rms = np.sqrt(np.einsum('ij,ij->i', frames, frames) /
+                          frames.shape[1])
+            failures['min_rms'] = rms < self.min_rms
+        if self.max_clipping is not None or self.max_silence is not None:
+            magnitude = np.abs(frames)
+            if self.max_clipping is not None:
+                clipped = np.count_nonzero(magnitude >= self.clip_level,
+                                           axis=1)
+                failures['max_clipping'] = (clipped/frames.shape[1] >
+                                            self.max_clipping)
+            if self.max_silence is not None:
+                silent = np.count_nonzero(magnitude < self.silence_level,
+                                          axis=1)
+                failures['max_silence'] = (silent/frames.shape[1] >
+                                           self.max_silence)
+        return failures
+
+    def evaluate(self, strokes):
+        """Return (mask of the good strokes, rejections).
+
+        rejections is a dict criterion -> number of strokes failing it (a
+        stroke can fail several criteria).
+        """
+        nstrokes = len(strokes)
+        mask = np.ones(nstrokes, dtype=bool)
+        rejections = dict((icriterion, 0) for icriterion in CRITERIA
+                          if getattr(self, icriterion) is not None)
+        if nstrokes == 0:
+            return mask, rejections
+        if strokes.shape[1] == 0:
+            mask[:] = False
+            return mask, rejections
+        # batches keep the temporaries (squares, magnitudes) small
+        for start in range(0, nstrokes, self.batch_size):
+            failures = self._failures(strokes[start:start + self.batch_size])
+            for icriterion, ifailed in failures.items():
+                rejections[icriterion] += int(np.count_nonzero(ifailed))
+                mask[start:start + len(ifailed)] &= ~ifailed
+        return mask, rejections
+
+    def mask(self, strokes):
+        """Return the boolean mask of the good strokes."""
+        return self.evaluate(strokes)[0]
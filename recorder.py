@@ -1,10 +1,64 @@
 """audio recorder"""
 
-import pyaudio
+import threading
 import wave
 import time
 
 from baseaudio import BaseAudio
+import streaming
+
+# PortAudio constants (the values of pyaudio's): pyaudio is only imported
+# to open the sound card, the capture also runs on a stub audio_api
+PA_INT16 = 8
+SAMPLE_SIZE = 2  # bytes of a PA_INT16 sample
+PA_INPUT_UNDERFLOW = 1
+PA_INPUT_OVERFLOW = 2
+PA_CONTINUE = 0
+PA_COMPLETE = 1
+
+
+class RingBuffer(object):
+    """Preallocated, thread-safe byte ring buffer.
+
+    One thread writes (the audio callback), another one reads (the file
+    writer).  A write that does not fit is rejected and counted as an
+    overrun instead of blocking the writer or growing the buffer.
+    """
+
+    def __init__(self, capacity):
+        """capacity is the size of the buffer in bytes."""
+        self.capacity = capacity
+        self.data = bytearray(capacity)
+        self.read_pos = 0
+        self.size = 0
+        self.overruns = 0
+        self.condition = threading.Condition()
+
+    def write(self, chunk):
+        """Copy chunk in the buffer, return False if it does not fit."""
+        with self.condition:
+            if len(chunk) > self.capacity - self.size:
+                self.overruns += 1
+                return False
+            start = (self.read_pos + self.size) % self.capacity
+            first = min(len(chunk), self.capacity - start)
+            self.data[start:start + first] = chunk[:first]
+            self.data[:len(chunk) - first] = chunk[first:]
+            self.size += len(chunk)
+            self.condition.notify()
+            return True
+
+    def read(self, timeout=None):
+        """Return all the buffered bytes (waiting up to timeout if empty)."""
+        with self.condition:
+            if self.size == 0:
+                self.condition.wait(timeout)
+            first = min(self.size, self.capacity - self.read_pos)
+            chunk = bytes(self.data[self.read_pos:self.read_pos + first] +
+                          self.data[:self.size - first])
+            self.read_pos = (self.read_pos + self.size) % self.capacity
+            self.size = 0
+            return chunk
 
 
 class AudioRecorder(BaseAudio):
@@ -15,20 +69,69 @@ class AudioRecorder(BaseAudio):
         super(AudioRecorder, self).__init__(**kwargs)
         self.frames_perbuff = kwargs.get('chunk', 2048)
         self.channels = kwargs.get('channels', 1)
-        self.format = pyaudio.paInt16  # paInt8
+        self.format = PA_INT16
         # if recording is longer than max_length, it stops
         self.max_length = kwargs.get('max_length', 60)  # in seconds
+        # capture is 'blocking' (stream.read loop) or 'callback'
+        self.capture = kwargs.get('capture', 'blocking')
+        # length of the ring buffer of the callback capture
+        self.ring_length = kwargs.get('ring_length', 5)  # in seconds
+        self.capture_stats = {}
 
     def start_record(self, **kwargs):
+        """Record until max_length or ctrl-c, and save if savename is given.
+
+        If on_features (a callable) or feature_queue (a Queue) is given,
+        the strokes are detected and their features evaluated while
+        recording (see streaming.StrokeAnalyzer), each new batch of stroke
+        features being passed to on_features and/or put in feature_queue.
+
+        audio_api replaces pyaudio.PyAudio() (e.g. with a fake source),
+        pyaudio is then not needed.
+        """
         countdown = kwargs.get('countdown', 3)
         savename = kwargs.get('savename', None)
+        on_features = kwargs.get('on_features', None)
+        feature_queue = kwargs.get('feature_queue', None)
+        analyzer = None
+        if on_features is not None or feature_queue is not None:
+            analyzer = streaming.StrokeAnalyzer(
+                sampling_rate=self.sampling_rate, channels=self.channels,
+                callback=on_features, results=feature_queue)
+            analyzer.start()
         # Countdown before recording
         for isec_left in reversed(range(countdown)):
             print(isec_left + 1)
             time.sleep(0.8)
         # Record
         print('start recording')
-        audio_api = pyaudio.PyAudio()
+        audio_api = kwargs.get('audio_api', None)
+        if audio_api is None:
+            import pyaudio
+            audio_api = pyaudio.PyAudio()
+        try:
+            if self.capture == 'callback':
+                self.callback_capture(audio_api, savename, analyzer)
+            else:
+                self.blocking_capture(audio_api, savename, analyzer)
+        finally:
+            audio_api.terminate()
+            if analyzer is not None:
+                analyzer.stop()
+        if analyzer is not None and analyzer.dropped_buffers:
+            print('{} buffers were not analysed'.format(
+                analyzer.dropped_buffers))
+
+    def open_wave(self, savename):
+        """Return a wave file opened for writing the recording."""
+        wf = wave.open(savename, 'wb')
+        wf.setnchannels(self.channels)
+        wf.setsampwidth(SAMPLE_SIZE)
+        wf.setframerate(self.sampling_rate)
+        return wf
+
+    def blocking_capture(self, audio_api, savename, analyzer=None):
+        """Record with blocking reads and save at the end."""
         stream = audio_api.open(format=self.format,
                                 channels=self.channels,
                                 rate=self.sampling_rate,
@@ -41,22 +144,95 @@ class AudioRecorder(BaseAudio):
             for i in range(0, nchunks):
                 data = stream.read(self.frames_perbuff)
                 frames.append(data)
+                if analyzer is not None:
+                    analyzer.push(data)
             print('max length ({}sec) reached...stop!'.format(self.max_length))
         except KeyboardInterrupt:
             print('\nStopped by user')
         print("* done recording")
         stream.stop_stream()
         stream.close()
-        audio_api.terminate()
         if savename is not None:
             print('saving as {}'.format(savename))
-            wf = wave.open(savename, 'wb')
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(audio_api.get_sample_size(self.format))
-            wf.setframerate(self.sampling_rate)
+            wf = self.open_wave(savename)
             wf.writeframes(b''.join(frames))
             wf.close()
 
+    def callback_capture(self, audio_api, savename, analyzer=None):
+        """Record with the callback api, writing the file as we go.
+
+        The audio callback only copies the data in a preallocated ring
+        buffer, a writer thread flushes it to the wave file.  Overruns
+        (buffers dropped because the ring is full) and the input overflows
+        and underflows reported by PortAudio are counted in
+        self.capture_stats.
+        """
+        ring = RingBuffer(int(self.ring_length*self.sampling_rate) *
+                          self.channels*SAMPLE_SIZE)
+        max_frames = int(self.max_length*self.sampling_rate)
+        stats = {'frames': 0, 'overruns': 0,
+                 'input_overflows': 0, 'input_underflows': 0}
+        done = threading.Event()
+
+        def callback(in_data, frame_count, time_info, status):
+            """Called by PortAudio for each buffer, must return quickly."""
+            if status & PA_INPUT_OVERFLOW:
+                stats['input_overflows'] += 1
+            if status & PA_INPUT_UNDERFLOW:
+                stats['input_underflows'] += 1
+            ring.write(in_data)
+            if analyzer is not None:
+                analyzer.push(in_data)
+            stats['frames'] += frame_count
+            if stats['frames'] >= max_frames:
+                done.set()
+                return None, PA_COMPLETE
+            return None, PA_CONTINUE
+
+        wf = None
+        if savename is not None:
+            print('saving as {}'.format(savename))
+            wf = self.open_wave(savename)
+
+        def flush():
+            """Writer thread: move the ring content to the file."""
+            while not done.is_set() or ring.size:
+                chunk = ring.read(timeout=0.1)
+                if chunk and wf is not None:
+                    wf.writeframes(chunk)
+
+        writer = threading.Thread(target=flush)
+        writer.start()
+        # the writer stops and the file is closed even if the stream
+        # cannot be opened (no input device, invalid sample rate...)
+        try:
+            stream = audio_api.open(format=self.format,
+                                    channels=self.channels,
+                                    rate=self.sampling_rate,
+                                    input=True,
+                                    frames_per_buffer=self.frames_perbuff,
+                                    stream_callback=callback)
+            try:
+                while not done.wait(0.1) and stream.is_active():
+                    pass
+                if done.is_set():
+                    print('max length ({}sec) reached...stop!'.format(
+                        self.max_length))
+            except KeyboardInterrupt:
+                print('\nStopped by user')
+            print("* done recording")
+            stream.stop_stream()
+            stream.close()
+        finally:
+            done.set()
+            writer.join()
+            if wf is not None:
+                wf.close()
+        stats['overruns'] = ring.overruns
+        self.capture_stats = stats
+        print('capture: {overruns} overruns, {input_overflows} input '
+              'overflows, {input_underflows} input underflows'.format(**stats))
+
 if __name__ == "__main__":
     rec = AudioRecorder(max_length=20)
     rec.start_record(savename='test.wav')
@@ -0,0 +1,227 @@
+"""Long-lived scorer of single strokes.
+
+A StrokeScorer keeps a features.FeatureExtractor (with its cached
+windows) and a trained classification.IncrementalModel in memory, so a
+stroke is scored without loading a file or rebuilding anything.  The
+strokes submitted concurrently (e.g. by the threads of the web app) are
+gathered by a worker thread into micro-batches, and every request has a
+latency budget: a stroke that cannot be scored in time is reported as
+expired instead of delaying the following ones.
+"""
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+
+# This project
+import features
+import quality
+from instrumentation import NULL_INSTRUMENT
+
+
+class ScoringTimeout(RuntimeError):
+    """The stroke could not be scored within the latency budget."""
+
+
+class _ScoreRequest(object):
+    """A stroke waiting to be scored."""
+
+    def __init__(self, stroke, deadline):
+        self.stroke = stroke
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class StrokeScorer(object):
+    """Score strokes in micro-batches within a latency budget.
+
+    Attributes
+    ----------
+    extractor : features.FeatureExtractor kept warm between requests
+
+    model : trained classification.IncrementalModel predicting the
+        player of a stroke (None to only compute the features and the
+        quality gate)
+
+    latency_budget : maximum time between a request and its result
+        (unit seconds)
+
+    max_batch : maximum number of strokes scored together
+
+    max_wait : maximum time spent gathering a batch (unit seconds)
+
+    stats : dict of the number of requests, batches and expired requests
+    """
+
+    def __init__(self, **kwargs):
+        """Create the scorer, the worker starts with start().
+
+        Parameters
+        ----------
+        sampling_rate : frequency of the strokes (default 44100)
+
+        model : trained model, or model_fname : pickled model to load
+
+        quality : criteria of the quality.QualityGate deciding if a
+            stroke is good
+
+        latency_budget, max_batch, max_wait : see the attributes
+
+        dtype : precision of the strokes and features (float32 by
+            default, see precision)
+
+        instrument : instrumentation.Instrument timing the batches
+        """
+        self.sampling_rate = kwargs.get('sampling_rate', 44100)
+        self.instrument = kwargs.get('instrument', NULL_INSTRUMENT)
+        self.extractor = features.FeatureExtractor(
+            sampling_rate=self.sampling_rate, dtype=kwargs.get('dtype', None),
+            instrument=self.instrument)
+        self.model = kwargs.get('model', None)
+        model_fname = kwargs.get('model_fname', None)
+        if self.model is None and model_fname is not None:
+            import classification
+            self.model = classification.IncrementalModel.load(model_fname)
+        self.quality_gate = quality.QualityGate(**kwargs.get('quality', {}))
+        self.latency_budget = kwargs.get('latency_budget', 0.1)
+        self.max_batch = kwargs.get('max_batch', 32)
+        self.max_wait = kwargs.get('max_wait', 0.005)
+        self.stats = {'requests': 0, 'batches': 0, 'expired': 0}
+        self._requests = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread (warms up the extractor first)."""
+        if self._thread is not None:
+            return self
+        self.extractor.features_from_frames(
+            np.zeros((1, 1024), dtype=self.extractor.dtype))
+        self._thread = threading.Thread(target=self._run,
+                                        name='stroke-scorer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the worker thread once the pending requests are done."""
+        if self._thread is None:
+            return
+        self._requests.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def score(self, stroke, latency_budget=None):
+        """Return the features and the score of one stroke.
+
+        Parameters
+        ----------
+        stroke : 1-D array of the stroke samples (converted to the
+            extractor dtype)
+
+        latency_budget : overrides the scorer latency budget
+
+        Returns a dict with feature_names, features (list), good (quality
+        gate) and, when there is a model, its prediction: predicted_player
+        (the label or cluster of the stroke) and player_score (the largest
+        decision value, or the distance to the cluster).  The model
+        predicts who plays, it does not rate the stroke quality.  Raises
+        ScoringTimeout if the budget expires.
+        """
+        if self._thread is None:
+            raise RuntimeError('The scorer is not started')
+        stroke = np.asarray(stroke, dtype=self.extractor.dtype)
+        if stroke.ndim != 1 or len(stroke) < 2:
+            raise ValueError('A stroke is a 1-D array of at least 2 samples')
+        if latency_budget is None:
+            latency_budget = self.latency_budget
+        start = time.time()
+        request = _ScoreRequest(stroke, start + latency_budget)
+        self._requests.put(request)
+        if not request.done.wait(latency_budget):
+            # the worker will find the request expired
+            raise ScoringTimeout('Stroke not scored within {} s'.format(
+                latency_budget))
+        if request.error is not None:
+            raise request.error
+        request.result['latency'] = time.time() - start
+        return request.result
+
+    def _gather(self):
+        """Return the next micro-batch of requests (None to stop)."""
+        request = self._requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        wait_until = min(time.time() + self.max_wait, request.deadline)
+        while len(batch) < self.max_batch:
+            timeout = wait_until - time.time()
+            try:
+                if timeout <= 0:
+                    request = self._requests.get_nowait()
+                else:
+                    request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        """Worker loop: gather, score and answer micro-batches."""
+        while True:
+            batch = self._gather()
+            if batch is None:
+                return
+            now = time.time()
+            live = []
+            for request in batch:
+                if request.deadline < now:
+                    self.stats['expired'] += 1
+                    request.error = ScoringTimeout('Stroke expired')
+                    request.done.set()
+                else:
+                    live.append(request)
+            self.stats['requests'] += len(batch)
+            if not live:
+                continue
+            self.stats['batches'] += 1
+            try:
+                with self.instrument.stage('score:batch', size=len(live)):
+                    self._score_batch(live)
+            except Exception as error:
+                for request in live:
+                    request.error = error
+            for request in live:
+                request.done.set()
+
+    def _score_batch(self, requests):
+        """Fill the result of each request, strokes grouped by length."""
+        by_length = {}
+        for request in requests:
+            by_length.setdefault(len(request.stroke), []).append(request)
+        for length_requests in by_length.values():
+            strokes = np.vstack([request.stroke
+                                 for request in length_requests])
+            good = self.quality_gate.mask(strokes)
+            table = self.extractor.feature_table(strokes)
+            labels = scores = None
+            if self.model is not None:
+                labels = self.model.predict(table,
+                                            self.extractor.feature_names)
+                scores = self.model.score_strokes(
+                    table, self.extractor.feature_names)
+            for irow, request in enumerate(length_requests):
+                result = {'feature_names': list(self.extractor.feature_names),
+                          'features': table[irow].tolist(),
+                          'good': bool(good[irow])}
+                if labels is not None:
+                    result['predicted_player'] = labels[irow].item()
+                    result['player_score'] = float(np.max(scores[irow]))
+                request.result = result
@@ -0,0 +1,232 @@
+"""Catalog of the recording sessions described in datainfo.csv.
+
+datainfo.csv is a space separated file with one line per recording and
+(at least) the columns player, date, path and goodrange, e.g.
+
+    player date path goodrange playtype
+    marina 20150623 alto/marina_20150623.wav 95000-400000 halfbow
+    jfraj 20150623 alto/jfraj_20150623.wav None None
+
+The file is read once; the sessions are indexed by player, date and play
+type so that selecting a group does not scan the whole table, and the
+goodrange strings are parsed into (start, stop) tuples when loaded.
+"""
+import csv
+import os
+import re
+
+DEFAULT_COLUMNS = ('player', 'date', 'path', 'goodrange', 'playtype')
+INDEX_COLUMNS = ('player', 'date', 'playtype')
+NA_VALUES = ('', 'None', 'nan', 'NaN')
+
+# start-stop, both may be negative (e.g. 95000--400000)
+_GOODRANGE_RE = re.compile(r'^\s*\(?\s*(-?\d+)\s*[-,]\s*(-?\d+)\s*\)?\s*$')
+
+# catalogs already loaded, by absolute path
+_loaded = {}
+
+
+def parse_goodrange(value):
+    """Return the good range as a (start, stop) tuple of int or None.
+
+    Parameters
+    ----------
+    value : string like '95000-400000' (or '95000--400000' for a stop
+        counted from the end), a tuple, or a missing value (None, 'None',
+        nan)
+    """
+    if value is None:
+        return None
+    if isinstance(value, (tuple, list)):
+        return (int(value[0]), int(value[1]))
+    if isinstance(value, float):
+        # nan read by pandas
+        return None
+    value = str(value)
+    if value.strip() in NA_VALUES:
+        return None
+    match = _GOODRANGE_RE.match(value)
+    if match is None:
+        raise ValueError('Cannot parse good range {!r}'.format(value))
+    return (int(match.group(1)), int(match.group(2)))
+
+
+def format_goodrange(good_range):
+    """Return the datainfo.csv string of a good range tuple."""
+    if good_range is None:
+        return 'None'
+    return '{}-{}'.format(*good_range)
+
+
+class SessionCatalog(object):
+    """Recording sessions with indexes by player, date and play type.
+
+    Attributes
+    ----------
+    fname : path of the csv file (None for a catalog kept in memory)
+
+    columns : names of the columns, in the order of the file
+
+    sessions : list of dict, one per recording; 'goodrange' is a tuple or
+        None and missing values are None
+
+    indexes : dict column -> dict value -> list of session positions
+    """
+
+    def __init__(self, fname=None, **kwargs):
+        """Read the catalog file if it exists."""
+        self.fname = fname
+        self.columns = tuple(kwargs.get('columns', DEFAULT_COLUMNS))
+        self.index_columns = tuple(kwargs.get('index_columns',
+                                              INDEX_COLUMNS))
+        self.sessions = []
+        self.indexes = dict((iname, {}) for iname in self.index_columns)
+        self.mtime = None
+        if fname is not None and os.path.exists(fname):
+            self.read()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def read(self):
+        """(Re)load the sessions from the catalog file."""
+        self.sessions = []
+        self.indexes = dict((iname, {}) for iname in self.index_columns)
+        with open(self.fname) as catalog_file:
+            reader = csv.reader(catalog_file, delimiter=' ',
+                                skipinitialspace=True)
+            header = next(reader, None)
+            if header is not None:
+                self.columns = tuple(header)
+            for row in reader:
+                if not row:
+                    continue
+                self._add(dict(zip(self.columns, row)))
+        self.mtime = os.path.getmtime(self.fname)
+
+    def is_stale(self):
+        """Return True if the file changed since it was read."""
+        if self.fname is None or not os.path.exists(self.fname):
+            return False
+        return self.mtime != os.path.getmtime(self.fname)
+
+    def _add(self, values):
+        """Parse and index one session, return it."""
+        session = {}
+        for iname, ivalue in values.items():
+            if ivalue is not None and str(ivalue).strip() in NA_VALUES:
+                ivalue = None
+            session[iname] = ivalue
+        session['goodrange'] = parse_goodrange(session.get('goodrange'))
+        position = len(self.sessions)
+        self.sessions.append(session)
+        for iname in self.index_columns:
+            self.indexes[iname].setdefault(session.get(iname),
+                                           []).append(position)
+        return session
+
+    def append(self, path, player, date, goodrange=None, **values):
+        """Add a session and write it at the end of the catalog file.
+
+        Parameters
+        ----------
+        path : audio file of the recording
+
+        player, date : who played and when (date as 'YYYYmmdd')
+
+        goodrange : (start, stop) tuple or string, None for the whole file
+
+        values : other columns (e.g. playtype='halfbow'); columns not in
+            the file are kept in memory only
+        """
+        values.update({'path': path, 'player': player, 'date': date,
+                       'goodrange': format_goodrange(
+                           parse_goodrange(goodrange))})
+        session = self._add(values)
+        if self.fname is not None:
+            new_file = not os.path.exists(self.fname)
+            with open(self.fname, 'a') as catalog_file:
+                if new_file:
+                    catalog_file.write(' '.join(self.columns) + '\n')
+                catalog_file.write(' '.join(
+                    self._field(values.get(iname))
+                    for iname in self.columns) + '\n')
+            self.mtime = os.path.getmtime(self.fname)
+        return session
+
+    @staticmethod
+    def _field(value):
+        """Return the csv field of a value."""
+        if value is None:
+            return 'None'
+        value = str(value)
+        if ' ' in value:
+            raise ValueError('Catalog values cannot contain spaces: '
+                             '{!r}'.format(value))
+        return value
+
+    def values(self, column):
+        """Return the values of an indexed column, in order of appearance."""
+        index = self.indexes[column]
+        return sorted(index, key=lambda ivalue: index[ivalue][0])
+
+    def select(self, **criteria):
+        """Return the sessions matching all the criteria (column=value).
+
+        The indexed columns are looked up, the other ones are filtered.
+        """
+        positions = None
+        others = {}
+        for iname, ivalue in criteria.items():
+            if iname not in self.indexes:
+                others[iname] = ivalue
+                continue
+            ipositions = self.indexes[iname].get(ivalue, [])
+            if positions is None:
+                positions = ipositions
+            else:
+                keep = set(ipositions)
+                positions = [iposition for iposition in positions
+                             if iposition in keep]
+        if positions is None:
+            positions = range(len(self.sessions))
+        sessions = [self.sessions[iposition] for iposition in positions]
+        if others:
+            sessions = [isession for isession in sessions
+                        if all(isession.get(iname) == ivalue
+                               for iname, ivalue in others.items())]
+        return sessions
+
+    def paths_and_goodranges(self, **criteria):
+        """Return (path list, goodrange list) of the selected sessions."""
+        sessions = self.select(**criteria)
+        return ([isession['path'] for isession in sessions],
+                [isession['goodrange'] for isession in sessions])
+
+    def group_by(self, column):
+        """Return dict value -> {'paths': [...], 'goodranges': [...]}.
+
+        This is the group_dict of check_signal.show_grouped_features.
+        """
+        groups = {}
+        for ivalue in self.values(column):
+            sessions = [self.sessions[iposition]
+                        for iposition in self.indexes[column][ivalue]]
+            groups[ivalue] = {
+                'paths': [isession['path'] for isession in sessions],
+                'goodranges': [isession['goodrange']
+                               for isession in sessions]}
+        return groups
+
+
+def load_catalog(fname='datainfo.csv', **kwargs):
+    """Return the catalog of fname, read only once per process.
+
+    The catalog is read again if the file was modified by someone else.
+    """
+    path = os.path.abspath(fname)
+    catalog = _loaded.get(path)
+    if catalog is None or catalog.is_stale():
+        catalog = SessionCatalog(path, **kwargs)
+        _loaded[path] = catalog
+    return catalog
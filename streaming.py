@@ -0,0 +1,577 @@
+"""Block by block processing of long recordings.
+
+The whole recording is never held in memory: the file is decoded in
+blocks, the good range and the edge clipping of audio_sample are applied
+incrementally and the strokes are handed to the feature extraction as
+soon as they are complete.  Peak memory depends on block_size (and on the
+length of the silences when clipping the end), not on the recording
+length.
+"""
+from __future__ import division
+import numbers
+import subprocess
+import threading
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# This project
+import clipping
+import features
+import framing
+import precision
+import quality
+import wavfile
+
+# clip modes deciding sample by sample (clipping.loud_mask)
+STREAM_CLIP_MODES = ('amplitude', 'envelope')
+
+
+def read_wav_blocks(audio_fname, block_size, info=None, dtype=None):
+    """Yield mono float blocks of an uncompressed PCM WAV file.
+
+    The file is memory mapped (see wavfile.open_pcm), only the current
+    block is scaled to floats (of dtype, see precision).
+    """
+    audio = wavfile.open_pcm(audio_fname, info,
+                             precision.resolve_dtype(dtype))
+    for start in range(0, len(audio), block_size):
+        yield np.asarray(audio[start:start + block_size])
+
+
+def read_ffmpeg_blocks(audio_fname, block_size, sampling_rate, dtype=None):
+    """Yield mono float blocks decoded (and resampled) by ffmpeg."""
+    dtype = precision.resolve_dtype(dtype)
+    decoder = subprocess.Popen(
+        ['ffmpeg', '-v', 'error', '-i', audio_fname,
+         '-f', 'f32le', '-ac', '1', '-ar', str(sampling_rate), '-'],
+        stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = decoder.stdout.read(4*block_size)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype='<f4').astype(dtype, copy=False)
+    finally:
+        decoder.stdout.close()
+        if decoder.wait() != 0:
+            raise IOError('ffmpeg could not decode {}'.format(audio_fname))
+
+
+def read_blocks(audio_fname, block_size, sampling_rate=44100, dtype=None):
+    """Yield mono float blocks of at most block_size samples."""
+    if audio_fname.lower().endswith('.wav'):
+        info = wavfile.pcm_info(audio_fname)
+        if info is not None and info['sampling_rate'] == sampling_rate:
+            return read_wav_blocks(audio_fname, block_size, info, dtype)
+    return read_ffmpeg_blocks(audio_fname, block_size, sampling_rate, dtype)
+
+
+def ffprobe_rate(audio_fname):
+    """Return the sampling rate of the first audio stream (ffprobe)."""
+    output = subprocess.check_output(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+         '-show_entries', 'stream=sample_rate', '-of', 'csv=p=0',
+         audio_fname])
+    return int(output.decode('ascii').strip())
+
+
+def stream_rate(audio_fname, sampling_rate=None):
+    """Return the analysis rate of a stream.
+
+    sampling_rate if given, else the native rate of the file (as
+    audio_sample): read from the header of a PCM WAV file, from ffprobe
+    for the other files.
+    """
+    if sampling_rate is not None:
+        return sampling_rate
+    if audio_fname.lower().endswith('.wav'):
+        info = wavfile.pcm_info(audio_fname)
+        if info is not None:
+            return info['sampling_rate']
+    return ffprobe_rate(audio_fname)
+
+
+class RangeTrimmer(object):
+    """Apply audio_sample's good_range to a stream of blocks.
+
+    A negative end is handled by holding back that many samples.
+    """
+
+    def __init__(self, good_range=None, dtype=None):
+        """good_range is ignored if it is not a pair of integers/None."""
+        self.start, self.stop = 0, None
+        try:
+            start, stop = good_range[0], good_range[1]
+        except (TypeError, IndexError, KeyError):
+            start, stop = 0, None
+        if (isinstance(start, (numbers.Integral, type(None))) and
+                isinstance(stop, (numbers.Integral, type(None)))):
+            self.start, self.stop = start or 0, stop
+        if self.start < 0:
+            raise ValueError('Cannot stream with a negative range start')
+        self.position = 0
+        self.held = np.empty(0, dtype=precision.resolve_dtype(dtype))
+
+    def push(self, block):
+        """Return the part of block inside the good range."""
+        block_start = self.position
+        self.position += len(block)
+        # Samples before the range start
+        skip = max(0, min(len(block), self.start - block_start))
+        block = block[skip:]
+        if self.stop is None:
+            return block
+        if self.stop >= 0:
+            return block[:max(0, self.stop - block_start - skip)]
+        # Negative stop: the last -stop samples are never released
+        self.held = np.concatenate((self.held, block))
+        nrelease = max(0, len(self.held) + self.stop)
+        released, self.held = self.held[:nrelease], self.held[nrelease:]
+        return released
+
+
+class EdgeClipper(object):
+    """Clip the quiet beginning and end of a stream (see audio_sample).
+
+    The output starts beginning_buffer seconds before the first loud
+    sample and stops beginning_buffer seconds after the last one, as
+    clipping.clip_bounds.  Samples after the last loud sample are held
+    until a louder one arrives or the stream ends (see flush).  Until a
+    loud sample arrives the whole stream is held: when nothing is loud,
+    everything is kept, as in clip_bounds.
+
+    Only the per-sample clip modes ('amplitude' and 'envelope') can be
+    streamed.
+    """
+
+    def __init__(self, **kwargs):
+        """Same parameters as audio_sample's clipping."""
+        sampling_rate = kwargs.get('sampling_rate', 44100)
+        self.audio_thd = kwargs.get('audio_thd', 0.05)
+        self.buffer_sz = int(kwargs.get('beginning_buffer', 1)*sampling_rate)
+        self.clip_start = kwargs.get('clip_start', True)
+        self.clip_end = kwargs.get('clip_end', True)
+        self.clip_mode = kwargs.get('clip_mode', 'amplitude')
+        if self.clip_mode not in STREAM_CLIP_MODES:
+            raise ValueError('Streaming clip mode should be one of {}, not '
+                             '{}'.format(STREAM_CLIP_MODES, self.clip_mode))
+        self.dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+        self.started = not self.clip_start
+        self.history = []
+        # position (in the clipped output) of the end of the kept samples
+        self.position = 0
+        self.keep_until = 0
+        self.found_loud = False
+        self.pending = np.empty(0, dtype=self.dtype)
+
+    def _loud(self, block):
+        """Return the indices of the loud samples of block."""
+        return np.flatnonzero(clipping.loud_mask(block, self.audio_thd,
+                                                 self.clip_mode))
+
+    def _start(self, block):
+        """Return the output once the first loud sample is found."""
+        loud = self._loud(block)
+        if len(loud) == 0:
+            self.history.append(block)
+            return np.empty(0, dtype=self.dtype)
+        self.started = True
+        history = np.concatenate(self.history + [block[:loud[0]]])
+        self.history = []
+        head = history[max(0, len(history) - self.buffer_sz):]
+        return np.concatenate((head, block[loud[0]:]))
+
+    def push(self, block):
+        """Return the samples of block that are kept (may be empty)."""
+        if not self.started:
+            block = self._start(block)
+            if not self.started:
+                return block
+        if not self.clip_end:
+            return block
+        loud = self._loud(block)
+        block_start = self.position + len(self.pending)
+        if len(loud):
+            self.found_loud = True
+            self.keep_until = block_start + loud[-1] + self.buffer_sz
+        self.pending = np.concatenate((self.pending, block))
+        nrelease = min(len(self.pending), self.keep_until - self.position)
+        released = self.pending[:nrelease]
+        self.pending = self.pending[nrelease:]
+        self.position += nrelease
+        return released
+
+    def flush(self):
+        """Return the samples still kept once the stream has ended.
+
+        Without any loud sample the whole stream is kept.
+        """
+        if not self.started:
+            released = np.concatenate(
+                self.history + [np.empty(0, dtype=self.dtype)])
+            self.history = []
+            return released
+        if self.found_loud:
+            # the held samples are after the end of the clipped signal
+            released = np.empty(0, dtype=self.dtype)
+        else:
+            released = self.pending
+        self.pending = np.empty(0, dtype=self.dtype)
+        return released
+
+
+class StrokeFramer(object):
+    """Cut a stream into regular strokes.
+
+    Attributes
+    ----------
+    frame_sz : length of a stroke (unit samples)
+
+    hop : distance between two stroke beginnings (unit samples)
+
+    first_onset : beginning of the first stroke (unit samples)
+    """
+
+    def __init__(self, frame_sz, hop, first_onset=0, dtype=None):
+        """Strokes are frame_sz long and start every hop samples."""
+        self.frame_sz = frame_sz
+        self.hop = hop
+        self.next_onset = first_onset
+        # buffer holds the samples from buffer_start on
+        self.buffer = np.empty(0, dtype=precision.resolve_dtype(dtype))
+        self.buffer_start = 0
+
+    def skip(self, nsamples):
+        """Account for nsamples lost between two pushed blocks.
+
+        The strokes running into the gap are dropped and the next ones
+        start on the hop grid after it, so the onsets keep their position
+        in the stream.
+        """
+        if nsamples <= 0:
+            return
+        self.buffer_start += len(self.buffer) + nsamples
+        self.buffer = self.buffer[:0]
+        if self.next_onset < self.buffer_start:
+            nhops = -(-(self.buffer_start - self.next_onset)//self.hop)
+            self.next_onset += nhops*self.hop
+
+    def push(self, block):
+        """Return (onset_samples, strokes) completed by block."""
+        self.buffer = np.concatenate((self.buffer, block))
+        buffer_end = self.buffer_start + len(self.buffer)
+        onsets = np.arange(self.next_onset, buffer_end - self.frame_sz + 1,
+                           self.hop)
+        strokes = framing.stroke_frames(self.buffer,
+                                        onsets - self.buffer_start,
+                                        self.frame_sz)
+        if len(onsets):
+            self.next_onset = onsets[-1] + self.hop
+        # Keeping only the samples needed by the next strokes
+        keep_from = min(self.next_onset, buffer_end) - self.buffer_start
+        if keep_from > 0:
+            # strokes are views of the old buffer, which is left untouched
+            self.buffer = self.buffer[keep_from:].copy()
+            self.buffer_start += keep_from
+        return onsets, strokes
+
+
+class OnsetFramer(object):
+    """Cut a stream into strokes starting at incrementally detected onsets.
+
+    An onset is where the signal peak of a hop-long frame rises above the
+    threshold.  As in audio_sample.find_onsets, onsets closer than min_gap
+    to the previous onset are ignored.
+
+    Attributes
+    ----------
+    frame_sz : length of a stroke (unit samples)
+
+    min_gap : minimum distance between two onsets (unit samples)
+
+    threshold : amplitude above which the signal is loud
+
+    hop : analysis frame length (unit samples)
+    """
+
+    def __init__(self, frame_sz, min_gap, threshold=0.05, hop=512,
+                 dtype=None):
+        """Nothing is detected before the first push."""
+        self.frame_sz = frame_sz
+        self.min_gap = min_gap
+        self.threshold = threshold
+        self.hop = hop
+        self.buffer = np.empty(0, dtype=precision.resolve_dtype(dtype))
+        self.buffer_start = 0
+        self.analysed = 0
+        self.was_loud = False
+        self.last_onset = None
+        self.pending = []
+
+    def _detect(self):
+        """Add the onsets of the complete frames to self.pending."""
+        buffer_end = self.buffer_start + len(self.buffer)
+        nframes = (buffer_end - self.analysed)//self.hop
+        if nframes == 0:
+            return
+        start = self.analysed - self.buffer_start
+        frames = np.abs(self.buffer[start:start + nframes*self.hop]).reshape(
+            nframes, self.hop) > self.threshold
+        loud = frames.any(axis=1)
+        previous = np.concatenate(([self.was_loud], loud[:-1]))
+        for iframe in np.flatnonzero(loud & ~previous):
+            ionset = (self.analysed + iframe*self.hop +
+                      np.argmax(frames[iframe]))
+            if (self.last_onset is None or
+                    ionset - self.last_onset >= self.min_gap):
+                self.pending.append(ionset)
+                self.last_onset = ionset
+        self.was_loud = loud[-1]
+        self.analysed += nframes*self.hop
+
+    def skip(self, nsamples):
+        """Account for nsamples lost between two pushed blocks.
+
+        The strokes running into the gap are dropped and the detection
+        starts again after it, so the next onsets keep their position in
+        the stream.
+        """
+        if nsamples <= 0:
+            return
+        buffer_end = self.buffer_start + len(self.buffer)
+        self.buffer = self.buffer[:0]
+        self.buffer_start = self.analysed = buffer_end + nsamples
+        self.pending = []
+        self.was_loud = False
+
+    def push(self, block):
+        """Return (onset_samples, strokes) completed by block."""
+        self.buffer = np.concatenate((self.buffer, block))
+        self._detect()
+        buffer_end = self.buffer_start + len(self.buffer)
+        ncomplete = 0
+        while (ncomplete < len(self.pending) and
+               self.pending[ncomplete] + self.frame_sz <= buffer_end):
+            ncomplete += 1
+        onsets = np.array(self.pending[:ncomplete], dtype=int)
+        self.pending = self.pending[ncomplete:]
+        strokes = framing.stroke_frames(self.buffer,
+                                        onsets - self.buffer_start,
+                                        self.frame_sz)
+        # Keeping only the samples needed by the next strokes
+        keep_from = self.analysed
+        if self.pending:
+            keep_from = min(keep_from, self.pending[0])
+        keep_from -= self.buffer_start
+        if keep_from > 0:
+            self.buffer = self.buffer[keep_from:].copy()
+            self.buffer_start += keep_from
+        return onsets, strokes
+
+
+def stream_strokes(audio_fname, good_range=None, **kwargs):
+    """Yield (onset_samples, strokes) of the audio file, block by block.
+
+    The strokes are regular windows as in
+    audio_sample.set_fake_regular_offsets (onset detection needs the
+    whole signal).
+
+    Parameters
+    ----------
+    audio_fname : path of the audio file
+
+    good_range : (start, end) samples to keep, as in audio_sample
+
+    win_wd : window width (unit seconds)
+
+    win_gap : gap length between windows (unit seconds), negative for
+        overlapping windows
+
+    win_hop : distance between two window beginnings (unit seconds),
+        win_wd + win_gap by default
+
+    stroke_length : length of the strokes cut at each window (unit seconds)
+
+    block_size : number of samples decoded at once
+
+    dtype : precision of the samples (float32 by default, see precision)
+
+    sampling_rate : analysis rate, see stream_rate
+
+    channels : only 'mix' (the channels are averaged) is supported
+
+    last_stroke : only 'drop' is supported
+
+    Clipping keywords (clip_start, clip_end, clip_mode, audio_thd,
+    beginning_buffer) are the same as audio_sample's, see EdgeClipper for
+    the supported clip modes.
+    """
+    sampling_rate = stream_rate(audio_fname, kwargs.get('sampling_rate',
+                                                        None))
+    if kwargs.get('channels', 'mix') != 'mix':
+        raise ValueError('Streaming only supports mixed channels')
+    if kwargs.get('last_stroke', 'drop') != 'drop':
+        raise ValueError('Streaming only supports last_stroke drop, not '
+                         '{}'.format(kwargs['last_stroke']))
+    block_size = kwargs.get('block_size', 2**16)
+    win_wd = kwargs.get('win_wd', 0.5)
+    win_gap = kwargs.get('win_gap', 0)
+    win_hop = kwargs.get('win_hop', None)
+    if win_hop is None:
+        win_hop = win_wd + win_gap
+    stroke_length = kwargs.get('stroke_length', 0.5)
+    beginning_buffer = kwargs.get('beginning_buffer', 1)
+    dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+
+    trimmer = RangeTrimmer(good_range, dtype)
+    clipper = EdgeClipper(**dict(kwargs, sampling_rate=sampling_rate))
+    hop = int(win_hop*sampling_rate)
+    if hop <= 0:
+        raise ValueError('The window hop should be positive, not {} '
+                         'seconds'.format(win_hop))
+    # as set_fake_regular_offsets, windows too close to the beginning are
+    # excluded
+    buffer_sz = int(beginning_buffer*sampling_rate)
+    first_onset = hop*(buffer_sz//hop + 1)
+    framer = StrokeFramer(int(stroke_length*sampling_rate), hop, first_onset,
+                          dtype)
+
+    def clipped_blocks():
+        for block in read_blocks(audio_fname, block_size, sampling_rate,
+                                 dtype):
+            yield clipper.push(trimmer.push(block))
+        yield clipper.flush()
+
+    for block in clipped_blocks():
+        if len(block) == 0:
+            continue
+        onsets, strokes = framer.push(block)
+        if len(onsets):
+            yield onsets, strokes
+
+
+def stream_features(audio_fname, good_range=None, **kwargs):
+    """Return the feature dict of the audio file, processed block by block.
+
+    Same result as audio_sample.get_features after
+    set_fake_regular_offsets, see stream_strokes for the keyword
+    arguments.  feature_names selects the computed features and quality
+    the criteria of quality.QualityGate.
+    """
+    extractor = kwargs.get('feature_extractor', None)
+    if extractor is None:
+        extractor = features.FeatureExtractor(
+            sampling_rate=stream_rate(audio_fname,
+                                      kwargs.get('sampling_rate', None)),
+            feature_names=tuple(kwargs.get('feature_names',
+                                           features.FEATURE_NAMES)),
+            dtype=kwargs.get('dtype', None))
+    gate = quality.QualityGate(**kwargs.get('quality', {}))
+    tables = [np.empty((0, len(extractor.feature_names)),
+                       dtype=extractor.dtype)]
+    onset_samples = [np.empty(0, dtype=int)]
+    for onsets, strokes in stream_strokes(audio_fname, good_range, **kwargs):
+        good_strokes = gate.mask(strokes)
+        tables.append(extractor.feature_table(strokes, good_strokes))
+        onset_samples.append(onsets[good_strokes])
+    return {'feature_names': extractor.feature_names,
+            'feature_table': np.vstack(tables),
+            'onset_samples': np.concatenate(onset_samples)}
+
+
+class StrokeAnalyzer(object):
+    """Evaluate stroke features of a live recording on a background thread.
+
+    Raw PCM buffers are pushed without ever blocking the caller (if the
+    analysis lags behind, buffers are dropped from the analysis and
+    counted in dropped_buffers, and the onsets after them still count the
+    dropped samples).  For each batch of new strokes, a dict
+    with onset_samples, onset_times, feature_names and feature_table is
+    passed to the callback and/or put in the result queue.
+
+    Attributes
+    ----------
+    sampling_rate : frequency of the recording
+
+    channels : number of interleaved channels of the buffers
+
+    dropped_buffers : number of buffers not analysed
+
+    dropped_samples : number of samples of these buffers
+    """
+
+    def __init__(self, **kwargs):
+        """Parameters are the same as audio_sample's (stroke_length...)."""
+        self.sampling_rate = kwargs.get('sampling_rate', 44100)
+        self.channels = kwargs.get('channels', 1)
+        self.callback = kwargs.get('callback', None)
+        self.results = kwargs.get('results', None)
+        stroke_length = kwargs.get('stroke_length', 0.5)
+        self.dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+        self.framer = OnsetFramer(
+            int(stroke_length*self.sampling_rate),
+            int(2*stroke_length*self.sampling_rate),
+            threshold=kwargs.get('audio_thd', 0.05), dtype=self.dtype)
+        self.extractor = features.FeatureExtractor(
+            sampling_rate=self.sampling_rate,
+            feature_names=tuple(kwargs.get('feature_names',
+                                           features.FEATURE_NAMES)),
+            dtype=self.dtype)
+        self.quality_gate = quality.QualityGate(**kwargs.get('quality', {}))
+        self.buffers = queue.Queue(kwargs.get('max_buffers', 256))
+        self.dropped_buffers = 0
+        self.dropped_samples = 0
+        # samples dropped since the last queued buffer
+        self._gap = 0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        """Start the analysis thread."""
+        self.thread.start()
+
+    def push(self, data):
+        """Queue a buffer of 16-bit PCM bytes, never blocks."""
+        try:
+            self.buffers.put_nowait((self._gap, data))
+            self._gap = 0
+        except queue.Full:
+            nsamples = len(data)//(2*self.channels)
+            self.dropped_buffers += 1
+            self.dropped_samples += nsamples
+            self._gap += nsamples
+
+    def stop(self):
+        """Analyse the queued buffers and stop the thread."""
+        self.buffers.put(None)
+        self.thread.join()
+
+    def _run(self):
+        """Consume the buffers until stop is called."""
+        while True:
+            item = self.buffers.get()
+            if item is None:
+                break
+            gap, data = item
+            self.framer.skip(gap)
+            block = np.frombuffer(data, dtype='<i2').astype(self.dtype)
+            if self.channels > 1:
+                block = block.reshape(-1, self.channels).mean(axis=1)
+            block /= 2**15
+            onsets, strokes = self.framer.push(block)
+            if len(onsets) == 0:
+                continue
+            good_strokes = self.quality_gate.mask(strokes)
+            result = {
+                'onset_samples': onsets[good_strokes],
+                'onset_times': onsets[good_strokes]/self.sampling_rate,
+                'feature_names': self.extractor.feature_names,
+                'feature_table': self.extractor.feature_table(
+                    strokes, good_strokes)}
+            if self.callback is not None:
+                self.callback(result)
+            if self.results is not None:
+                self.results.put(result)
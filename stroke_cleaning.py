@@ -1,16 +1,24 @@
 from __future__ import division
-import matplotlib.pyplot as plt
 import numpy as np
 import os
 
-# Audio information retrieval
-import essentia.standard as ess
-from essentia.standard import MonoLoader
-from essentia.standard import Centroid, Spectrum, Windowing
+# essentia (audio information retrieval) and matplotlib are imported by
+# the methods using them, so that feature extraction does not load
+# matplotlib and importing this module stays fast
 
-# Classifier and feature processing
-from sklearn import preprocessing
-from sklearn.cluster import KMeans
+# This project
+import clipping
+import features
+import framing
+import onsets
+import overview
+import precision
+import quality
+import wavfile
+from instrumentation import NULL_INSTRUMENT
+
+# rate at which essentia's OnsetRate works
+ESSENTIA_RATE = 44100
 
 
 class audio_sample():
@@ -24,7 +32,10 @@ class audio_sample():
 
     audio_fname : path of the audio file
 
-    audio : numpy array of the audio signal
+    audio : numpy array of the audio signal (channels averaged)
+
+    channel_audio : (n_samples, n_channels) array of the channels when
+        they are analysed separately, else None
     """
 
     def __init__(self, audio_fname, good_range=None, **kwargs):
@@ -32,96 +43,244 @@ class audio_sample():
         Load the audio file and determin the features
         """
         # Some parameters
-        self.sampling_rate = 44100  # This is essentia's default
+        # None to analyse the file at its own rate, otherwise it is
+        # resampled (once if decoded_cache is an audio_cache.DecodedCache)
+        self.sampling_rate = kwargs.get('sampling_rate', None)
+        # 'mix' to average the channels, 'separate' for the features of
+        # every channel (at the onsets of the mix)
+        self.channels = kwargs.get('channels', 'mix')
+        if self.channels not in ('mix', 'separate'):
+            raise ValueError('channels should be mix or separate, not {}'
+                             .format(self.channels))
         self.stroke_length = kwargs.get('stroke_length', 0.5)  # In seconds
         self.clip_start = kwargs.get('clip_start', True)  # In seconds
         self.clip_end = kwargs.get('clip_end', True)  # In seconds
+        # 'amplitude', 'envelope' or 'rms', see clipping.loud_mask
+        self.clip_mode = kwargs.get('clip_mode', 'amplitude')
+        # Strokes running past the end of the audio are dropped or padded
+        self.last_stroke = kwargs.get('last_stroke', 'drop')
+        # 'rate' for essentia's OnsetRate, else detection functions of
+        # onsets.OnsetDetector (e.g. 'flux' or ('flux', 'complex'))
+        self.onset_method = kwargs.get('onset_method', 'rate')
+        # Criteria of the stroke quality gate, see quality.QualityGate
+        self.quality_gate = quality.QualityGate(**kwargs.get('quality', {}))
+        # Precision of the audio, strokes and features, see precision
+        self.dtype = precision.resolve_dtype(kwargs.get('dtype', None))
+        # Stage timers and counters, see instrumentation.Instrument
+        self.instrument = kwargs.get('instrument', NULL_INSTRUMENT).child(
+            audio_fname=audio_fname)
 
         # Getting the audio signal
         self.audio_fname = audio_fname
-        # Following is an audio signal sampled in 44100Hz (essentia default)
-        self.audio = MonoLoader(filename=audio_fname)()
+        # PCM WAV files at the analysis rate (the recorder output) are
+        # memory mapped
+        with self.instrument.stage('load'):
+            channel_audio, self.sampling_rate = wavfile.open_audio(
+                audio_fname, self.sampling_rate, self.dtype,
+                kwargs.get('decoded_cache', None))
+        self.instrument.count('samples_decoded', len(channel_audio))
+        self.audio = wavfile.mix_channels(channel_audio)
+        self.channel_audio = None
+        if self.channels == 'separate':
+            self.channel_audio = channel_audio
 
         # Cleaning edges
         try:
             self.audio = self.audio[good_range[0]:good_range[1]]
+            if self.channel_audio is not None:
+                self.channel_audio = self.channel_audio[
+                    good_range[0]:good_range[1]]
         except:
             pass
 
         # clipping
         self.audio_thd = 0.05
         self.beginning_buffer = 1 # in seconds
-        if self.clip_start:
-            clipped_start = np.argmax(self.audio>self.audio_thd) - self.beginning_buffer*self.sampling_rate
-            clipped_start = max(0, clipped_start)
-            self.audio = self.audio[clipped_start:-1]
-
-        if self.clip_end:
-            reversed_audio = self.audio[::-1]
-            clipped_end = len(reversed_audio) - np.argmax(reversed_audio>self.audio_thd) - 1 + self.beginning_buffer*self.sampling_rate
-            self.audio = self.audio[:clipped_end]
+        self.clip_audio()
+        # a memory mapped file is only read (and scaled) here
+        self.audio = precision.check_dtype(np.asarray(self.audio),
+                                           self.dtype, 'audio')
+        if self.channel_audio is not None:
+            self.channel_audio = precision.check_dtype(
+                np.asarray(self.channel_audio), self.dtype, 'channel_audio')
 
         # Some parameter that will be defined by signal processing
         self.onset_times = False  # In seconds
         self.onset_samples = False  # As sample number in the audio sampling
+        self.onset_detector = None
         self.strokes = False
+        # channel of each stroke when the channels are separate
+        self.stroke_channels = None
         self.stroke_df = False
         self.feature_table = False
+        self._overview = None
+        # (strokes, mask, rejections) of the last quality gate evaluation
+        self._quality = None
+        self.feature_extractor = features.FeatureExtractor(
+            sampling_rate=self.sampling_rate, dtype=self.dtype,
+            instrument=self.instrument)
+
+    def clip_audio(self):
+        """Remove the quiet beginning and end of the audio signal."""
+        with self.instrument.stage('clip'):
+            clipped_start, clipped_end = clipping.clip_bounds(
+                self.audio, self.audio_thd,
+                int(self.beginning_buffer*self.sampling_rate),
+                clip_start=self.clip_start, clip_end=self.clip_end,
+                mode=self.clip_mode)
+            self.audio = self.audio[clipped_start:clipped_end]
+            if self.channel_audio is not None:
+                self.channel_audio = self.channel_audio[
+                    clipped_start:clipped_end]
+        self.instrument.count('samples_clipped', len(self.audio))
 
-    def set_fake_regular_offsets(self, win_wd, win_gap=0):
-        """Fill offsets with regular times.
+    def set_fake_regular_offsets(self, win_wd, win_gap=0, win_hop=None):
+        """Fill offsets with regular times and cut the strokes.
+
+        The strokes (stroke_length long, see isolate_strokes) are a
+        strided view of the audio: overlapping windows cost no copy.
 
         Parameters
         ----------
         win_wd : window width (unit seconds)
 
-        win_gap : gap length between windows (unit seconds)
+        win_gap : gap length between windows (unit seconds), negative
+            for overlapping windows
+
+        win_hop : distance between two window beginnings (unit seconds),
+            win_wd + win_gap by default; the windows overlap when it is
+            shorter than stroke_length
 
         """
-        sample_onset = int((win_wd + win_gap)*self.sampling_rate)
-        self.onset_samples = range(0, len(self.audio), sample_onset)
+        if win_hop is None:
+            win_hop = win_wd + win_gap
+        hop = int(win_hop*self.sampling_rate)
+        if hop <= 0:
+            raise ValueError('The window hop should be positive, not {} '
+                             'seconds'.format(win_hop))
         # excluding windows that are too close to the beginning
-        self.onset_samples = [x for x in self.onset_samples if x > self.beginning_buffer]
-        self.onset_times = [x/self.sampling_rate for x in self.onset_samples]
+        buffer_sz = int(self.beginning_buffer*self.sampling_rate)
+        first_onset = hop*(buffer_sz//hop + 1)
+        self.onset_samples = np.arange(first_onset, len(self.audio), hop)
+        self.onset_times = self.onset_samples/self.sampling_rate
+        self.isolate_strokes()
 
     def find_onsets(self):
-        """Find and save stroke beginning"""
-        get_onsets = ess.OnsetRate()
-        # onset_times is np array
-        self.onset_times, onset_rate = get_onsets(self.audio)
-        # Onset as sample number in the audio signal
-        index2delete = []
-        previous_time = -9999999
-        for index, itime in enumerate(self.onset_times):
-            if (itime - previous_time) < 2*self.stroke_length:
-                index2delete.append(index)
+        """Find and save stroke beginning
+
+        Onsets closer than 2*stroke_length to the previous one are
+        dropped, onset_samples is an int array.
+        """
+        min_gap = 2*self.stroke_length
+        with self.instrument.stage('find_onsets'):
+            if self.onset_method == 'rate':
+                import essentia.standard as ess
+                get_onsets = ess.OnsetRate()
+                # onset_times is np array, essentia only takes float32
+                onset_times, onset_rate = get_onsets(
+                    self.audio.astype(np.float32, copy=False))
+                # OnsetRate takes any signal for a 44100Hz one
+                onset_times = onset_times*ESSENTIA_RATE/self.sampling_rate
+                self.onset_times = onsets.suppress_close_onsets(onset_times,
+                                                                min_gap)
+                self.onset_samples = (self.sampling_rate *
+                                      self.onset_times).astype(int)
             else:
-                previous_time = itime
-        self.onset_times = np.delete(self.onset_times, index2delete)
-        self.onset_samples = [int(self.sampling_rate*i) for i in self.onset_times]
+                methods = self.onset_method
+                if isinstance(methods, str):
+                    methods = (methods,)
+                self.onset_detector = onsets.OnsetDetector(
+                    sampling_rate=self.sampling_rate, methods=methods)
+                self.onset_samples = self.onset_detector.onsets(self.audio,
+                                                                min_gap)
+                self.onset_times = self.onset_samples/self.sampling_rate
+        self.instrument.count('onsets_found', len(self.onset_samples))
 
     def isolate_strokes(self):
-        """Fill self.strokes dictionary of signal strokes."""
+        """Fill self.strokes, the 2-D read-only array of signal strokes.
+
+        self.strokes is a view of self.audio when the onsets are regular,
+        see framing.stroke_frames.  When the channels are separate, the
+        strokes of every channel (cut at the same onsets) are copied one
+        channel after the other in self.strokes, so that all of them go
+        through the features in one pass, and self.stroke_channels holds
+        the channel of each stroke.
+        """
         if self.onset_times is False:
             self.find_onsets()
         # Defining the frame to contain the strokes
         frame_sz = int(self.stroke_length*self.sampling_rate)
-        self.strokes = np.array(
-            [self.audio[i:i+frame_sz] for i in self.onset_samples])
+        with self.instrument.stage('isolate_strokes'):
+            if self.channel_audio is None:
+                self.strokes = framing.stroke_frames(
+                    self.audio, self.onset_samples, frame_sz,
+                    self.last_stroke)
+            else:
+                nchannels = self.channel_audio.shape[1]
+                strokes = [framing.stroke_frames(
+                    self.channel_audio[:, ichannel], self.onset_samples,
+                    frame_sz, self.last_stroke)
+                           for ichannel in range(nchannels)]
+                self.strokes = np.concatenate(strokes)
+                self.strokes.flags.writeable = False
+                self.stroke_channels = np.repeat(np.arange(nchannels),
+                                                 len(strokes[0]))
+        precision.check_dtype(self.strokes, self.dtype, 'strokes')
+        self.instrument.count('strokes_found', len(self.strokes))
 
     def isGoodFrame(self, frame):
         """True if frame passes some quality test."""
-        if max(frame)<0.1:
-            return False
-        return True
+        return bool(self.quality_gate.mask(np.asarray(frame)[np.newaxis])[0])
+
+    def good_strokes_mask(self):
+        """Return the boolean mask of the strokes passing the quality gate.
+
+        The mask is computed once for the current strokes.
+        """
+        if self._quality is None or self._quality[0] is not self.strokes:
+            with self.instrument.stage('quality_gate'):
+                mask, rejections = self.quality_gate.evaluate(self.strokes)
+            self._quality = (self.strokes, mask, rejections)
+            self.instrument.count('strokes_rejected',
+                                  int(len(mask) - np.count_nonzero(mask)))
+            for icriterion, icount in rejections.items():
+                self.instrument.count(
+                    'strokes_rejected:{}'.format(icriterion), icount)
+        return self._quality[1]
+
+    def good_onsets_mask(self):
+        """Return the boolean mask of the onsets with a good stroke.
+
+        When the channels are separate, there is one stroke per channel
+        at each onset (see isolate_strokes) and an onset is good if one of
+        them passes the quality gate.
+        """
+        good_strokes = self.good_strokes_mask()
+        if self.stroke_channels is None:
+            return good_strokes
+        return np.any([good_strokes[self.stroke_channels == ichannel]
+                       for ichannel in np.unique(self.stroke_channels)],
+                      axis=0)
+
+    def quality_report(self):
+        """Return dict with the number of strokes, of good strokes and of
+        strokes rejected by each criterion (see quality.QualityGate)."""
+        mask = self.good_strokes_mask()
+        return {'strokes': len(mask),
+                'good_strokes': int(np.count_nonzero(mask)),
+                'rejected': dict(self._quality[2])}
 
     def extract_features_from_frame(self, frame):
         """ Return dictionary of features for the given frame."""
+        import essentia.standard as ess
+        from essentia.standard import Centroid, Windowing
         centroid = Centroid(range=22050)
         hamming_window = Windowing(type='hamming')
         zcr = ess.ZeroCrossingRate()
         spectrum = ess.Spectrum()
         central_moments = ess.CentralMoments()
+        # essentia only takes float32 (the dtype may be float64)
+        frame = np.asarray(frame, dtype=np.float32)
         # Spectrum can only compute FFT of array of even size (don't know why)
         if len(frame) % 2 == 1:
             frame = frame[:-1]
@@ -140,30 +299,60 @@ class audio_sample():
             feat_dic['sm{}'.format(idx)] = ism
         return feat_dic
 
-    def get_features(self):
-        """Return a feature table from the strokes."""
+    def get_features(self, feature_names=None):
+        """Return a feature table from the strokes.
+
+        Only the feature_names columns are computed (all of
+        features.FEATURE_NAMES by default), see features.REGISTRY.
+
+        The returned dict also holds the onset_samples of the strokes of
+        the table (the strokes passing the quality gate, see
+        good_strokes_mask), and their channels when the channels are
+        separate.
+
+        All the good strokes are processed in one batch, see
+        features.FeatureExtractor (extract_features_from_frame is the
+        per-stroke equivalent).
+        """
         if self.strokes is False:
             print('Isolating strokes')
             self.isolate_strokes()
-        # List of features to use (sm1 omitted because always nan)
-        feature_names = ('zrc', 'centroid',
-                         'cm0', 'cm1', 'cm2', 'cm3', 'cm4',
-                         'sm0', 'sm2')
-        features_list = []
-        for istroke in self.strokes:
-            if not self.isGoodFrame(istroke):
-                continue
-            ifeature_dic = self.extract_features_from_frame(istroke)
-            ifeature_list = []
-            for ifeature in feature_names:
-                ifeature_list.append(ifeature_dic[ifeature])
-            features_list.append(ifeature_list)
-        return {'feature_names': feature_names,
-                'feature_table': np.array(features_list)}
+        good_strokes = self.good_strokes_mask()
+        with self.instrument.stage('get_features'):
+            if feature_names is None:
+                feature_names = self.feature_extractor.feature_names
+            feature_names = tuple(feature_names)
+            feature_table = self.feature_extractor.feature_table(
+                self.strokes, good_strokes, feature_names)
+        nchannels = 1
+        if self.stroke_channels is not None:
+            nchannels = self.channel_audio.shape[1]
+        onset_samples = np.asarray(self.onset_samples, dtype=int)[
+            :len(self.strokes)//nchannels]
+        feature_dic = {'feature_names': feature_names,
+                       'feature_table': feature_table,
+                       'onset_samples': np.tile(onset_samples,
+                                                nchannels)[good_strokes]}
+        if self.stroke_channels is not None:
+            feature_dic['channels'] = self.stroke_channels[good_strokes]
+        return feature_dic
+
+    def overview(self):
+        """Return the (cached) overview.WaveformOverview of the audio."""
+        if self._overview is None or self._overview.audio is not self.audio:
+            self._overview = overview.WaveformOverview(self.audio)
+        return self._overview
 
     def plot_signal(self, **kwargs):
-        """plot audio signal."""
+        """plot audio signal.
+
+        The min/max envelope of the signal is drawn with about max_points
+        points (see overview.WaveformOverview) and redrawn at the matching
+        resolution when zooming.
+        """
+        import matplotlib.pyplot as plt
         label = kwargs.get('label', None)
+        max_points = kwargs.get('max_points', 4000)
         # Calculate strokes if requested
         with_strokes = kwargs.get("with_strokes", False)
         x_axis_type = kwargs.get("x_axis_type", 'time')
@@ -171,29 +360,41 @@ class audio_sample():
             self.isolate_strokes()
 
         # Plot signal
-        nsamples = len(self.audio)
-        print nsamples
-        x_axis = np.arange(0, nsamples)
+        x_scale = 1
         if x_axis_type == 'time':
-            x_axis = x_axis/self.sampling_rate
-        plt.plot(x_axis, self.audio, color='b')
+            x_scale = 1/self.sampling_rate
+        waveform = self.overview()
+        positions, values = waveform.envelope(max_points=max_points)
+        ax = plt.gca()
+        line, = ax.plot(positions*x_scale, values, color='b', label=label)
         plt.xlabel(x_axis_type)
 
+        def update_envelope(ax):
+            """Draw the visible range at the matching resolution."""
+            xmin, xmax = ax.get_xlim()
+            positions, values = waveform.envelope(
+                xmin/x_scale, xmax/x_scale, max_points)
+            line.set_data(positions*x_scale, values)
+        ax.callbacks.connect('xlim_changed', update_envelope)
+
         # Add strokes if availables
         if self.onset_samples is not False:
             print('Plotting strokes')
             onsets = self.onset_samples
             if x_axis_type == 'time':
                 onsets = self.onset_times
-            for istroke_start, istroke in zip(onsets, self.strokes):
-                if not self.isGoodFrame(istroke):
-                    continue
-                plt.axvline(istroke_start, color='r', alpha=0.2)
+            good_strokes = self.good_onsets_mask()
+            nstrokes = min(len(onsets), len(good_strokes))
+            good_strokes = good_strokes[:nstrokes]
+            ax.vlines(np.asarray(onsets)[:nstrokes][good_strokes], 0, 1,
+                      transform=ax.get_xaxis_transform(), color='r',
+                      alpha=0.2)
 
     def show_strokes(self):
         """
         plots the isolated stroke signal
         """
+        import matplotlib.pyplot as plt
         assert(self.strokes is not False)
         fig = plt.figure()
         for istroke in range(self.strokes.shape[0]):
@@ -203,6 +404,7 @@ class audio_sample():
         raw_input('press enter when finished...')
 
 if __name__=='__main__':
+    import matplotlib.pyplot as plt
     audio_dir = "/Users/jean-francoisrajotte/myaudio/alto_recordings/"
     #testaudio = audio_sample('/Users/jean-francoisrajotte/myaudio/marina.m4a')
     #testaudio = audio_sample('/Users/jean-francoisrajotte/myaudio/jfraj.m4a',(95000, -400000))
@@ -222,4 +424,4 @@ if __name__=='__main__':
     fig.show()
     raw_input('ok...')
     #testaudio.show_strokes()
-    print testaudio.get_features()
+    print(testaudio.get_features())
@@ -0,0 +1,7 @@
+"""The modules of this project are top level modules of the parent
+directory."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
@@ -0,0 +1,39 @@
+import os
+import numpy as np
+
+import audio_cache
+
+
+def _write(fname, value, mtime):
+    with open(fname, 'w') as audio_file:
+        audio_file.write(value)
+    os.utime(fname, (mtime, mtime))
+
+
+def test_put_removes_previous_versions(tmpdir):
+    fname = str(tmpdir.join('a.m4a'))
+    cache = audio_cache.DecodedCache(str(tmpdir.join('cache')))
+    audio = np.zeros((100, 1), dtype=np.float32)
+    _write(fname, 'first', 1000)
+    cache.put(fname, 44100, audio, 44100)
+    _write(fname, 'second', 2000)
+    assert cache.get(fname, 44100, np.float32) is None
+    cache.put(fname, 44100, audio, 44100)
+    assert len(cache.entries()) == 1
+    assert cache.get(fname, 44100, np.float32) is not None
+
+
+def test_evict_least_recently_used(tmpdir):
+    audio = np.zeros((1000, 1), dtype=np.float32)
+    cache = audio_cache.DecodedCache(str(tmpdir.join('cache')),
+                                     max_size=2*audio.nbytes + 1000)
+    fnames = [str(tmpdir.join('{}.m4a'.format(i))) for i in range(3)]
+    for i, ifname in enumerate(fnames):
+        _write(ifname, ifname, 1000)
+        cache.put(ifname, None, audio, 44100)
+        info_path = os.path.join(cache.cache_dir, '{}.json'.format(
+            cache.key(ifname, None, np.float32)))
+        os.utime(info_path, (1000 + i, 1000 + i))
+    assert len(cache.entries()) == 2
+    assert cache.get(fnames[0], None, np.float32) is None
+    assert cache.get(fnames[2], None, np.float32) is not None
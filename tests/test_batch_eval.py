@@ -0,0 +1,34 @@
+import pytest
+
+import batch_eval
+import benchmark
+
+
+def test_changed_goodrange_is_processed_again(tmpdir):
+    sessions = []
+    for iname in ('a', 'b'):
+        fname = str(tmpdir.join('{}.wav'.format(iname)))
+        benchmark.write_wav(fname, benchmark.synthetic_strokes(6, 1))
+        sessions.append({'path': fname, 'goodrange': None})
+    output = str(tmpdir.join('output'))
+    kwargs = {'processes': 1, 'fake_stroke_onset': 0.5}
+    batch_eval.run_batch(sessions, output, **kwargs)
+    first = batch_eval.load_results(output).metadata('file')
+
+    sessions[0]['goodrange'] = (0, 3*44100)
+    progress = batch_eval.run_batch(sessions, output, **kwargs)
+    assert progress.goodranges[sessions[0]['path']] == [0, 3*44100]
+    files = batch_eval.load_results(output).metadata('file')
+    # a is only in its new part, with fewer strokes, b is unchanged
+    assert 0 < files.count(sessions[0]['path']) < first.count(
+        sessions[0]['path'])
+    assert files.count(sessions[1]['path']) == first.count(
+        sessions[1]['path'])
+    # nothing left to do
+    progress = batch_eval.run_batch(sessions, output, **kwargs)
+    assert len(progress.parts) == 2
+
+
+def test_missing_manifest(tmpdir):
+    with pytest.raises(IOError):
+        batch_eval.manifest_sessions(str(tmpdir.join('does_not_exist.csv')))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import feature_store
+
+pytest.importorskip('sklearn')
+import classification  # noqa: E402
+
+FEATURE_NAMES = ('zrc', 'centroid')
+
+
+def two_groups(nstrokes=200, seed=0):
+    """Return a table of two well separated groups and their labels."""
+    random_state = np.random.RandomState(seed)
+    labels = np.repeat(['marina', 'jfraj'], nstrokes//2)
+    centers = np.where(labels[:, np.newaxis] == 'marina', 0., 10.)
+    return centers + random_state.randn(nstrokes, 2), labels
+
+
+def test_not_fitted():
+    model = classification.IncrementalModel(FEATURE_NAMES)
+    assert not model.is_fitted
+    with pytest.raises(ValueError):
+        model.predict(np.zeros((1, 2)))
+
+
+def test_clusters_from_small_batches():
+    table, labels = two_groups()
+    order = np.random.RandomState(1).permutation(len(table))
+    table, labels = table[order], labels[order]
+    # the first batch is smaller than n_clusters and is kept for later
+    model = classification.IncrementalModel(FEATURE_NAMES, batch_size=16,
+                                            random_state=0)
+    model.partial_fit(table[:1])
+    assert not model.is_fitted
+    model.partial_fit(table[1:])
+    assert model.is_fitted
+    assert model.n_samples_seen == len(table)
+    clusters = model.predict(table)
+    # one cluster per group
+    for ilabel in ('marina', 'jfraj'):
+        assert len(set(clusters[labels == ilabel])) == 1
+    assert clusters[labels == 'marina'][0] != clusters[labels == 'jfraj'][0]
+    assert model.score_strokes(table).shape == (len(table),)
+    # the columns are reordered by name
+    np.testing.assert_array_equal(
+        model.predict(table[:, ::-1], FEATURE_NAMES[::-1]), clusters)
+
+
+def test_classifier_and_pickle(tmpdir):
+    table, labels = two_groups()
+    with pytest.raises(ValueError):
+        classification.IncrementalModel(FEATURE_NAMES, kind='classifier')
+    model = classification.IncrementalModel(
+        FEATURE_NAMES, kind='classifier', classes=['marina', 'jfraj'],
+        batch_size=32, random_state=0)
+    for _ in range(5):
+        model.partial_fit(table, labels)
+    assert (model.predict(table) == labels).mean() > 0.95
+    fname = str(tmpdir.join('model.pkl'))
+    model.save(fname)
+    loaded = classification.load_or_create(fname, FEATURE_NAMES)
+    np.testing.assert_array_equal(loaded.predict(table),
+                                  model.predict(table))
+    with pytest.raises(ValueError):
+        classification.load_or_create(fname, FEATURE_NAMES[::-1])
+
+
+def test_update_from_sessions():
+    table, labels = two_groups()
+    store = feature_store.FeatureStore(FEATURE_NAMES)
+    for ilabel in ('marina', 'jfraj'):
+        store.append({'feature_names': FEATURE_NAMES,
+                      'feature_table': table[labels == ilabel]},
+                     file='{}.wav'.format(ilabel), player=ilabel)
+    model = classification.IncrementalModel(FEATURE_NAMES, random_state=0)
+    assert sorted(model.update_from_sessions(store)) == ['jfraj.wav',
+                                                          'marina.wav']
+    assert model.n_samples_seen == len(table)
+    assert model.update_from_sessions(store) == []
+    assert model.n_samples_seen == len(table)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import clipping
+
+
+def argmax_bounds(audio, audio_thd, buffer_sz):
+    """The original audio_sample clipping (np.argmax over the signal)."""
+    start = max(0, np.argmax(audio > audio_thd) - buffer_sz)
+    reversed_audio = audio[start:][::-1]
+    end = (len(reversed_audio) - np.argmax(reversed_audio > audio_thd) - 1 +
+           buffer_sz)
+    return start, min(len(audio), start + end)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('block_size', [64, 1000, 2**14])
+def test_matches_argmax(seed, block_size):
+    random_state = np.random.RandomState(seed)
+    audio = 0.01*random_state.randn(5000).astype(np.float32)
+    first, last = sorted(random_state.randint(0, 5000, 2))
+    audio[first] = audio[last] = 0.5
+    bounds = clipping.clip_bounds(audio, 0.05, 300, block_size=block_size)
+    assert bounds == argmax_bounds(audio, 0.05, 300)
+
+
+def test_envelope_mode_sees_negative_peaks():
+    audio = np.zeros(1000, dtype=np.float32)
+    audio[100] = -0.5
+    audio[800] = 0.5
+    assert clipping.clip_bounds(audio, 0.05, 10) == (790, 810)
+    assert clipping.clip_bounds(audio, 0.05, 10, mode='envelope') == (
+        90, 810)
+
+
+def test_rms_mode_windows():
+    audio = np.zeros(8192, dtype=np.float32)
+    audio[3000:3100] = 0.5
+    start, end = clipping.clip_bounds(audio, 0.05, 0, mode='rms',
+                                      window=1024, block_size=2048)
+    assert start == 2048
+    assert end >= 3100
+
+
+def test_quiet_signal_is_kept():
+    audio = np.zeros(1000, dtype=np.float32)
+    assert clipping.clip_bounds(audio, 0.05, 10) == (0, 1000)
+
+
+def test_clip_one_end_only():
+    audio = np.zeros(1000, dtype=np.float32)
+    audio[500] = 0.5
+    assert clipping.clip_bounds(audio, 0.05, 10, clip_start=False) == (
+        0, 510)
+    assert clipping.clip_bounds(audio, 0.05, 10, clip_end=False) == (
+        490, 1000)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        clipping.loud_mask(np.zeros(10), 0.05, mode='peak')
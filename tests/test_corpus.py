@@ -0,0 +1,41 @@
+import numpy as np
+
+import benchmark
+import corpus
+import feature_cache
+import features
+
+
+def test_feature_params_streaming():
+    batch = corpus.feature_params(None, fake_stroke_onset=0.5)
+    streamed = corpus.feature_params(None, fake_stroke_onset=0.5,
+                                     streaming=True, block_size=1024)
+    assert batch != streamed
+    assert streamed == corpus.feature_params(None, fake_stroke_onset=0.5,
+                                             streaming=True)
+
+
+def test_cached_features_serve_other_selections(tmpdir, monkeypatch):
+    fname = str(tmpdir.join('strokes.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(6, 1))
+    cache = feature_cache.FeatureCache(str(tmpdir.join('cache')))
+    kwargs = {'processes': 1, 'fake_stroke_onset': 0.5}
+    reference = dict(corpus.iter_features([fname], **kwargs))[fname]
+    calls = []
+    get_file_features = corpus.get_file_features
+
+    def counting(*args, **kwargs):
+        calls.append(kwargs['feature_names'])
+        return get_file_features(*args, **kwargs)
+    monkeypatch.setattr(corpus, 'get_file_features', counting)
+
+    for ipair in (('zrc', 'centroid'), ('sm0', 'cm0')):
+        feature_dic = dict(corpus.iter_features(
+            [fname], cache=cache, feature_names=ipair, **kwargs))[fname]
+        assert feature_dic['feature_names'] == ipair
+        columns = [features.FEATURE_NAMES.index(iname) for iname in ipair]
+        np.testing.assert_array_equal(
+            feature_dic['feature_table'],
+            reference['feature_table'][:, columns])
+    # only the first selection was computed, with all the features
+    assert calls == [features.FEATURE_NAMES]
@@ -0,0 +1,37 @@
+import json
+import os
+import numpy as np
+
+import feature_cache
+
+
+def _feature_dic():
+    return {'feature_names': ('zrc', 'centroid'),
+            'feature_table': np.ones((3, 2), dtype=np.float32),
+            'onset_samples': np.arange(3)}
+
+
+def test_put_does_not_write_index(tmpdir):
+    fname = str(tmpdir.join('a.wav'))
+    tmpdir.join('a.wav').write('audio')
+    cache = feature_cache.FeatureCache(str(tmpdir.join('cache')))
+    cache.put(fname, {'good_range': None}, _feature_dic())
+    assert not os.path.exists(cache.index_path)
+    cache.save_index()
+    with open(cache.index_path) as index_file:
+        assert len(json.load(index_file)['entries']) == 1
+    reloaded = feature_cache.FeatureCache(str(tmpdir.join('cache')))
+    assert reloaded.get(fname, {'good_range': None}) is not None
+
+
+def test_missing_stroke_array_is_a_miss(tmpdir):
+    fname = str(tmpdir.join('a.wav'))
+    tmpdir.join('a.wav').write('audio')
+    cache = feature_cache.FeatureCache(str(tmpdir.join('cache')))
+    params = {'good_range': None}
+    cache.put(fname, params, _feature_dic())
+    entry = cache.entries[cache.key(fname, params)]
+    os.remove(os.path.join(cache.cache_dir, entry['onsets']))
+    assert cache.get(fname, params) is None
+    assert cache.entries == {}
+    assert not os.path.exists(os.path.join(cache.cache_dir, entry['table']))
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import feature_store
+
+
+def _feature_dic(nrows):
+    return {'feature_names': ('zrc', 'centroid'),
+            'feature_table': np.arange(2*nrows, dtype=np.float32)
+            .reshape(nrows, 2),
+            'onset_samples': np.arange(nrows)}
+
+
+@pytest.mark.parametrize('nrows', [0, 3])
+def test_append_after_load(tmpdir, nrows):
+    store = feature_store.FeatureStore(('zrc', 'centroid'))
+    store.append(_feature_dic(4), file='a.wav', player='marina')
+    store.save(str(tmpdir))
+    loaded = feature_store.FeatureStore.load(str(tmpdir))
+    loaded.append(_feature_dic(nrows), file='b.wav', player='jf')
+    assert len(loaded) == 4 + nrows
+    np.testing.assert_array_equal(loaded.table(slice(0, 4)),
+                                  _feature_dic(4)['feature_table'])
+    np.testing.assert_array_equal(loaded.table(slice(4, None)),
+                                  _feature_dic(nrows)['feature_table'])
+    assert loaded.metadata('file') == ['a.wav']*4 + ['b.wav']*nrows
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import benchmark
+import features
+import stroke_cleaning
+
+
+def random_strokes(nstrokes, length, seed=0):
+    random_state = np.random.RandomState(seed)
+    decay = np.exp(-np.arange(length)/(0.1*length))
+    return (0.5*random_state.randn(nstrokes, length)*decay).astype(
+        np.float32)
+
+
+def test_odd_strokes_drop_the_last_sample():
+    extractor = features.FeatureExtractor()
+    strokes = random_strokes(5, 2205)
+    np.testing.assert_array_equal(extractor.feature_table(strokes),
+                                  extractor.feature_table(strokes[:, :-1]))
+
+
+def test_mask_selects_rows():
+    extractor = features.FeatureExtractor(batch_size=2)
+    strokes = random_strokes(7, 1024)
+    mask = np.array([True, False, True, True, False, False, True])
+    np.testing.assert_allclose(extractor.feature_table(strokes, mask),
+                               extractor.feature_table(strokes[mask]),
+                               rtol=1e-6)
+
+
+@pytest.mark.parametrize('length', [2205, 2206])
+def test_batch_matches_essentia(tmpdir, length):
+    pytest.importorskip('essentia')
+    fname = str(tmpdir.join('strokes.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(4, 1))
+    audio = stroke_cleaning.audio_sample(fname, onset_method='flux')
+    strokes = random_strokes(6, length)
+    table = features.FeatureExtractor(
+        sampling_rate=audio.sampling_rate).feature_table(strokes)
+    expected = [audio.extract_features_from_frame(istroke)
+                for istroke in strokes]
+    for icol, iname in enumerate(features.FEATURE_NAMES):
+        column = np.array([ifeatures[iname] for ifeatures in expected])
+        # relative to the column scale (some values are close to 0)
+        np.testing.assert_allclose(table[:, icol], column, rtol=1e-3,
+                                   atol=1e-4*np.abs(column).max(),
+                                   err_msg=iname)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import framing
+
+
+def expected_frames(audio, onsets, frame_sz):
+    return np.array([audio[ionset:ionset + frame_sz] for ionset in onsets])
+
+
+def test_regular_onsets_are_a_view():
+    audio = np.arange(100, dtype=np.float32)
+    frames = framing.stroke_frames(audio, [10, 30, 50, 70], 25)
+    np.testing.assert_array_equal(
+        frames, expected_frames(audio, [10, 30, 50, 70], 25))
+    assert np.shares_memory(frames, audio)
+    assert not frames.flags.writeable
+
+
+def test_irregular_onsets():
+    audio = np.arange(100, dtype=np.float32)
+    frames = framing.stroke_frames(audio, [3, 10, 42], 20)
+    np.testing.assert_array_equal(
+        frames, expected_frames(audio, [3, 10, 42], 20))
+    assert not frames.flags.writeable
+
+
+def test_last_stroke_drop_and_pad():
+    audio = np.arange(1, 101, dtype=np.float32)
+    onsets = [-5, 40, 70, 90, 100]
+    dropped = framing.stroke_frames(audio, onsets, 25)
+    np.testing.assert_array_equal(dropped,
+                                  expected_frames(audio, [40, 70], 25))
+    padded = framing.stroke_frames(audio, onsets, 25, last_stroke='pad')
+    assert padded.shape == (3, 25)
+    np.testing.assert_array_equal(padded[:2], dropped)
+    np.testing.assert_array_equal(padded[2, :10], audio[90:])
+    assert not padded[2, 10:].any()
+
+
+def test_no_complete_stroke():
+    frames = framing.stroke_frames(np.zeros(10, dtype=np.float64), [5], 20)
+    assert frames.shape == (0, 20)
+    assert frames.dtype == np.float64
+
+
+def test_unknown_last_stroke():
+    with pytest.raises(ValueError):
+        framing.stroke_frames(np.zeros(10), [0], 5, last_stroke='wrap')
@@ -0,0 +1,22 @@
+import numpy as np
+
+import onsets
+
+
+def test_suppress_close_onsets():
+    kept = onsets.suppress_close_onsets([0, 10, 50, 55, 120], 40)
+    assert list(kept) == [0, 50, 120]
+
+
+def test_suppress_close_onsets_zero_gap():
+    kept = onsets.suppress_close_onsets([0, 10, 10, 55], 0)
+    assert list(kept) == [0, 10, 10, 55]
+
+
+def test_detector_gap_rounded_to_zero():
+    audio = np.zeros(44100, dtype=np.float32)
+    audio[10000:10100] = 1
+    audio[30000:30100] = 1
+    detector = onsets.OnsetDetector(sampling_rate=44100)
+    found = detector.onsets(audio, min_gap=1e-6)
+    assert len(found) >= 2
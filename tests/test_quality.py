@@ -0,0 +1,35 @@
+import numpy as np
+
+import quality
+
+
+def strokes():
+    """quiet, loud, clipped, mostly silent and negative-only strokes."""
+    frames = np.full((5, 100), 0.3, dtype=np.float32)
+    frames[0] = 0.05
+    frames[2, :20] = 1.0
+    frames[3, 10:] = 0.
+    frames[4] = -0.5
+    return frames
+
+
+def test_default_is_the_peak_test():
+    mask, rejections = quality.QualityGate().evaluate(strokes())
+    np.testing.assert_array_equal(mask, [False, True, True, True, False])
+    assert rejections == {'min_peak': 2}
+
+
+def test_all_criteria():
+    gate = quality.QualityGate(min_peak=None, min_rms=0.2, max_clipping=0.1,
+                               max_silence=0.5, batch_size=2)
+    mask, rejections = gate.evaluate(strokes())
+    np.testing.assert_array_equal(mask, [False, True, False, False, True])
+    assert rejections == {'min_rms': 2, 'max_clipping': 1,
+                          'max_silence': 1}
+
+
+def test_empty_strokes():
+    gate = quality.QualityGate()
+    mask, rejections = gate.evaluate(np.empty((0, 100)))
+    assert len(mask) == 0
+    assert not gate.mask(np.empty((3, 0))).any()
@@ -0,0 +1,108 @@
+import threading
+import wave
+import numpy as np
+import pytest
+
+import recorder
+
+
+class FakeStream(object):
+    """Input stream producing an int16 ramp, read or through a callback."""
+
+    def __init__(self, frames_per_buffer, stream_callback=None, **kwargs):
+        self.chunk = frames_per_buffer
+        self.position = 0
+        self.active = True
+        self.thread = None
+        if stream_callback is not None:
+            self.thread = threading.Thread(target=self._run,
+                                           args=(stream_callback,))
+            self.thread.start()
+
+    def _next(self, nframes):
+        data = (np.arange(self.position, self.position + nframes) %
+                2**15).astype('<i2').tobytes()
+        self.position += nframes
+        return data
+
+    def _run(self, callback):
+        while self.active:
+            _, flag = callback(self._next(self.chunk), self.chunk, {},
+                               recorder.PA_INPUT_OVERFLOW)
+            if flag == recorder.PA_COMPLETE:
+                self.active = False
+
+    def read(self, nframes):
+        return self._next(nframes)
+
+    def is_active(self):
+        return self.active
+
+    def stop_stream(self):
+        self.active = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        pass
+
+
+class FakeAudioAPI(object):
+
+    def __init__(self):
+        self.terminated = False
+
+    def open(self, **kwargs):
+        return FakeStream(**kwargs)
+
+    def terminate(self):
+        self.terminated = True
+
+
+class NoDeviceAudioAPI(FakeAudioAPI):
+
+    def open(self, **kwargs):
+        raise OSError('Invalid sample rate')
+
+
+def test_ring_buffer_wraps():
+    ring = recorder.RingBuffer(8)
+    assert ring.write(b'abcdef')
+    assert ring.read() == b'abcdef'
+    assert ring.write(b'ghijk')
+    assert not ring.write(b'lmnop')
+    assert ring.overruns == 1
+    assert ring.read() == b'ghijk'
+
+
+@pytest.mark.parametrize('capture', ['blocking', 'callback'])
+def test_record_with_stub(tmpdir, capture):
+    savename = str(tmpdir.join('rec.wav'))
+    rec = recorder.AudioRecorder(max_length=0.5, chunk=1024,
+                                 capture=capture)
+    rec.start_record(countdown=0, savename=savename,
+                     audio_api=FakeAudioAPI())
+    wf = wave.open(savename, 'rb')
+    nframes = wf.getnframes()
+    data = np.frombuffer(wf.readframes(nframes), dtype='<i2')
+    wf.close()
+    assert nframes >= 0.5*44100 - 1024
+    np.testing.assert_array_equal(data, np.arange(nframes) % 2**15)
+    if capture == 'callback':
+        assert rec.capture_stats['overruns'] == 0
+        assert rec.capture_stats['input_overflows'] > 0
+
+
+@pytest.mark.parametrize('capture', ['blocking', 'callback'])
+def test_failing_open(tmpdir, capture):
+    savename = str(tmpdir.join('rec.wav'))
+    rec = recorder.AudioRecorder(max_length=0.5, capture=capture)
+    audio_api = NoDeviceAudioAPI()
+    nthreads = threading.active_count()
+    with pytest.raises(OSError):
+        rec.start_record(countdown=0, savename=savename,
+                         audio_api=audio_api,
+                         on_features=lambda result: None)
+    assert audio_api.terminated
+    # no writer or analysis thread left behind
+    assert threading.active_count() == nthreads
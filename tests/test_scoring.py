@@ -0,0 +1,26 @@
+import numpy as np
+
+import scoring
+
+
+class FakePlayerModel(object):
+
+    def predict(self, table, feature_names):
+        return np.array(['marina']*len(table))
+
+    def score_strokes(self, table, feature_names):
+        return np.tile([0.25, 0.75], (len(table), 1))
+
+
+def test_score_reports_player_prediction():
+    scorer = scoring.StrokeScorer(model=FakePlayerModel(),
+                                  latency_budget=5).start()
+    try:
+        stroke = np.sin(np.arange(4096)/10.).astype(np.float32)
+        result = scorer.score(stroke)
+    finally:
+        scorer.stop()
+    assert result['predicted_player'] == 'marina'
+    assert result['player_score'] == 0.75
+    assert 'label' not in result and 'score' not in result
+    assert len(result['features']) == len(result['feature_names'])
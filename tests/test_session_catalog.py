@@ -0,0 +1,59 @@
+import pytest
+
+import session_catalog
+
+CATALOG = '''player date path goodrange playtype
+marina 20150623 alto/marina_1.wav 95000-400000 halfbow
+jfraj 20150623 alto/jfraj_1.wav None None
+marina 20150624 alto/marina_2.wav 95000--400000 longbow
+'''
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('95000-400000', (95000, 400000)),
+    ('95000--400000', (95000, -400000)),
+    (' (10, 20) ', (10, 20)),
+    ([1, 2], (1, 2)),
+    (None, None),
+    ('None', None),
+    (float('nan'), None),
+])
+def test_parse_goodrange(value, expected):
+    assert session_catalog.parse_goodrange(value) == expected
+
+
+def test_parse_goodrange_error():
+    with pytest.raises(ValueError):
+        session_catalog.parse_goodrange('start-stop')
+
+
+@pytest.fixture
+def catalog(tmpdir):
+    fname = tmpdir.join('datainfo.csv')
+    fname.write(CATALOG)
+    return session_catalog.SessionCatalog(str(fname))
+
+
+def test_select(catalog):
+    assert len(catalog) == 3
+    marina = catalog.select(player='marina')
+    assert [isession['path'] for isession in marina] == [
+        'alto/marina_1.wav', 'alto/marina_2.wav']
+    assert marina[1]['goodrange'] == (95000, -400000)
+    assert catalog.select(player='marina', date='20150624') == marina[1:]
+    # path is not indexed, it is filtered
+    assert catalog.select(path='alto/jfraj_1.wav')[0]['playtype'] is None
+    assert catalog.select(player='nobody') == []
+    assert len(catalog.select()) == 3
+
+
+def test_append_and_reload(catalog):
+    catalog.append('alto/jfraj_2.wav', 'jfraj', '20150625', (1, 2),
+                   playtype='halfbow')
+    reloaded = session_catalog.SessionCatalog(catalog.fname)
+    assert reloaded.select(player='jfraj', date='20150625')[0][
+        'goodrange'] == (1, 2)
+    assert reloaded.group_by('player')['jfraj']['paths'] == [
+        'alto/jfraj_1.wav', 'alto/jfraj_2.wav']
+    with pytest.raises(ValueError):
+        catalog.append('a b.wav', 'jfraj', '20150625')
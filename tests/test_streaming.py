@@ -0,0 +1,116 @@
+import shutil
+import subprocess
+import time
+
+import numpy as np
+import pytest
+
+import benchmark
+import clipping
+import streaming
+import stroke_cleaning
+
+
+def batch_and_stream(fname, **kwargs):
+    """Return the feature tables of the batch and streaming paths."""
+    audio = stroke_cleaning.audio_sample(fname, **kwargs)
+    audio.set_fake_regular_offsets(0.5)
+    batch = audio.get_features()
+    stream = streaming.stream_features(fname, win_wd=0.5, block_size=5000,
+                                       **kwargs)
+    return batch, stream
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'clip_mode': 'envelope'}])
+def test_stream_matches_batch(tmpdir, kwargs):
+    fname = str(tmpdir.join('strokes.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(10, 2))
+    batch, stream = batch_and_stream(fname, **kwargs)
+    assert len(batch['feature_table']) > 0
+    assert np.array_equal(batch['onset_samples'], stream['onset_samples'])
+    assert np.allclose(batch['feature_table'], stream['feature_table'],
+                       rtol=1e-5)
+
+
+def test_stream_without_loud_sample(tmpdir):
+    # nothing is clipped, as clipping.clip_bounds
+    fname = str(tmpdir.join('quiet.wav'))
+    rng = np.random.RandomState(0)
+    audio = 0.04*np.sin(np.arange(6*44100)*0.05) + 0.001*rng.randn(6*44100)
+    benchmark.write_wav(fname, audio)
+    batch, stream = batch_and_stream(fname, quality={'min_peak': 0.01})
+    assert len(batch['feature_table']) > 0
+    assert np.array_equal(batch['onset_samples'], stream['onset_samples'])
+
+
+def test_edge_clipper_zero_buffer():
+    audio = np.zeros(300, dtype=np.float32)
+    audio[100:110] = 1
+    start, end = clipping.clip_bounds(audio, 0.05, 0)
+    clipper = streaming.EdgeClipper(beginning_buffer=0)
+    kept = np.concatenate([clipper.push(audio[istart:istart + 50])
+                           for istart in range(0, len(audio), 50)] +
+                          [clipper.flush()])
+    assert np.array_equal(kept, audio[start:end])
+
+
+def test_unsupported_stream_options(tmpdir):
+    fname = str(tmpdir.join('strokes.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(2, 1))
+    with pytest.raises(ValueError):
+        streaming.stream_features(fname, clip_mode='rms')
+    with pytest.raises(ValueError):
+        streaming.stream_features(fname, last_stroke='pad')
+
+
+def test_stream_rate_native(tmpdir):
+    fname = str(tmpdir.join('strokes48.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(2, 1, 48000),
+                        48000)
+    assert streaming.stream_rate(fname) == 48000
+    assert streaming.stream_rate(fname, 44100) == 44100
+    if shutil.which('ffmpeg') is None:
+        pytest.skip('ffmpeg is not installed')
+    flac = str(tmpdir.join('strokes48.flac'))
+    subprocess.check_call(['ffmpeg', '-v', 'error', '-i', fname, flac])
+    assert streaming.stream_rate(flac) == 48000
+
+
+def test_onset_framer_skip_keeps_positions():
+    block = np.zeros(2048, dtype=np.float32)
+    block[1100:1500] = 0.5
+    framer = streaming.OnsetFramer(300, 600, hop=512)
+    framer.push(np.zeros(1000, dtype=np.float32))
+    framer.skip(3000)
+    onsets, strokes = framer.push(block)
+    assert list(onsets) == [4000 + 1100]
+    assert strokes.shape == (1, 300)
+
+
+def test_stroke_analyzer_counts_dropped_samples():
+    analyzer = streaming.StrokeAnalyzer(max_buffers=1, stroke_length=0.01)
+    silence = np.zeros(1000, dtype='<i2').tobytes()
+    # the thread is not started: the second and third buffers are dropped
+    for _ in range(3):
+        analyzer.push(silence)
+    assert analyzer.dropped_buffers == 2
+    assert analyzer.dropped_samples == 2000
+    analyzer.start()
+    while not analyzer.buffers.empty():
+        time.sleep(0.01)
+    analyzer.push(silence)
+    analyzer.stop()
+    framer = analyzer.framer
+    assert framer.buffer_start + len(framer.buffer) == 4000
+
+
+def test_stroke_framer_skip_keeps_the_hop_grid():
+    framer = streaming.StrokeFramer(50, 40)
+    onsets, strokes = framer.push(np.zeros(150, dtype=np.float32))
+    assert list(onsets) == [0, 40, 80]
+    framer.skip(1000)
+    block = np.arange(200, dtype=np.float32)
+    onsets, strokes = framer.push(block)
+    assert list(onsets) == [1160, 1200, 1240, 1280]
+    assert strokes.shape == (4, 50)
+    np.testing.assert_array_equal(strokes[:, 0], onsets - 1150)
@@ -0,0 +1,55 @@
+import wave
+import numpy as np
+import pytest
+
+import benchmark
+import stroke_cleaning
+
+
+@pytest.fixture
+def strokes_wav(tmpdir):
+    fname = str(tmpdir.join('strokes.wav'))
+    benchmark.write_wav(fname, benchmark.synthetic_strokes(8, 1))
+    return fname
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_dtype_policy(strokes_wav, dtype):
+    audio = stroke_cleaning.audio_sample(strokes_wav, dtype=dtype,
+                                         onset_method='flux')
+    feature_dic = audio.get_features()
+    assert audio.audio.dtype == dtype
+    assert audio.strokes.dtype == dtype
+    assert feature_dic['feature_table'].dtype == dtype
+
+
+def test_float64_essentia_onsets(strokes_wav):
+    pytest.importorskip('essentia')
+    audio = stroke_cleaning.audio_sample(strokes_wav, dtype=np.float64,
+                                         onset_method='rate')
+    audio.isolate_strokes()
+    assert len(audio.strokes) > 0
+    feat_dic = audio.extract_features_from_frame(audio.strokes[0])
+    assert np.isfinite(feat_dic['centroid'])
+
+
+def test_good_onsets_separate_channels(tmpdir):
+    fname = str(tmpdir.join('stereo.wav'))
+    strokes = benchmark.synthetic_strokes(8, 1)
+    # strokes on the left channel only
+    stereo = np.zeros(2*len(strokes), dtype=strokes.dtype)
+    stereo[::2] = strokes
+    wf = wave.open(fname, 'wb')
+    wf.setnchannels(2)
+    wf.setsampwidth(2)
+    wf.setframerate(44100)
+    wf.writeframes((stereo*(2**15 - 1)).astype('<i2').tobytes())
+    wf.close()
+    audio = stroke_cleaning.audio_sample(fname, channels='separate',
+                                         onset_method='flux')
+    audio.isolate_strokes()
+    good_strokes = audio.good_strokes_mask()
+    good_onsets = audio.good_onsets_mask()
+    assert len(good_onsets) == len(good_strokes)//2
+    np.testing.assert_array_equal(
+        good_onsets, good_strokes[audio.stroke_channels == 0])
@@ -0,0 +1,219 @@
+"""Memory mapped reading of uncompressed PCM WAV files.
+
+The recorder writes 16-bit PCM WAV files; reading them back does not
+need a decoder: the data chunk is memory mapped and its samples are
+scaled to floats only when they are used (PCMAudio).  Other files
+(compressed m4a...) are decoded by essentia's AudioLoader and recordings
+are resampled only when another rate is asked for, see open_audio.
+"""
+from __future__ import division
+import os
+import struct
+import numpy as np
+
+# sample width (bytes) -> dtype and scaling of the PCM samples to floats
+PCM_DTYPES = {2: ('<i2', 2**15), 4: ('<i4', 2**31)}
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def pcm_info(fname):
+    """Return the layout of an uncompressed PCM WAV file, None otherwise.
+
+    The RIFF chunks are parsed up to the data chunk.  The returned dict
+    has channels, sampling_rate, sample_width (bytes), offset of the data
+    chunk and nframes.
+    """
+    with open(fname, 'rb') as wav:
+        header = wav.read(12)
+        if (len(header) < 12 or header[:4] != b'RIFF' or
+                header[8:12] != b'WAVE'):
+            return None
+        file_size = os.fstat(wav.fileno()).st_size
+        info = None
+        while True:
+            chunk = wav.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id = chunk[:4]
+            chunk_size = struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = wav.read(chunk_size)
+                if len(fmt) < 16:
+                    return None
+                (audio_format, channels, sampling_rate, _, _,
+                 bits) = struct.unpack('<HHIIHH', fmt[:16])
+                if audio_format == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # the format is the start of the sub-format guid
+                    audio_format = struct.unpack('<H', fmt[24:26])[0]
+                if (audio_format != WAVE_FORMAT_PCM or
+                        bits//8 not in PCM_DTYPES or bits % 8):
+                    return None
+                info = {'channels': channels,
+                        'sampling_rate': sampling_rate,
+                        'sample_width': bits//8}
+                wav.seek(chunk_size % 2, 1)
+            elif chunk_id == b'data':
+                if info is None:
+                    return None
+                info['offset'] = wav.tell()
+                # the size of an unfinished recording may be wrong
+                size = min(chunk_size, file_size - info['offset'])
+                info['nframes'] = size//(info['sample_width'] *
+                                         info['channels'])
+                return info
+            else:
+                # chunks are padded to an even size
+                wav.seek(chunk_size + chunk_size % 2, 1)
+
+
+class PCMAudio(object):
+    """Float view of memory mapped PCM samples.
+
+    Slicing (with a step of 1) returns another PCMAudio without reading
+    anything; the samples are scaled to floats (and the channels averaged,
+    as MonoLoader does, if mix is True) by np.asarray or to_array.
+
+    Attributes
+    ----------
+    data : (nframes, channels) memory mapped integer samples
+
+    scale : the float samples are data/scale
+
+    dtype : dtype of the float samples
+
+    mix : if True the samples are mono (nframes,), else (nframes,
+        channels)
+    """
+
+    def __init__(self, data, scale, dtype=np.float32, mix=True):
+        self.data = data
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+        self.mix = mix
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def ndim(self):
+        return 1 if self.mix else 2
+
+    @property
+    def shape(self):
+        return (len(self),) if self.mix else self.data.shape
+
+    @property
+    def channels(self):
+        return self.data.shape[1]
+
+    def mixed(self):
+        """Return the mono PCMAudio of the same samples."""
+        return PCMAudio(self.data, self.scale, self.dtype)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            return PCMAudio(self.data[key], self.scale, self.dtype, self.mix)
+        return self.to_array()[key]
+
+    def to_array(self, dtype=None):
+        """Return the scaled samples (of self.dtype by default)."""
+        if dtype is None:
+            dtype = self.dtype
+        if not self.mix:
+            samples = self.data
+        elif self.data.shape[1] == 1:
+            samples = self.data[:, 0]
+        else:
+            samples = self.data.mean(axis=1, dtype=dtype)
+        return np.multiply(samples, 1/self.scale, dtype=dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_array(dtype)
+
+
+def open_pcm(fname, info=None, dtype=np.float32, mix=True):
+    """Return the PCMAudio of a PCM WAV file (see pcm_info)."""
+    if info is None:
+        info = pcm_info(fname)
+    pcm_dtype, scale = PCM_DTYPES[info['sample_width']]
+    if info['nframes'] == 0:
+        data = np.zeros((0, info['channels']), dtype=pcm_dtype)
+    else:
+        data = np.memmap(fname, dtype=pcm_dtype, mode='r',
+                         offset=info['offset'],
+                         shape=(info['nframes'], info['channels']))
+    return PCMAudio(data, scale, dtype, mix)
+
+
+def decode(fname, dtype=np.float32):
+    """Return ((nframes, channels) samples, rate) decoded by essentia."""
+    from essentia.standard import AudioLoader
+    audio, rate, channels = AudioLoader(filename=fname)()[:3]
+    # AudioLoader always returns two channels (a mono file is duplicated)
+    return audio[:, :channels].astype(dtype, copy=False), int(rate)
+
+
+def resample(audio, rate, sampling_rate):
+    """Return the (nframes, channels) audio resampled to sampling_rate.
+
+    Each channel goes through essentia's Resample (as in MonoLoader).
+    """
+    from essentia.standard import Resample
+    resampler = Resample(inputSampleRate=rate, outputSampleRate=sampling_rate)
+    channels = [resampler(np.ascontiguousarray(audio[:, ichannel],
+                                               dtype=np.float32))
+                for ichannel in range(audio.shape[1])]
+    return np.column_stack(channels).astype(audio.dtype, copy=False)
+
+
+def mix_channels(audio):
+    """Return the mono signal of (nframes, channels) audio.
+
+    The channels of a PCMAudio are only averaged when it is read.
+    """
+    if isinstance(audio, PCMAudio):
+        return audio.mixed()
+    if audio.shape[1] == 1:
+        return audio[:, 0]
+    return audio.mean(axis=1, dtype=audio.dtype)
+
+
+def open_audio(fname, sampling_rate=None, dtype=np.float32, cache=None):
+    """Return ((nframes, channels) audio, rate) of an audio file.
+
+    PCM WAV files at their native rate (sampling_rate None) or at
+    sampling_rate are memory mapped (PCMAudio with mix False).  The other
+    files are decoded and resampled to sampling_rate if it differs from
+    their rate; with a cache (audio_cache.DecodedCache) this is done once
+    and the next calls memory map the stored result.
+    """
+    info = None
+    if fname.lower().endswith('.wav'):
+        info = pcm_info(fname)
+        if info is not None and sampling_rate in (None,
+                                                  info['sampling_rate']):
+            return (open_pcm(fname, info, dtype, mix=False),
+                    info['sampling_rate'])
+    if cache is not None:
+        cached = cache.get(fname, sampling_rate, dtype)
+        if cached is not None:
+            return cached
+    if info is not None:
+        audio = open_pcm(fname, info, dtype, mix=False).to_array()
+        rate = info['sampling_rate']
+    else:
+        audio, rate = decode(fname, dtype)
+    if sampling_rate is not None and rate != sampling_rate:
+        audio, rate = resample(audio, rate, sampling_rate), sampling_rate
+    if cache is not None:
+        return cache.put(fname, sampling_rate, audio, rate)
+    return audio, rate
+
+
+def load_audio(fname, sampling_rate=44100, dtype=np.float32, cache=None):
+    """Return the mono audio signal of a file at sampling_rate.
+
+    See open_audio, PCM WAV files at sampling_rate are memory mapped.
+    """
+    return mix_channels(open_audio(fname, sampling_rate, dtype, cache)[0])
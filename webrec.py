@@ -1,13 +1,25 @@
+import os
+import threading
+import numpy as np
 from flask import Flask
-from flask import render_template
+from flask import abort, jsonify, redirect, render_template, request, url_for
 from flask_wtf import Form
 from wtforms.fields import RadioField, StringField, SubmitField
 from wtforms.validators import Required
 
 import player_recording
+import corpus
+import jobs
+import scoring
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
+SAVE_DIR = '/Users/jean-francoisrajotte/projects/soundeval/test/'
+job_manager = jobs.JobManager()
+# player classifier (classification.IncrementalModel) used by /score
+PLAYER_MODEL = 'player_model.pkl'
+_scorer = None
+_scorer_lock = threading.Lock()
 
 
 class RecordInfoQuestionsForm(Form):
@@ -26,16 +38,91 @@ def index():
     return render_template('index.html')
 
 
+def recording_job(job, player_name, max_length):
+    """Record a player and evaluate the features of the recording."""
+    job.set_stage('waiting for the audio input')
+    with job_manager.recording_lock:
+        job.set_stage('recording', 0., duration=max_length)
+        basename = '{}_flasktest'.format(player_name)
+        audio_fname = player_recording.record_playing(countdown=1,
+                                                      max_length=max_length,
+                                                      wait4enter=False,
+                                                      basename=basename,
+                                                      save_dir=SAVE_DIR)
+    job.set_stage('evaluating features', 0.8)
+    feature_dic = corpus.get_file_features(audio_fname)
+    return {'audio_fname': audio_fname,
+            'feature_names': list(feature_dic['feature_names']),
+            'feature_table': feature_dic['feature_table'].tolist()}
+
+
 @app.route('/recording/')
 def record_player(player_name='noname', max_length=1):
-    basename = '{}_flasktest'.format(player_name)
-    audio_fname = player_recording.record_playing(countdown=1,
-                                                  max_length=max_length,
-                                                  wait4enter=False,
-                                                  basename=basename,
-                                                  save_dir='/Users/jean-francoisrajotte/projects/soundeval/test/')
-    #return 'finished recording and saved in {}'.format(fname)
-    return render_template('recording_result.html', audio_fname=audio_fname)
+    job = job_manager.submit('recording {}'.format(player_name),
+                             recording_job, player_name, max_length)
+    return redirect(url_for('job_page', job_id=job.job_id))
+
+
+def get_job_or_404(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@app.route('/jobs/<job_id>/')
+def job_page(job_id):
+    job = get_job_or_404(job_id)
+    return render_template('job_status.html', job=job,
+                           status=job.status())
+
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    return jsonify(get_job_or_404(job_id).status())
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = get_job_or_404(job_id)
+    if job.state != 'done':
+        return jsonify(job.status()), 202
+    result = job.status()
+    result['result'] = job.result
+    return jsonify(result)
+
+
+def get_scorer():
+    """Return the stroke scorer, started on first use and kept warm."""
+    global _scorer
+    with _scorer_lock:
+        if _scorer is None:
+            model_fname = None
+            if os.path.exists(PLAYER_MODEL):
+                model_fname = PLAYER_MODEL
+            _scorer = scoring.StrokeScorer(model_fname=model_fname).start()
+    return _scorer
+
+
+@app.route('/score', methods=['POST'])
+def score_stroke():
+    """Evaluate the stroke sent as raw little-endian float32 samples.
+
+    The answer has the stroke features, good (the quality gate) and, when
+    PLAYER_MODEL exists, predicted_player and player_score: the player
+    the stroke sounds like, not a quality score.
+    """
+    data = request.get_data()
+    if not data or len(data) % 4:
+        return jsonify({'error': 'expected raw float32 samples'}), 400
+    stroke = np.frombuffer(data, dtype='<f4')
+    try:
+        result = get_scorer().score(stroke)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    except scoring.ScoringTimeout as error:
+        return jsonify({'error': str(error)}), 503
+    return jsonify(result)
 
 
 @app.route('/record_info/', methods=['GET', 'POST'])
@@ -64,4 +151,4 @@ def name_page(name):
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)